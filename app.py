@@ -1,8 +1,8 @@
 import os
 import sys
 from flask import Flask, render_template, request, jsonify, send_file, redirect
-import paramiko
 import threading
+from utils.lazy import lazy_import
 from route.tek import tektronix_bp
 from route.fluke import fluke_bp
 from route.dianchifuzai import dianchifuzai_bp
@@ -11,8 +11,11 @@ from route.itech import itech_bp
 from route.vcardas import vcardas_bp
 from route.ethercat import ethercat_bp
 from route.relaycontrol import relaytronix_bp
-import pandas as pd
-from utils.testcase.testcase import *
+
+# heavy or optional dependencies, imported on first use
+paramiko = lazy_import('paramiko')
+pd = lazy_import('pandas')
+testcase = lazy_import('utils.testcase.testcase')
 
 # if getattr(sys, 'frozen', False):
 #     template_folder = os.path.join(sys._MEIPASS, 'templates')
@@ -366,8 +369,8 @@ def download_file():
 def run_csvload():
     try:
         filename = request.args.get('filename')
-        csvload(BASE_URL='http://127.0.0.1:8000',
-                csv_file=f"./uploads/{filename}")
+        testcase.csvload(BASE_URL='http://127.0.0.1:8000',
+                         csv_file=f"./uploads/{filename}")
         return jsonify({"message": "自动化测试用例运行完成"})
     except Exception as e:
         return jsonify({"error": str(e)})
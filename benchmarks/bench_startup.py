@@ -0,0 +1,97 @@
+"""
+    Cold-start benchmark of the web app import
+
+    Imports app.py in fresh interpreters with `python -X importtime`, reports
+    the wall time and the slowest modules, and checks that the heavy and
+    vendor libraries are not imported at startup (they are loaded through
+    utils.lazy on first use of their blueprint).
+
+    Usage:
+        python benchmarks/bench_startup.py
+        python benchmarks/bench_startup.py --repeat 10 --top 30 --max-ms 500
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# must not be imported by `import app`
+DEFERRED = ('numpy', 'pandas', 'pyvisa', 'paramiko', 'fabric', 'requests',
+            'pydasrmt', 'func_timeout')
+
+
+def import_times(module):
+    """Import a module in a new interpreter with -X importtime
+
+    Args:
+        module (str): module to import, e.g. 'app'
+
+    Returns:
+        tuple: (wall time s, list of (self us, cumulative us, name))
+
+    Raises:
+        RuntimeError: if the import fails
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           f'import {module}'],
+                          cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{proc.stderr[-2000:]}')
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative), name.rstrip()))
+    return wall, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1].strip())
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15,
+                        help='number of slowest modules to list')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the best cumulative import time of '
+                             'the module is above this')
+    args = parser.parse_args()
+
+    walls, totals = [], []
+    for _ in range(args.repeat):
+        wall, rows = import_times(args.module)
+        walls.append(wall)
+        totals.append(next(c for s, c, n in rows if n.strip() == args.module))
+
+    print(f'import {args.module}: best {min(totals) / 1e3:.1f} ms import, '
+          f'{min(walls) * 1e3:.1f} ms interpreter wall '
+          f'({args.repeat} runs, {len(rows)} modules)')
+
+    print(f'\n{"cumulative (ms)":>16} {"self (ms)":>10}  module')
+    slowest = sorted(rows, key=lambda row: -row[0])[:args.top]
+    for self_us, cumulative, name in slowest:
+        print(f'{cumulative / 1e3:>16.1f} {self_us / 1e3:>10.1f}  {name}')
+
+    loaded = sorted({n.strip().split('.')[0] for s, c, n in rows} &
+                    set(DEFERRED))
+    failed = False
+    if loaded:
+        print(f'\nFAIL: imported at startup: {", ".join(loaded)}')
+        failed = True
+    else:
+        print(f'\nok: none of {", ".join(DEFERRED)} imported at startup')
+    if args.max_ms is not None and min(totals) / 1e3 > args.max_ms:
+        print(f'FAIL: {min(totals) / 1e3:.1f} ms > {args.max_ms} ms')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+    Micro-benchmark of the SDS5034 waveform decode paths
+
+    Compares the original per-point python loop of SDS5034.read_wave_ch with
+    the vectorized decoder in utils.SiglentDevices.wavedecode on synthetic
+    WAV:DATA? blocks, and checks both produce the same volts.
+
+    Usage:
+        python benchmarks/bench_wave_decode.py
+        python benchmarks/bench_wave_decode.py --points 1e6 1e7 1e8 --legacy-max 1e7
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.SiglentDevices import wavedecode  # noqa: E402
+
+PREAMBLE = {
+    'code_per_div': 30.0,
+    'v_per_div': 0.5,
+    'v_offset': 0.1,
+    'comm_order': 'LSB',
+}
+
+
+def make_block(npts, nbits, seed=0):
+    """Build a raw WAV:DATA? response with random samples
+
+    Args:
+        npts (int): number of points
+        nbits (int): 8|10
+
+    Returns:
+        bytes: #9 header, data and trailing newlines
+    """
+    rng = np.random.default_rng(seed)
+    if nbits > 8:
+        codes = rng.integers(-2**(nbits - 1), 2**(nbits - 1), npts,
+                             dtype=np.int16)
+        data = (codes << (16 - nbits)).astype('<i2').tobytes()
+    else:
+        data = rng.integers(-128, 128, npts, dtype=np.int8).tobytes()
+    return b'#9' + f'{len(data):09d}'.encode() + data + b'\n\n'
+
+
+def decode_legacy(recv_rtn, nbits, preamble):
+    """Per-point decode as done by SDS5034.read_wave_ch before vectorizing"""
+    recv_all = list(recv_rtn[recv_rtn.find(b'#') + 11:-2])
+
+    if nbits > 8:
+        convert_data = []
+        for i in range(0, int(len(recv_all) / 2)):
+            data_16bit = recv_all[2 * i + 1] * 256 + recv_all[2 * i]
+            data = data_16bit >> (16 - nbits)
+            convert_data.append(data)
+    else:
+        convert_data = recv_all
+
+    volt_value = []
+    for data in convert_data:
+        if data > pow(2, nbits - 1) - 1:
+            data = data - pow(2, nbits)
+        volt_value.append(data)
+
+    volt_value = np.array(volt_value)
+    if nbits == 10:
+        volt_value = volt_value / 4
+
+    code = preamble['code_per_div']
+    vdiv = preamble['v_per_div']
+    offset = preamble['v_offset']
+    return volt_value / code * vdiv - offset
+
+
+def decode_vectorized(recv_rtn, nbits, preamble):
+    """Decode with utils.SiglentDevices.wavedecode"""
+    data = wavedecode.block_data(recv_rtn)
+    return wavedecode.decode_volts(data, nbits, preamble)
+
+
+def timeit(func, *args, repeat=3):
+    """Best wall time of repeat calls, and the last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1].strip())
+    parser.add_argument('--points', type=float, nargs='+',
+                        default=[1e6, 1e7, 1e8])
+    parser.add_argument('--bits', type=int, nargs='+', default=[8, 10])
+    parser.add_argument('--legacy-max', type=float, default=1e7,
+                        help='skip the python loop above this many points')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"bits":>4} {"points":>11} {"legacy (s)":>11} '
+          f'{"vector (s)":>11} {"speedup":>8}  match')
+    for nbits in args.bits:
+        for npts in (int(p) for p in args.points):
+            block = make_block(npts, nbits)
+            t_new, volts_new = timeit(decode_vectorized, block, nbits,
+                                      PREAMBLE, repeat=args.repeat)
+
+            if npts <= args.legacy_max:
+                t_old, volts_old = timeit(decode_legacy, block, nbits,
+                                          PREAMBLE, repeat=1)
+                match = np.allclose(volts_old, volts_new, rtol=1e-12,
+                                    atol=1e-12)
+                print(f'{nbits:>4} {npts:>11,} {t_old:>11.3f} '
+                      f'{t_new:>11.4f} {t_old / t_new:>7.0f}x  {match}')
+            else:
+                print(f'{nbits:>4} {npts:>11,} {"skipped":>11} '
+                      f'{t_new:>11.4f} {"-":>8}  -')
+            del block, volts_new
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,25 @@
 from flask import Blueprint, jsonify, request
-import pyvisa as visa
+from utils.visa_manager import visa_manager
+from utils.sessions import sessions
 
 dianchifuzai_bp = Blueprint('dianchifuzai', __name__)
 
 
+def device():
+    """Session of the instrument given by the visa query arg, default last
+    connected. Use as `with device() as instrument:`
+    """
+    return sessions.find('dianchifuzai', request.args.get('visa'))
+
+
 @dianchifuzai_bp.route('/connect', methods=['GET'])
 def dianchifuzai_connect():
-    global instrument
     try:
         visas = request.args.get('visa')
         if visas:
-            rm = visa.ResourceManager()
-            instrument = rm.open_resource(visas)
-            if instrument:
+            session = sessions.open('dianchifuzai', visas,
+                                    lambda: visa_manager.open(visas))
+            if session.device:
                 return jsonify(result='Connection Successful')
             else:
                 return jsonify(result='Connection Failed')
@@ -26,7 +33,8 @@ def dianchifuzai_connect():
 def dianchifuzai_on():
     try:
         command = 'INP 1'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -36,7 +44,8 @@ def dianchifuzai_on():
 def dianchifuzai_off():
     try:
         command = 'INP 0'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -46,7 +55,8 @@ def dianchifuzai_off():
 def dianchifuzai_changelocal():
     try:
         command = 'SYST:LOC'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -56,7 +66,8 @@ def dianchifuzai_changelocal():
 def dianchifuzai_changermt():
     try:
         command = 'SYST:RWL'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -67,8 +78,9 @@ def dianchifuzai_Screen():
     try:
         commandv = 'FETC:VOLT?'  #屏幕显示电压
         commanda = 'FETC:CURR?'  #屏幕显示电流
-        responsev = instrument.query(commandv).strip()
-        responsea = instrument.query(commanda).strip()
+        with device() as instrument:
+            responsev = instrument.query(commandv).strip()
+            responsea = instrument.query(commanda).strip()
         result = f"{responsev}V;{responsea}A"
         return jsonify(result=result)
     except Exception:
@@ -83,8 +95,9 @@ def dianchifuzai_setVoltage():
         # dianchifuzai_V = int(request.form['voltage'])
         commandv = 'FUNC VOLTage'  #屏幕显示电压
         commanda = f'VOLT {dianchifuzai_V}'  #屏幕显示电流
-        responsev = instrument.write(commandv)
-        responsea = instrument.write(commanda)
+        with device() as instrument:
+            responsev = instrument.write(commandv)
+            responsea = instrument.write(commanda)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -98,8 +111,9 @@ def dianchifuzai_setCurrent():
         # dianchifuzai_V = int(request.form['current'])
         commandvs = 'FUNC CURRent'
         commandas = f'CURR {dianchifuzai_V}'
-        responsev = instrument.write(commandvs)
-        responsea = instrument.write(commandas)
+        with device() as instrument:
+            responsev = instrument.write(commandvs)
+            responsea = instrument.write(commandas)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -113,8 +127,9 @@ def dianchifuzai_setResistance():
         # dianchifuzai_R = int(request.form['resistance'])
         commandvs = 'FUNC RESistance'
         commandas = f'RES {dianchifuzai_R}'
-        responsev = instrument.write(commandvs)
-        responsea = instrument.write(commandas)
+        with device() as instrument:
+            responsev = instrument.write(commandvs)
+            responsea = instrument.write(commandas)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
\ No newline at end of file
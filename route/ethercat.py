@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, jsonify, request
-from fabric import Connection
+from utils.lazy import lazy_import
+
+fabric = lazy_import('fabric')
 
 ethercat_bp = Blueprint('ethercat', __name__)
 
@@ -17,9 +19,10 @@ def ethercat_sent():
         result = ""
         if request.method == 'POST':
             try:
-                with Connection(host=host,
-                                user=username,
-                                connect_kwargs={'password': password}) as c:
+                connect_kwargs = {'password': password}
+                with fabric.Connection(host=host,
+                                       user=username,
+                                       connect_kwargs=connect_kwargs) as c:
                     result = c.run(command, hide=True).stdout
                     if match_line:
                         result = filter_result(result, match_line)
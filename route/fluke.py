@@ -1,23 +1,36 @@
-from flask import Blueprint, jsonify
-import pyvisa as visa
+from flask import Blueprint, jsonify, request
+import time
+from utils.sessions import sessions
+from utils.visa_manager import visa_manager
 
 fluke_bp = Blueprint('fluke', __name__)
 
 
+def fluke(visas):
+    """Pooled session of the meter, opened on first use
+
+    Use as `with fluke(visas) as instrument_fluke:` to hold the meter lock.
+    """
+    return sessions.open('fluke', visas,
+                         lambda: visa_manager.open(visas))
+
+
 @fluke_bp.route('/connect/<visas>', methods=['GET'])
 def fluke_connect(visas):
-    global instrument_fluke
     try:
-        rm = visa.ResourceManager()
-        instrument_fluke = rm.open_resource(visas)
-        if instrument_fluke:
+        session = fluke(visas)
+        if session.device:
             return jsonify(result='Connection Successful')
         else:
             return jsonify(result='Connection Failed')
     except Exception:
         return jsonify(result='Connection Failed')
-    finally:
-        instrument_fluke.close()
+
+
+@fluke_bp.route('/disconnect/<visas>', methods=['GET'])
+def fluke_disconnect(visas):
+    sessions.close('fluke', visas)
+    return jsonify(result='Disconnected')
 
 
 def getsignvalue(sigvalue):
@@ -31,15 +44,104 @@ def getsignvalue(sigvalue):
         return ValueError
 
 
+def split_reading(response):
+    """Split a reading like '+1.2345E+0 VDC' into value and unit
+
+    Returns:
+        tuple: (str value, str unit), unit is '' for format 1 readings
+    """
+    rs = response.strip().split(' ', 1)
+    return rs[0], rs[1].strip() if len(rs) > 1 else ''
+
+
 @fluke_bp.route('/query/<visas>', methods=['GET'])
 def fluke_query(visas):
     try:
-        rm = visa.ResourceManager()
-        instrument_fluke = rm.open_resource(visas)
-        command = 'MEAS?'
-        response = instrument_fluke.query(command)
-        rs = response.split(' ')
-        result = f'{getsignvalue(rs[0])} {rs[1]}'
+        with fluke(visas) as instrument_fluke:
+            command = 'MEAS?'
+            response = instrument_fluke.query(command)
+        value, unit = split_reading(response)
+        result = f'{getsignvalue(value)} {unit}'
+        return jsonify(result=result)
+    except Exception as e:
+        print(e)
+        return jsonify(result='Connection Failed')
+
+
+@fluke_bp.route('/poll/<visas>', methods=['GET'])
+def fluke_poll(visas):
+    """Value shown on the primary display, without waiting for a new trigger"""
+    try:
+        with fluke(visas) as instrument_fluke:
+            response = instrument_fluke.query('VAL1?')
+        value, unit = split_reading(response)
+        return jsonify(result=f'{getsignvalue(value)} {unit}')
+    except Exception as e:
+        print(e)
+        return jsonify(result='Connection Failed')
+
+
+# readings per second of the measurement rates
+RATES = {'S': 2.5, 'M': 20, 'F': 100}
+# MEAS1? queries per message, keeps each write far below the meter input buffer
+FETCH_CHUNK = 20
+
+
+@fluke_bp.route('/fetch/<visas>', methods=['GET'])
+def fluke_fetch(visas):
+    """Several readings in one HTTP call
+
+        The 8808A has no reading buffer, so MEAS1? queries are sent in
+        messages of FETCH_CHUNK and the meter answers each after its next
+        measurement, at the measurement rate (S 2.5/s, M 20/s, F 100/s).
+        n is capped so the meter lock is held no longer than the VISA
+        timeout, the previous rate is restored afterwards.
+
+    Query args:
+        n (int): number of readings, default 10, at most 1000
+        rate (str): optional measurement rate S|M|F
+    """
+    try:
+        n = min(max(request.args.get('n', 10, type=int), 1), 1000)
+        rate = (request.args.get('rate') or '').upper()
+        if rate and rate not in RATES:
+            return jsonify(result=f'Unknown rate {rate}')
+
+        with fluke(visas) as instrument_fluke:
+            previous = instrument_fluke.query('RATE?').strip().upper()[:1]
+            try:
+                if rate and rate != previous:
+                    instrument_fluke.write(f'RATE {rate}')
+                # 按速率限制读数个数, 不超过 VISA 超时 (未设置时按 10 s)
+                timeout = (instrument_fluke.timeout or 10000) / 1000
+                limit = max(int(RATES.get(rate or previous, RATES['S'])
+                                * timeout), 1)
+                capped = n > limit
+                n = min(n, limit)
+
+                t0 = time.monotonic()
+                readings = []
+                while len(readings) < n:
+                    count = min(FETCH_CHUNK, n - len(readings))
+                    instrument_fluke.write(';'.join(['MEAS1?'] * count))
+                    # answers come one per line, allow a meter that joins them
+                    chunk = []
+                    while len(chunk) < count:
+                        line = instrument_fluke.read()
+                        chunk += [r for r in line.strip().split(';') if r]
+                    readings += chunk[:count]
+                elapsed = time.monotonic() - t0
+            finally:
+                if rate and rate != previous and previous in RATES:
+                    instrument_fluke.write(f'RATE {previous}')
+
+        values = []
+        unit = ''
+        for reading in readings:
+            value, unit = split_reading(reading)
+            values.append(float(value))
+        result = {'values': values, 'unit': unit, 'elapsed': elapsed,
+                  'capped': capped}
         return jsonify(result=result)
     except Exception as e:
         print(e)
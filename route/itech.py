@@ -1,16 +1,23 @@
 from flask import Blueprint, jsonify, request
-import pyvisa as visa
+from utils.visa_manager import visa_manager
+from utils.sessions import sessions
 
 itech_bp = Blueprint('itech', __name__)
 
 
+def device():
+    """Session of the instrument given by the visa query arg, default last
+    connected. Use as `with device() as instrument:`
+    """
+    return sessions.find('itech', request.args.get('visa'))
+
+
 @itech_bp.route('/connect/<visas>', methods=['GET'])
 def itech_connect(visas):
-    global instrument
     try:
-        rm = visa.ResourceManager()
-        instrument = rm.open_resource(visas)
-        if instrument:
+        session = sessions.open('itech', visas,
+                                lambda: visa_manager.open(visas))
+        if session.device:
             return jsonify(result='Connection Successful')
         else:
             return jsonify(result='Connection Failed')
@@ -22,7 +29,8 @@ def itech_connect(visas):
 def itech_on():
     try:
         command = 'OUTPut on'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -32,7 +40,8 @@ def itech_on():
 def itech_off():
     try:
         command = 'OUTPut off'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception:
         return jsonify(result='Connection Failed')
@@ -44,7 +53,8 @@ def itech_setAV():
         Vn = int(request.form['voltage'])
         An = int(request.form['current'])
         command = f'APPLy {Vn},{An}'
-        response = instrument.write(command)
+        with device() as instrument:
+            response = instrument.write(command)
         return jsonify(result='Connection Successful')
     except Exception as e:
         print('1', e)
@@ -1,16 +1,36 @@
-from utils.SiglentDevices import SDS5034
-from flask import Blueprint, jsonify, request
+from utils.lazy import lazy_import
+from utils.sessions import sessions
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import json
+import threading
+
+# numpy, pandas and pyvisa are loaded with the first scope request
+SiglentDevices = lazy_import('utils.SiglentDevices')
+decimate = lazy_import('utils.SiglentDevices.decimate')
+acquisition = lazy_import('utils.SiglentDevices.acquisition')
 
 oscilloscope_bp = Blueprint('oscilloscope', __name__)
 
+# background pollers by scope address, shared by all stream viewers
+workers = {}
+workers_lock = threading.Lock()
+
+
+def scope():
+    """Session of the scope given by the ip query arg, default last connected
+
+    Use as `with scope() as handler:` to hold the scope lock.
+    """
+    return sessions.find('oscilloscope', request.args.get('ip'))
+
 
 # 示波器 routes
 @oscilloscope_bp.route('/connect/<ip>', methods=['GET'])
 def connect(ip):
-    global handler
     try:
-        handler = SDS5034(ip)
-        if handler:
+        session = sessions.open('oscilloscope', ip,
+                                lambda: SiglentDevices.SDS5034(ip))
+        if session.device:
             return jsonify(result='Connection Successful')
         else:
             return jsonify(result='Connection Failed')
@@ -21,20 +41,23 @@ def connect(ip):
 # API routes
 @oscilloscope_bp.route('/run', methods=['GET'])
 def api_run():
-    result = handler.run()
+    with scope() as handler:
+        result = handler.run()
     return jsonify(result=result)
 
 
 # API routes
 @oscilloscope_bp.route('/stop', methods=['GET'])
 def api_stop():
-    result = handler.stop()
+    with scope() as handler:
+        result = handler.stop()
     return jsonify(result=result)
 
 
 @oscilloscope_bp.route('/get_time_scale', methods=['GET'])
 def api_get_time_scale():
-    result = handler.get_time_scale()
+    with scope() as handler:
+        result = handler.get_time_scale()
     return jsonify(result=result)
 
 
@@ -43,7 +66,8 @@ def api_set_time_scale():
     data = request.json
     scale = float(data['scale'])
     # scale = float(request.form['scale'])
-    result = handler.set_time_scale(scale)
+    with scope() as handler:
+        result = handler.set_time_scale(scale)
     return jsonify(result=result)
 
 
@@ -53,9 +77,8 @@ is_running = False
 
 def your_while_loop_function(direction):
     # 调用 api_get_time_scale 函数并获取其返回值
-    response = api_get_time_scale()
-    data = response.get_json()  # 获取 JSON 数据
-    current_s = data['result']  # 获取具体的返回值
+    with scope() as handler:
+        current_s = handler.get_time_scale()
     print(current_s)
     mv = [
         0.00005, 0.00002, 0.00001, 0.0005, 0.0002, 0.0001, 0.005, 0.002, 0.001,
@@ -66,12 +89,14 @@ def your_while_loop_function(direction):
         if index > 0:
             current_ss = mv[index - 1]
             print(current_ss)
-            handler.set_time_scale(scale=current_ss)
+            with scope() as handler:
+                handler.set_time_scale(scale=current_ss)
     elif direction == 'right':
         if index < len(mv) - 1:
             current_ss = mv[index + 1]  # index = mv.index(current_s)
             print(current_ss)
-            handler.set_time_scale(scale=current_ss)
+            with scope() as handler:
+                handler.set_time_scale(scale=current_ss)
 
 
 @oscilloscope_bp.route('/leftmv')
@@ -100,7 +125,8 @@ def rightmv():
 @oscilloscope_bp.route('/get_ch_offset', methods=['GET'])
 def api_get_ch_offset():
     ch = request.args.get('ch')
-    result = handler.get_ch_offset(ch)
+    with scope() as handler:
+        result = handler.get_ch_offset(ch)
     return jsonify(result=result)
 
 
@@ -108,26 +134,143 @@ def api_get_ch_offset():
 def api_set_ch_offset():
     ch = int(request.form['ch'])
     offset = float(request.form['offset'])
-    result = handler.set_ch_offset(ch, offset)
+    with scope() as handler:
+        result = handler.set_ch_offset(ch, offset)
     return jsonify(result=result)
 
 
 @oscilloscope_bp.route('/get_measurement', methods=['GET'])
 def get_measurement():
     pos = request.args.get('pos')
-    temp_result = handler.get_measurement_item_value(pos)
+    with scope() as handler:
+        temp_result = handler.get_measurement_item_value(pos)
     # result = float(temp_result)
     result = format(float(temp_result), ".8f")
     print(result)
     return jsonify(result=result)
 
 
+@oscilloscope_bp.route('/get_measurements', methods=['GET'])
+def get_measurements():
+    """All configured measurement slots in one SCPI round trip
+
+    Query args:
+        pos (str): optional comma separated slot numbers, e.g. 1,2,5
+    """
+    pos = request.args.get('pos')
+    slots = [int(n) for n in pos.split(',') if n.strip()] if pos else None
+    with scope() as handler:
+        values = handler.get_measurement_values(slots)
+    result = {
+        n: {
+            'type': v['type'],
+            'value': None if v['value'] is None else format(v['value'], ".8f")
+        }
+        for n, v in values.items()
+    }
+    return jsonify(result=result)
+
+
+@oscilloscope_bp.route('/waveform', methods=['GET'])
+def get_waveform():
+    """Decimated trace of one channel for display
+
+    Query args:
+        ch (int): channel number
+        width (int): plot width in pixels, default 1000
+        t0, t1 (float): optional time window in seconds
+        method (str): minmax|lttb, default minmax
+    """
+    ch = int(request.args.get('ch', 1))
+    width = min(max(int(request.args.get('width', 1000)), 10), 4000)
+    t0 = request.args.get('t0', type=float)
+    t1 = request.args.get('t1', type=float)
+    method = request.args.get('method', 'minmax')
+    if method not in decimate.METHODS:
+        return jsonify(result=f'Bad method, should be one of {decimate.METHODS}'), 400
+
+    with scope() as handler:
+        df = handler.read_wave_ch(ch, save=False)
+    t, v = decimate.decimate(df.index.to_numpy(), df[f'C{ch}'].to_numpy(),
+                             width, method=method, t_start=t0, t_stop=t1)
+    result = {
+        'ch': ch,
+        'method': method,
+        'npts': len(df),
+        't': t.round(12).tolist(),
+        'v': v.round(5).tolist(),
+    }
+    return jsonify(result=result)
+
+
+def get_worker():
+    """Start the acquisition worker of the selected scope on first use
+
+        The worker polls under the session lock, so stream polls and requests
+        never interleave on the instrument.
+    """
+    session = scope()
+    with workers_lock:
+        worker = workers.get(session.address)
+        if worker is None or worker.scope is not session.device:
+            if worker is not None:
+                worker.stop()
+            worker = acquisition.AcquisitionWorker(session.device,
+                                                  lock=session)
+            worker.start()
+            workers[session.address] = worker
+    return worker
+
+
+@oscilloscope_bp.route('/stream', methods=['GET'])
+def stream():
+    """Server-Sent Events stream of measurement values and waveforms
+
+        All viewers share one poll loop. Query args change the shared poll
+        settings, see /stream/config.
+    """
+    acq = get_worker()
+    acq.configure(interval=request.args.get('interval', type=float),
+                  wave_ch=request.args.get('ch', type=int),
+                  width=request.args.get('width', type=int))
+
+    def events():
+        for frame in acq.frames():
+            if frame is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f'data: {json.dumps(frame)}\n\n'
+
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@oscilloscope_bp.route('/stream/config', methods=['POST'])
+def stream_config():
+    data = request.json
+    acq = get_worker()
+    acq.configure(interval=data.get('interval'),
+                  wave_ch=data.get('ch'),
+                  width=data.get('width'),
+                  method=data.get('method'))
+    result = {
+        'interval': acq.interval,
+        'ch': acq.wave_ch,
+        'width': acq.width,
+        'method': acq.method,
+        'readers': acq.readers,
+    }
+    return jsonify(result=result)
+
+
 @oscilloscope_bp.route('/setscreenshot', methods=['POST'])
 def set_screenshot():
     try:
         data = request.json
         phname = data['name']
-        result = handler.get_screenshot(na=phname)
+        with scope() as handler:
+            result = handler.get_screenshot(na=phname)
         return jsonify(result='sc')
     except Exception as e:
         pass
\ No newline at end of file
@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request
-import requests
+from utils.lazy import lazy_import
+
+requests = lazy_import('requests')
 
 relaytronix_bp = Blueprint('relay', __name__)
 
@@ -1,18 +1,33 @@
+import threading
+
 from flask import Blueprint, jsonify, request
-import pyvisa as visa
-from utils.signal_generator_devices import tektronix_func_gen as tfg
+from utils.lazy import lazy_import
+from utils.sessions import sessions
+
+tfg = lazy_import('utils.signal_generator_devices.tektronix_func_gen')
+pyvisa = lazy_import('pyvisa')
 
 tektronix_bp = Blueprint('tek', __name__)
 
 
+def funcgen(visas):
+    """Long lived FuncGen of an address, connected on first use
+
+    Model properties, limits and channels are set up once per connection,
+    later requests only cost their own SCPI writes. Use as
+    `with funcgen(visas) as instrument_tek:` to hold the instrument lock.
+    """
+    return sessions.open('tek', visas,
+                         lambda: tfg.FuncGen(visas, verbose=False))
+
+
 @tektronix_bp.route('/connect', methods=['GET'])
 def tek_connect():
     try:
         visas = request.args.get('visa')
         if visas:
-            rm = visa.ResourceManager()
-            instrument_tek = rm.open_resource(visas)
-            if instrument_tek:
+            session = funcgen(visas)
+            if session.device:
                 return jsonify(result='Connection Successful')
             else:
                 return jsonify(result='Connection Failed')
@@ -35,23 +50,110 @@ def tek_set_botepl():
         visas = data['visa']
         numeric_part = ''.join(filter(str.isdigit, pl))
         letter_part = ''.join(filter(str.isalpha, pl))
-        instrument_tek = tfg.FuncGen(visas)
-        if ch1_check and not ch2_check:
-            instrument_tek.ch1.set_frequency(float(numeric_part),
-                                             unit=str(letter_part))
-            instrument_tek.ch1.set_duty(bote)
-        elif ch2_check and not ch1_check:
-            instrument_tek.ch2.set_frequency(float(numeric_part),
-                                             unit=str(letter_part))
-            instrument_tek.ch2.set_duty(bote)
-        elif ch1_check and ch2_check:
-            instrument_tek.ch1.set_frequency(float(numeric_part),
-                                             unit=str(letter_part))
-            instrument_tek.ch1.set_duty(bote)
-            instrument_tek.ch2.set_frequency(float(numeric_part),
-                                             unit=str(letter_part))
-            instrument_tek.ch2.set_duty(bote)
-        instrument_tek.close()
-        return jsonify(result='Connection Successful')
+        session = funcgen(visas)
     except Exception as e:
         return jsonify(result='Connection Failed')
+    try:
+        with session as instrument_tek:
+            if ch1_check and not ch2_check:
+                instrument_tek.ch1.set_frequency(float(numeric_part),
+                                                 unit=str(letter_part))
+                instrument_tek.ch1.set_duty(bote)
+            elif ch2_check and not ch1_check:
+                instrument_tek.ch2.set_frequency(float(numeric_part),
+                                                 unit=str(letter_part))
+                instrument_tek.ch2.set_duty(bote)
+            elif ch1_check and ch2_check:
+                instrument_tek.ch1.set_frequency(float(numeric_part),
+                                                 unit=str(letter_part))
+                instrument_tek.ch1.set_duty(bote)
+                instrument_tek.ch2.set_frequency(float(numeric_part),
+                                                 unit=str(letter_part))
+                instrument_tek.ch2.set_duty(bote)
+        return jsonify(result='Connection Successful')
+    except (pyvisa.errors.VisaIOError, OSError) as e:
+        # drop a possibly dead connection, the next request reconnects
+        sessions.close('tek', visas)
+        return jsonify(result='Connection Failed')
+    except Exception as e:
+        # e.g. a value out of the instrument limits, the connection is fine
+        return jsonify(result='Connection Failed', error=str(e))
+
+
+# running sweeps by VISA address
+sweeps = {}
+sweeps_lock = threading.Lock()
+
+
+def stop_sweep(visas):
+    """Stop the sweep of an address and wait for its thread, also run when
+    the session of the address is closed
+
+    Returns:
+        Sweep|None: the stopped sweep
+    """
+    with sweeps_lock:
+        sweep = sweeps.pop(visas, None)
+    if sweep is not None:
+        sweep.stop()
+        sweep.join()
+    return sweep
+
+
+@tektronix_bp.route('/sweep', methods=['POST'])
+def tek_sweep():
+    """Start a frequency/duty sweep, replacing a running one
+
+    JSON body:
+        visa (str): VISA address
+        channel (int): 1 or 2, default 1
+        points (list): [[frequency Hz, duty % or null, dwell s], ...], or
+        range (dict): {start, stop, steps, duty, dwell, log} for sweep_range
+        repeat (int): passes, 0 until stopped, default 1
+    """
+    try:
+        data = request.json
+        visas = data['visa']
+        if 'points' in data:
+            points = [tuple(point) for point in data['points']]
+        else:
+            points = tfg.sweep_range(**data['range'])
+        session = funcgen(visas)
+    except Exception as e:
+        return jsonify(result='Invalid sweep', error=str(e))
+    # one sweep per address, stopped before its session is closed
+    session.close_hooks['sweep'] = lambda: stop_sweep(visas)
+    with sweeps_lock:
+        old = sweeps.pop(visas, None)
+        if old is not None:
+            old.stop()
+            old.join()
+        try:
+            sweep = session.device.sweep(points,
+                                         channel=int(data.get('channel', 1)),
+                                         repeat=int(data.get('repeat', 1)),
+                                         lock=session)
+        except Exception as e:
+            return jsonify(result='Invalid sweep', error=str(e))
+        sweeps[visas] = sweep
+    return jsonify(result=sweep.progress())
+
+
+@tektronix_bp.route('/sweep', methods=['GET'])
+def tek_sweep_progress():
+    with sweeps_lock:
+        sweep = sweeps.get(request.args.get('visa'))
+    if sweep is None:
+        return jsonify(result='No sweep')
+    return jsonify(result=sweep.progress())
+
+
+@tektronix_bp.route('/sweep/stop', methods=['GET', 'POST'])
+def tek_sweep_stop():
+    with sweeps_lock:
+        sweep = sweeps.get(request.args.get('visa'))
+    if sweep is None:
+        return jsonify(result='No sweep')
+    sweep.stop()
+    sweep.join()
+    return jsonify(result=sweep.progress())
@@ -1,17 +1,20 @@
-from flask import Blueprint, jsonify, request, send_file
-from utils.vcardas.sendandrecv import *
-import threading
-import subprocess
-from func_timeout import FunctionTimedOut
+from flask import (Blueprint, Response, jsonify, request,
+                   stream_with_context)
+import os
+from utils.lazy import lazy_import
+from utils.vcardas.canclient import can_client
+from utils.vcardas.scheduler import scheduler
 
-vcardas_bp = Blueprint('vcardas', __name__)
+# 接收缓存依赖 numpy, 首次收帧时才导入
+canbuffer = lazy_import('utils.vcardas.canbuffer')
+canmatch = lazy_import('utils.vcardas.canmatch')
+canlog = lazy_import('utils.vcardas.canlog')
 
-is_looping = False
+vcardas_bp = Blueprint('vcardas', __name__)
 
 
 @vcardas_bp.route('/sent', methods=['POST'])
 def vcardas_sent():
-    global is_looping
     try:
         data = request.json
         channel = int(data['channel'])
@@ -25,69 +28,59 @@ def vcardas_sent():
         b6 = data['bit6']
         b7 = data['bit7']
         is_looping = data['isLoop']
-        cmd = CmdGeneratorCan()
-        cmd.initSocket('127.0.0.1', 6667, 6666)
-        cmd.setChannelNode(channel, 1)
-        cmd.setParamCan(500, 0, 1, 1)
+        payload = bytes(
+            [int(b, 16) for b in (b0, b1, b2, b3, b4, b5, b6, b7)])
+        # 复用该通道的连接, 参数不变时不再下发
+        session = can_client(channel)
+        with session as client:
+            client.configure()
 
         if not is_looping:
             try:
-                cmd.sendCan(
-                    CanCmd.EFrameStatus.Can,
-                    bytes([
-                        int(b0, 16),
-                        int(b1, 16),
-                        int(b2, 16),
-                        int(b3, 16),
-                        int(b4, 16),
-                        int(b5, 16),
-                        int(b6, 16),
-                        int(b7, 16)
-                    ]), int(id, 16))
+                with session as client:
+                    client.send(int(id, 16), payload)
             except Exception as e:
                 print("Error sending CAN message:", e)
             return jsonify(result='send Successful')
         else:
-            try:
-                # is_looping = True
-                def send_message():
-                    if is_looping:
-                        cmd.sendCan(
-                            CanCmd.EFrameStatus.Can,
-                            bytes([
-                                int(b0, 16),
-                                int(b1, 16),
-                                int(b2, 16),
-                                int(b3, 16),
-                                int(b4, 16),
-                                int(b5, 16),
-                                int(b6, 16),
-                                int(b7, 16)
-                            ]), int(id, 16))
-                        # 继续下一次循环
-                        if is_looping:
-                            threading.Timer(0, send_message).start(
-                            )  # 使用 threading.Timer 来模拟异步操作
-
-                # 启动第一次循环
-                send_message()
-            except Exception as e:
-                print("Error sending CAN message:", e)
-            return jsonify(result='Loop Started')
+            # 周期发送, period_ms 默认 100 ms, 每个循环有自己的 handle
+            period = float(data.get('period_ms', 100)) / 1000
+            jitter = data.get('jitter_ms')
+
+            def send(can_id, frame):
+                with session as client:
+                    client.send(can_id, frame)
+
+            handle = scheduler.start_job(
+                send, int(id, 16), payload, period,
+                jitter=None if jitter is None else float(jitter) / 1000)
+            return jsonify(result='Loop Started', handle=handle)
     except Exception as e:
         return jsonify(result='send Failed')
 
 
 @vcardas_bp.route('/stop_loop', methods=['POST'])
 def vcardas_stop_loop():
-    global is_looping
-    is_looping = False
-    return jsonify(result='Loop Stopped')
+    """Stop the loop given by handle in the JSON body, or all loops"""
+    data = request.get_json(silent=True) or {}
+    handle = data.get('handle')
+    if handle is None:
+        stats = scheduler.stop_all()
+    else:
+        stats = scheduler.stop_job(int(handle))
+        if stats is None:
+            return jsonify(result='No such loop')
+    return jsonify(result='Loop Stopped', stats=stats)
+
+
+@vcardas_bp.route('/loops', methods=['GET'])
+def vcardas_loops():
+    """Running loops with their timing statistics"""
+    return jsonify(result=scheduler.jobs())
 
 
 @vcardas_bp.route('/recv', methods=['POST'])
 def vcardas_recv():
-    global is_looping
     data = request.json
     channel = int(data['channel'])
     id = data['can_id']
@@ -99,24 +92,132 @@ def vcardas_recv():
     b5 = data['bit5']
     b6 = data['bit6']
     b7 = data['bit7']
-    is_looping = data['isLoop']
-    cmd = CmdGeneratorCan()
-    cmd.initSocket('127.0.0.1', 6667, 6666)
-    cmd.setChannelNode(channel, 1)
-    cmd.enableFlowCan(True)
-    cmd.setParamCan(500, 0, 1, 1)
-    received_message = None
+    # 非 0 字节须全部相等 (可选 mask 按位比较), 全 0 匹配该 ID 的任意帧
+    # 只匹配调用之后收到的帧, 直到 timeout; max_age 秒可选地包含之前缓存的帧
     try:
-        while received_message is None:
-            received_message = cmd.receiveCanMessage(canID=int(id, 16))
-        hex_list = [hex(byte) for byte in received_message.Header.Data]
-        if b0 == b1 == b2 == b3 == b4 == b5 == b6 == b7 == '0':
-            return jsonify(result=hex_list)
-        else:
-            for i in range(8):
-                # print(f'0x{f"b{i}"}', hex_list[i])
-                if hex_list[i] == f'0x{eval(f"b{i}")}':
-                    return jsonify(result=hex_list)
-        return jsonify(result=["没有匹配消息"])
-    except func_timeout.FunctionTimedOut as e:
+        expectation = canmatch.Expectation(
+            int(id, 16), [b0, b1, b2, b3, b4, b5, b6, b7], data.get('mask'))
+    except ValueError as e:
+        return jsonify(result=[str(e)])
+    match = canmatch.wait_for(canbuffer.receiver(channel).buffer,
+                              [expectation],
+                              timeout=float(data.get('timeout', 5)),
+                              max_age=float(data.get('max_age', 0)))
+    found = match['matches'][0]
+    if found['matched']:
+        hex_list = [hex(byte) for byte in found['frame']['data']]
+        return jsonify(result=hex_list, latency_ms=found['latency_ms'])
+    if found['seen'] == 0:
         return jsonify(result=["总线无消息"])
+    return jsonify(result=["没有匹配消息"])
+
+
+@vcardas_bp.route('/expect', methods=['POST'])
+def vcardas_expect():
+    """Wait for frames matching several expectations
+
+        JSON body: channel, expect (list of {can_id, data, mask, ranges,
+        min_dlc}, see utils.vcardas.canmatch), timeout (s, default 5),
+        all (default true, else the first match ends the wait), max_age (s
+        of already buffered frames to include, default 0)
+    """
+    data = request.json
+    try:
+        expectations = [canmatch.Expectation.from_dict(spec)
+                        for spec in data['expect']]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(result='Invalid expectation', error=str(e)), 400
+    match = canmatch.wait_for(canbuffer.receiver(int(data['channel'])).buffer,
+                              expectations,
+                              timeout=float(data.get('timeout', 5)),
+                              match_all=bool(data.get('all', True)),
+                              max_age=float(data.get('max_age', 0)))
+    return jsonify(result=match)
+
+
+@vcardas_bp.route('/latest', methods=['GET'])
+def vcardas_latest():
+    """Latest buffered frame of every ID on ?channel="""
+    channel = int(request.args.get('channel', 1))
+    buffer = canbuffer.receiver(channel).buffer
+    frames = {}
+    for can_id in buffer.ids():
+        seq, frame = buffer.latest(can_id)
+        if frame is not None:
+            frames[hex(can_id)] = canbuffer.frame_dict(frame)
+    return jsonify(result=frames)
+
+
+@vcardas_bp.route('/log/start', methods=['POST'])
+def vcardas_log_start():
+    """Start logging a channel to binary files
+
+        Logs from the running receiver of the channel, a bitrate differing
+        from it is refused instead of reconfiguring the bus.
+
+        JSON body: channel, bitrate (kbit/s, optional), max_mb (size of one
+        file, default 64), directory (optional sub directory of
+        captures/can)
+    """
+    data = request.json
+    channel = int(data['channel'])
+    bitrate = data.get('bitrate')
+    try:
+        directory = canlog.in_root(data.get('directory') or '.')
+        session = canbuffer.receiver_session(
+            channel, None if bitrate is None else int(bitrate))
+    except ValueError as e:
+        return jsonify(result='Log Failed', error=str(e)), 400
+    with canlog.loggers_lock:
+        logger = canlog.loggers.get(channel)
+        if logger is not None and logger.is_alive():
+            return jsonify(result='Already logging', status=logger.status())
+        logger = canlog.CanLogger(
+            session.device, directory=directory,
+            max_bytes=int(float(data.get('max_mb', 64)) * (1 << 20)),
+            session=session)
+        canlog.loggers[channel] = logger.start()
+    return jsonify(result='Log Started', status=logger.status())
+
+
+@vcardas_bp.route('/log/stop', methods=['POST'])
+def vcardas_log_stop():
+    """Stop the logger of channel in the JSON body, or all loggers"""
+    data = request.get_json(silent=True) or {}
+    with canlog.loggers_lock:
+        if data.get('channel') is None:
+            stopped = list(canlog.loggers.values())
+            canlog.loggers.clear()
+        else:
+            logger = canlog.loggers.pop(int(data['channel']), None)
+            if logger is None:
+                return jsonify(result='No such log')
+            stopped = [logger]
+    return jsonify(result='Log Stopped',
+                   status=[logger.stop() for logger in stopped])
+
+
+@vcardas_bp.route('/log/status', methods=['GET'])
+def vcardas_log_status():
+    """Files, frames written and dropped of every logger"""
+    with canlog.loggers_lock:
+        loggers = list(canlog.loggers.values())
+    return jsonify(result=[logger.status() for logger in loggers])
+
+
+@vcardas_bp.route('/log/asc', methods=['GET'])
+def vcardas_log_asc():
+    """Stream a log file below captures/can given by ?file= (path from
+    /log/status) as ASC
+    """
+    try:
+        path = canlog.in_root(request.args['file'])
+        if not path.endswith('.canlog') or not os.path.isfile(path):
+            raise ValueError(f'{path} is not a log file')
+        canlog.read_header(path)
+    except ValueError:
+        return jsonify(result='No such log'), 404
+    name = os.path.splitext(os.path.basename(path))[0] + '.asc'
+    return Response(
+        stream_with_context(canlog.asc_blocks(path)), mimetype='text/plain',
+        headers={'Content-Disposition': f'attachment; filename={name}'})
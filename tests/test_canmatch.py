@@ -0,0 +1,140 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from utils.vcardas.canbuffer import FRAME_DTYPE, CanRingBuffer
+from utils.vcardas.canmatch import Expectation, to_bytes, wait_for
+
+
+def frames(*rows):
+    """FRAME_DTYPE array from (can_id, data) rows"""
+    out = np.zeros(len(rows), dtype=FRAME_DTYPE)
+    for record, (can_id, data) in zip(out, rows):
+        record['id'] = can_id
+        record['dlc'] = len(data)
+        record['data'][:len(data)] = list(data)
+    return out
+
+
+def test_to_bytes():
+    assert to_bytes('01 ff').tolist() == [1, 0xFF, 0, 0, 0, 0, 0, 0]
+    assert to_bytes('01ff').tolist() == [1, 0xFF, 0, 0, 0, 0, 0, 0]
+    assert to_bytes([1, '10']).tolist() == [1, 0x10, 0, 0, 0, 0, 0, 0]
+    with pytest.raises(ValueError):
+        to_bytes([0] * 9)
+    with pytest.raises(ValueError):
+        to_bytes([256])
+
+
+def test_default_mask_compares_non_zero_bytes():
+    f = frames((0x200, b'\x01\x02\x03'), (0x200, b'\x01\x05\x03'),
+               (0x201, b'\x01\x02\x03'))
+    assert Expectation(0x200, [1, 0, 3]).match(f).tolist() == \
+        [True, True, False]
+    # all zero matches any frame of the ID
+    assert Expectation(0x200).match(f).tolist() == [True, True, False]
+
+
+def test_bit_mask():
+    f = frames((0x10, b'\x1f'), (0x10, b'\x2f'), (0x10, b'\x10'))
+    # low nibble must be 0xf, high nibble ignored
+    e = Expectation(0x10, [0x0F], mask=[0x0F])
+    assert e.match(f).tolist() == [True, True, False]
+    # explicit mask also checks a zero byte
+    e = Expectation(0x10, [0x10, 0], mask='ff ff')
+    assert e.match(frames((0x10, b'\x10\x00'),
+                          (0x10, b'\x10\x01'))).tolist() == [True, False]
+
+
+def test_ranges_and_min_dlc():
+    f = frames((0x30, b'\x00\x00\x10'), (0x30, b'\x00\x00\x21'),
+               (0x30, b'\x00\x00\x20\x00'), (0x30, b'\x00'))
+    e = Expectation(0x30, ranges={'2': (0x10, 0x20)})
+    assert e.match(f).tolist() == [True, False, True, False]
+    e = Expectation(0x30, ranges={2: (0x10, 0x20)}, min_dlc=4)
+    assert e.match(f).tolist() == [False, False, True, False]
+    with pytest.raises(ValueError):
+        Expectation(0x30, ranges={8: (0, 1)})
+
+
+def test_from_dict():
+    e = Expectation.from_dict({'can_id': '7ff', 'data': '01', 'mask': '0f',
+                               'ranges': {'1': [2, 3]}, 'min_dlc': 2})
+    assert e.can_id == 0x7FF
+    assert e.describe()['mask'] == '0f 00 00 00 00 00 00 00'
+    assert e.ranges == {1: (2, 3)}
+
+
+def test_ring_buffer_wrap_around():
+    buffer = CanRingBuffer(capacity=4)
+    for i in range(10):
+        buffer.append(0x100 + i % 2, bytes([i]))
+    assert buffer.seq == 10
+    last, f = buffer.since(0)
+    assert last == 10
+    assert f['data'][:, 0].tolist() == [6, 7, 8, 9]
+    assert buffer.since(8)[1]['data'][:, 0].tolist() == [8, 9]
+    assert buffer.since(10)[1].size == 0
+    assert buffer.since(0, can_ids=[0x101])[1]['data'][:, 0].tolist() == \
+        [7, 9]
+    # overwritten frames are gone, the index points at the newest
+    assert buffer._get(6) is None
+    seq, record = buffer.latest(0x100)
+    assert seq == 9 and record['data'][0] == 8
+    assert buffer.latest(0x555) == (0, None)
+
+
+def test_buffer_wait_on_several_ids():
+    buffer = CanRingBuffer(capacity=16)
+    buffer.append(0x1, b'\x00')
+    threading.Timer(0.05, buffer.append, (0x3, b'\x03')).start()
+    seq, record = buffer.wait([0x2, 0x3], timeout=2)
+    assert seq == 2 and record['id'] == 0x3
+    assert buffer.wait(0x2, timeout=0.05) == (2, None)
+
+
+def test_wait_for_timeout():
+    buffer = CanRingBuffer(capacity=16)
+    buffer.append(0x200, b'\x01')
+    t0 = time.monotonic()
+    result = wait_for(buffer, [Expectation(0x200, [1])], timeout=0.1)
+    assert 0.1 <= time.monotonic() - t0 < 1
+    # the frame was buffered before the call and max_age is 0
+    assert not result['ok']
+    assert result['matches'][0]['seen'] == 0
+    result = wait_for(buffer, [Expectation(0x200, [1])], timeout=0,
+                      max_age=10)
+    assert result['ok'] and result['matches'][0]['seq'] == 1
+    assert result['matches'][0]['latency_ms'] <= 0
+
+
+def test_wait_for_several_ids():
+    buffer = CanRingBuffer(capacity=64)
+
+    def feed():
+        for i in range(20):
+            buffer.append(0x500, bytes([i]))
+        time.sleep(0.05)
+        buffer.append(0x501, b'\xaa')
+
+    expectations = [Expectation(0x500, [5]), Expectation(0x501, 'aa')]
+    threading.Timer(0.05, feed).start()
+    result = wait_for(buffer, expectations, timeout=2)
+    assert result['ok']
+    first, second = result['matches']
+    assert first['seq'] == 6 and first['frame']['data'] == [5]
+    assert first['seen'] >= 6
+    assert second['seq'] == 21
+    assert 0 < first['latency_ms'] < second['latency_ms']
+
+
+def test_wait_for_first_match():
+    buffer = CanRingBuffer(capacity=64)
+    threading.Timer(0.05, buffer.append, (0x601, b'\x01')).start()
+    result = wait_for(buffer, [Expectation(0x600), Expectation(0x601)],
+                      timeout=2, match_all=False)
+    assert result['ok']
+    assert [m['matched'] for m in result['matches']] == [False, True]
+    assert result['elapsed_ms'] < 1000
@@ -8,10 +8,14 @@
 """
 
 from . import SiglentBase
+from . import measure
+from . import wavedecode
+from .wavestore import WaveStore
 import numpy as np
 import pandas as pd
 # import matplotlib.pyplot as plt
-import struct, math
+import struct, math, time
+from concurrent.futures import ThreadPoolExecutor
 
 
 class SDS5034(SiglentBase):
@@ -20,8 +24,12 @@ class SDS5034(SiglentBase):
         Attributes:
 
             HORI_NUM (int): Number of horizontal divisions
+            meas_slots (dict): measurement slot number to SCPI item, as set by set_measurement_item
+            MEAS_TYPES (dict): measurement item names, display name to SCPI item
             preambles (dict): preamble values, saved when measured
+            last_capture_id (str): id of the most recent capture saved to store
             sds (pyvisa resource): allows write/read/query to the device
+            store (WaveStore): binary capture store, raw codes plus preambles
             TDIV_ENUM (list): time division values from table 2 of https://siglentna.com/wp-content/uploads/dlm_uploads/2022/07/SDS_ProgrammingGuide_EN11C-2.pdf (page 559)
             waveforms (pd.DataFrame): waveform data in volts (includes all channels)
     """
@@ -75,11 +83,84 @@ class SDS5034(SiglentBase):
         1000,
     )
 
-    def __init__(self, hostname='169.254.239.195'):
+    # advanced measurement types, display name -> SCPI item, see
+    # set_measurement_item and measure.ITEMS
+
+    MEAS_TYPES = {
+        '峰峰值': 'PKPK',
+        '最大值': 'MAX',
+        '最小值': 'MIN',
+        '幅值': 'AMPL',
+        '顶端值': 'TOP',
+        '低端值': 'BASE',
+        'L@T': 'LEVELX',
+        '周期平局值': 'CMEAN',
+        '平均值': 'MEAN',
+        '标准差': 'STDEV',
+        '周期标准差': 'VSTD',
+        '均方根': 'RMS',
+        '周期均方根': 'CRMS',
+        '中位数': 'MEDIAN',
+        '周期中位数': 'CMEDIAN',
+        '下降过激': 'OVSN',
+        '下降前激': 'FPRE',
+        '上升过激': 'OVSP',
+        '上升前激': 'RPRE',
+        '周期': 'PER',
+        '频率': 'FREQ',
+        '最大值时间': 'TMAX',
+        '最小值时间': 'TMIN',
+        '正脉宽': 'PWID',
+        '负脉宽': 'NWID',
+        '正占空比': 'DUTY',
+        '负占空比': 'NDUTY',
+        '正脉冲串宽度': 'WID',
+        '负脉冲串宽度': 'NBWID',
+        '延时': 'DELAY',
+        'T@M': 'TIMEL',
+        '上升时间': 'RISE',
+        '下降时间': 'FALL',
+        '10-90%上升时间': 'RISE10T90',
+        '90-10%下降时间': 'FALL90T10',
+        '相邻周期抖动': 'CCJ',
+        '直流正面积': 'PAREA',
+        '直流负面积': 'NAREA',
+        '直流有效面积': 'AREA',
+        '直流绝对面积': 'ABSAREA',
+        '周期数': 'CYCLES',
+        '上升沿个数': 'REDGES',
+        '下降沿个数': 'FEDGES',
+        '边沿总数': 'EDGES',
+        '正脉冲数': 'PPULSES',
+        '负脉冲数': 'NPULSES',
+        '相位': 'PHA',
+        '时滞': 'SKEW',
+        'FRFR': 'FRR',
+        'FRFF': 'FRF',
+        'FFFR': 'FFR',
+        'FFFF': 'FFF',
+        'FRLR': 'LRR',
+        'FRLF': 'LRF',
+        'FFLR': 'LFR',
+        'FFLF': 'LFF',
+        '交流正面积': 'PACArea',
+        '交流负面积': 'NACArea',
+        '交流有效面积': 'ACArea',
+        '交流绝对面积': 'ABSACArea',
+        '上升沿斜率': 'PSLOPE',
+        '下降沿斜率': 'NSLOPE',
+        'TSU@R': 'TSR',
+        'TSU@F': 'TSF',
+        'TH@R': 'THR',
+        'TH@F': 'THF'
+    }
+
+    def __init__(self, hostname='169.254.239.195', store_root='captures'):
         """ Init.
 
         Args:
             hostname (str): ip address or DNC lookup of device
+            store_root (str): directory of the binary capture store
         """
 
         # setup
@@ -91,24 +172,73 @@ class SDS5034(SiglentBase):
         # set data storage
         self.preambles = {}
         self.waveforms = pd.DataFrame()
+        self.store = WaveStore(store_root)
+        self.last_capture_id = None
+
+        # advanced measurement slots set by set_measurement_item, {n: item}
+        self.meas_slots = {}
+
+        # settings cache, keyed by (name, channel, ...). Channel is None for
+        # settings that apply to the whole scope
+        self._cache = {}
+
+    # settings cache
+    def _cached(self, name, getter, ch=None, *params):
+        """Return a cached setting, querying it with getter on a miss
+
+        Args:
+            name (str): setting name
+            getter (callable): called without arguments to query the setting
+            ch (int|None): channel the setting belongs to, None if global
+            params: transfer settings the value depends on, part of the key
+        """
+        key = (name, ch) + params
+        if key not in self._cache:
+            self._cache[key] = getter()
+        return self._cache[key]
+
+    def invalidate(self, ch=None):
+        """Drop cached settings so they are queried again on next use.
+
+            Called by the set functions and by run/stop. Call it directly
+            after changing settings on the front panel.
+
+        Args:
+            ch (int|None): channel whose settings changed. If None, drop all
+        """
+        if ch is None:
+            self._cache.clear()
+        else:
+            for key in [k for k in self._cache if k[1] == int(ch)]:
+                del self._cache[key]
+
+    def _set_run_cache(self, run):
+        """Invalidate the settings cache on a run/stop transition"""
+        if self._cache.get(('run_state', None)) is not run:
+            self.invalidate()
+        self._cache[('run_state', None)] = run
 
     # simple basic commands
     def default(self):
         """Resets the oscilloscope to the default configuration, equivalent to the Default button on the front panel.
         """
         self.write('*RST')
+        self.invalidate()
 
     def reboot(self):
         """Restart the scope."""
         self.write('SYSTem:REBoot')
+        self.invalidate()
 
     def run(self):
         """Start taking data, equivalent to pressing the Run button on the front panel."""
         self.write('ACQuire:STATE RUN')
+        self._set_run_cache(True)
 
     def stop(self):
         """Stop taking data, equivalent to pressing the Stop button on the front panel."""
         self.write('ACQuire:STATE STOP')
+        self._set_run_cache(False)
 
     # simple queries
     """
@@ -437,6 +567,7 @@ class SDS5034(SiglentBase):
         state = self.get_run_state()
         self.run()
         self.write(f'ACQuire:RESolution {bits}B')
+        self.invalidate()
         if not state:
             self.stop()
 
@@ -452,6 +583,7 @@ class SDS5034(SiglentBase):
         assert mode in ('DC', 'AC',
                         'GND'), 'mode must be one of DC, AC, or GND'
         self.write(f'CHANnel{int(ch)}:COUPling {mode}')
+        self.invalidate(ch)
 
     # 电阻
     def set_ch_impedance(self, ch, z):
@@ -470,6 +602,7 @@ class SDS5034(SiglentBase):
             self.write(f'CHANnel{int(ch)}:IMP FIFTy')
         else:
             raise RuntimeError('z must be one of "1M" or "50"')
+        self.invalidate(ch)
 
     # 按电压偏移
     def set_ch_offset(self, ch, offset):
@@ -482,6 +615,7 @@ class SDS5034(SiglentBase):
             ch (int): channel number
             offset (float): offset value in volts
         """
+        self.invalidate(ch)
         return self.write(f'CHANnel{int(ch)}:OFFSet {offset:g}')
 
     def set_ch_probe(self, ch, attenuation=None):
@@ -500,6 +634,7 @@ class SDS5034(SiglentBase):
         else:
             assert 1e-6 < attenuation < 1e6, 'Attenuation out of bounds: (1e-6, 1e6)'
             self.write(f'CHANnel{int(ch)}:PROBe VALue {attenuation:g}')
+        self.invalidate(ch)
 
     def set_ch_scale(self, ch, scale):
         """Sets the vertical sensitivity in Volts/div.
@@ -511,6 +646,7 @@ class SDS5034(SiglentBase):
             ch (int): channel number
             scale (float): vertical scaling
         """
+        self.invalidate(ch)
         return self.write(f'CHANnel{int(ch)}:SCALe {scale:g}')
 
     def set_ch_state(self, ch, on):
@@ -522,6 +658,8 @@ class SDS5034(SiglentBase):
         """
         state = 'ON' if on else 'OFF'
         self.write(f'CHANnel{int(ch)}:SWITch {state}')
+        self.invalidate(ch)
+        self._cache[('ch_state', int(ch))] = bool(on)
 
     def set_ch_unit(self, ch, unit):
         """Changes the unit of input signal of specified channel: voltage (V) or current (A)
@@ -533,6 +671,7 @@ class SDS5034(SiglentBase):
         unit = unit.upper()
         assert unit in ('V', 'A'), 'unit must be one of "V" or "A"'
         self.write(f'CHANnel{int(ch)}:UNIT {unit}')
+        self.invalidate(ch)
 
     """
     启动/停止采集数据，相当于按下前面板上的运行/停止按钮
@@ -559,6 +698,7 @@ class SDS5034(SiglentBase):
             self.write('ACQuire:SEQuence ON')
         else:
             self.write('ACQuire:SEQuence OFF')
+        self.invalidate()
 
     def set_sequence_count(self, value):
         """Sets the number of memory segments to acquire.
@@ -572,6 +712,7 @@ class SDS5034(SiglentBase):
             raise RuntimeError(f'Input {value} must be a power of 2')
 
         self.write(f'ACQuire:SEQuence:COUNt {int(value)}')
+        self.invalidate()
 
     def set_smpl_rate(self, rate):
         """Sets the sampling rate when in the fixed sampling rate mode.
@@ -585,6 +726,7 @@ class SDS5034(SiglentBase):
         else:
             self.write('ACQuire:MMANagement FSRate')
             self.write(f'ACQuire:SRATe {rate:g}')
+        self.invalidate()
 
     def set_time_delay(self, delay):
         """Specifies the main timebase delay.
@@ -597,6 +739,7 @@ class SDS5034(SiglentBase):
             point on the screen
         """
         self.write(f'TIMebase:DELay {float(delay):E}')
+        self.invalidate()
 
     def set_time_scale(self, scale):
         """Sets the horizontal scale per division for the main window.
@@ -609,6 +752,7 @@ class SDS5034(SiglentBase):
             scale (float): seconds per division
         """
         self.write(f'TIMebase:SCALe {scale:E}')
+        self.invalidate()
 
     def set_trig_mode(self, mode):
         """Sets the mode of the trigger.
@@ -637,24 +781,36 @@ class SDS5034(SiglentBase):
         """
         if state.upper() in 'RUN':
             self.write('TRIGger:RUN')
+            self._set_run_cache(True)
         elif state.upper() in 'STOP':
             self.write('TRIGger:STOP')
+            self._set_run_cache(False)
         else:
             raise RuntimeError('Bad state input, should be one of RUN or STOP')
 
     def set_wave_ch(self, ch):
         """Specifies the source waveform to be transferred from the oscilloscope
 
+            Skipped if the cache shows the source is already set.
+
         Args:
             ch (int): channel number
         """
+        if self._cache.get(('wave_ch', None)) == int(ch):
+            return
         self.write(f'WAVeform:SOURce C{int(ch)}')
+        self._cache[('wave_ch', None)] = int(ch)
 
     def set_wave_startpt(self, pt):
-        """Args:
+        """Skipped if the cache shows the start point is already set.
+
+        Args:
             pt (int): index of starting data point for waveform transfer
         """
+        if self._cache.get(('wave_startpt', None)) == int(pt):
+            return
         self.write(f'WAVeform:STARt {int(pt)}')
+        self._cache[('wave_startpt', None)] = int(pt)
 
     def set_wave_interval(self, interval):
         """Args:
@@ -667,6 +823,7 @@ class SDS5034(SiglentBase):
             npts (int): number of waveform points to be transferred
         """
         self.write(f'WAVeform:POINt {int(npts)}')
+        self._cache[('wave_npts', None)] = float(int(npts))
 
     def set_wave_width(self, format):
         """Sets the current output format for the transfer of waveform data.
@@ -676,9 +833,16 @@ class SDS5034(SiglentBase):
         """
         format = format.upper()
         if format in 'BYTE':
-            self.write('WAVeform:WIDTh BYTE')
+            format = 'BYTE'
         elif format in 'WORD':
-            self.write('WAVeform:WIDTh WORD')
+            format = 'WORD'
+        else:
+            return
+
+        if self._cache.get(('wave_width', None)) == format:
+            return
+        self.write(f'WAVeform:WIDTh {format}')
+        self._cache[('wave_width', None)] = format
 
     # 获取测量值
     def get_measurement_item_value(self, n):
@@ -694,74 +858,6 @@ class SDS5034(SiglentBase):
 
     # 测量
     def set_measurement_item(self, lst_measurement=None):
-        var = {
-            '峰峰值': 'PKPK',
-            '最大值': 'MAX',
-            '最小值': 'MIN',
-            '幅值': 'AMPL',
-            '顶端值': 'TOP',
-            '低端值': 'BASE',
-            'L@T': 'LEVELX',
-            '周期平局值': 'CMEAN',
-            '平均值': 'MEAN',
-            '标准差': 'STDEV',
-            '周期标准差': 'VSTD',
-            '均方根': 'RMS',
-            '周期均方根': 'CRMS',
-            '中位数': 'MEDIAN',
-            '周期中位数': 'CMEDIAN',
-            '下降过激': 'OVSN',
-            '下降前激': 'FPRE',
-            '上升过激': 'OVSP',
-            '上升前激': 'RPRE',
-            '周期': 'PER',
-            '频率': 'FREQ',
-            '最大值时间': 'TMAX',
-            '最小值时间': 'TMIN',
-            '正脉宽': 'PWID',
-            '负脉宽': 'NWID',
-            '正占空比': 'DUTY',
-            '负占空比': 'NDUTY',
-            '正脉冲串宽度': 'WID',
-            '负脉冲串宽度': 'NBWID',
-            '延时': 'DELAY',
-            'T@M': 'TIMEL',
-            '上升时间': 'RISE',
-            '下降时间': 'FALL',
-            '10-90%上升时间': 'RISE10T90',
-            '90-10%下降时间': 'FALL90T10',
-            '相邻周期抖动': 'CCJ',
-            '直流正面积': 'PAREA',
-            '直流负面积': 'NAREA',
-            '直流有效面积': 'AREA',
-            '直流绝对面积': 'ABSAREA',
-            '周期数': 'CYCLES',
-            '上升沿个数': 'REDGES',
-            '下降沿个数': 'FEDGES',
-            '边沿总数': 'EDGES',
-            '正脉冲数': 'PPULSES',
-            '负脉冲数': 'NPULSES',
-            '相位': 'PHA',
-            '时滞': 'SKEW',
-            'FRFR': 'FRR',
-            'FRFF': 'FRF',
-            'FFFR': 'FFR',
-            'FFFF': 'FFF',
-            'FRLR': 'LRR',
-            'FRLF': 'LRF',
-            'FFLR': 'LFR',
-            'FFLF': 'LFF',
-            '交流正面积': 'PACArea',
-            '交流负面积': 'NACArea',
-            '交流有效面积': 'ACArea',
-            '交流绝对面积': 'ABSACArea',
-            '上升沿斜率': 'PSLOPE',
-            '下降沿斜率': 'NSLOPE',
-            'TSU@R': 'TSR',
-            'TSU@F': 'TSF',
-            'TH@R': 'THR',
-            'TH@F': 'THF'
-        }
 
         if not lst_measurement:
             lst_measurement = [
@@ -771,11 +867,41 @@ class SDS5034(SiglentBase):
         # n = 0
         # for measurement_mode in lst_measurement:
         #     if n < 12:
-        #         self.write(f':MEASure:ADVanced:P{n + 1}:TYPE {var[measurement_mode]}')
+        #         self.write(f':MEASure:ADVanced:P{n + 1}:TYPE {self.MEAS_TYPES[measurement_mode]}')
         #     n += 1
         for n in range(len(lst_measurement)):
             self.write(
-                f':MEASure:ADVanced:P{n + 1}:TYPE {var[lst_measurement[n]]}')
+                f':MEASure:ADVanced:P{n + 1}:TYPE {self.MEAS_TYPES[lst_measurement[n]]}')
+            self.meas_slots[n + 1] = self.MEAS_TYPES[lst_measurement[n]]
+
+    def get_measurement_values(self, slots=None):
+        """Read the type and value of several measurement slots in one query
+
+        Args:
+            slots (list|None): slot numbers. If None, the slots set by
+                set_measurement_item, or all 12 if none were set
+
+        Returns:
+            dict: {n: {'type': str, 'value': float|None}}, value is None when
+                the scope shows no result (****)
+        """
+        if slots is None:
+            slots = sorted(self.meas_slots) or range(1, 13)
+        slots = [int(n) for n in slots]
+
+        cmds = []
+        for n in slots:
+            cmds += [f'MEASure:ADVanced:P{n}:TYPE?', f'MEASure:ADVanced:P{n}:VALue?']
+        answers = self.query_many(cmds)
+
+        values = {}
+        for i, n in enumerate(slots):
+            try:
+                value = float(answers[2 * i + 1])
+            except ValueError:
+                value = None
+            values[n] = {'type': answers[2 * i], 'value': value}
+        return values
 
     # read waveform commands
     def get_wave_preamble(self, ch=None):
@@ -899,6 +1025,55 @@ class SDS5034(SiglentBase):
         recv_all = self.read_bytes(350)
         recv = recv_all[recv_all.find(b'#') + 11:]
 
+        # Wave source. 0-C1,1-C2,2-C3,3-C4
+        # Normal command doesn't work?
+        # preamble['channel'] = f"C{struct.unpack('h', recv[344:346])[0]}"
+        wave_ch = self._cache.get(('wave_ch', None))
+        if wave_ch is None:
+            wave_ch = self.get_wave_ch()
+
+        return self._parse_preamble(recv, wave_ch)
+
+    def get_wave_preambles(self, channels):
+        """Get the preambles of several channels in one exchange
+
+            The source selection and preamble queries of all channels are
+            sent as one semicolon joined message and the returned blocks are
+            split by their length headers.
+
+        Args:
+            channels (list): channel numbers
+
+        Returns:
+            dict: {ch: preamble dict}, see get_wave_preamble
+        """
+        if not channels:
+            return {}
+
+        cmds = []
+        for ch in channels:
+            cmds += [f'WAVeform:SOURce C{int(ch)}', 'WAV:PREamble?']
+        self.write(';'.join(':' + cmd for cmd in cmds))
+        blocks = wavedecode.iter_blocks(self.read_raw())
+
+        preambles = {}
+        for ch, block in zip(channels, blocks):
+            preambles[ch] = self._parse_preamble(bytes(block), int(ch))
+
+        self._cache[('wave_ch', None)] = int(channels[-1])
+        return preambles
+
+    def _parse_preamble(self, recv, ch):
+        """Convert the WAVEDESC block of a preamble to a dict
+
+        Args:
+            recv (bytes): block data, without the #9 header
+            ch (int): channel number the preamble belongs to
+
+        Returns:
+            dict: see get_wave_preamble
+        """
+
         # convert to data
         preamble = {}
 
@@ -1005,10 +1180,8 @@ class SDS5034(SiglentBase):
         options = ['OFF', '20M', '200M']
         preamble['bandwidth'] = options[struct.unpack('h', recv[334:336])[0]]
 
-        # Wave source. 0-C1,1-C2,2-C3,3-C4
-        # Normal command doesn't work?
-        # preamble['channel'] = f"C{struct.unpack('h', recv[344:346])[0]}"
-        preamble['channel'] = f"C{self.get_wave_ch()}"
+        # Wave source, set by the caller
+        preamble['channel'] = f"C{int(ch)}"
 
         # adjusted vertical values
         preamble[
@@ -1021,136 +1194,456 @@ class SDS5034(SiglentBase):
 
         return preamble
 
-    def read_wave_ch(self, ch, start_pt=0):
-        """Fetch the waveform data of a single source channel in volts
+    def read_wave_raw(self, ch, start_pt=0):
+        """Transfer the raw waveform data of a single source channel
+
+            The total size is the number of points to transfer
+            (WAV:POINt?, or the preamble data_npts if that is 0) times the
+            sample width, known before the transfer starts. Every piece of
+            get_wave_maxpt() points is copied in place into one preallocated
+            buffer, so peak memory stays near the size of the waveform itself.
 
         Args:
             ch (int): channel number
             start_pt (int): index of starting point
 
         Returns:
-            pd.DataFrame: voltages of single channel, indexed by timestamp
+            tuple: (np.ndarray of uint8 data bytes, preamble dict, adc bits)
         """
 
         # setup input
         self.set_wave_startpt(start_pt)
         self.set_wave_ch(ch)
 
+        # number of bits used in data read
+        nbits = self._cached('adc_resolution', self.get_adc_resolution)
+        if nbits > 8:
+            self.set_wave_width('WORD')
+            width = 2
+        else:
+            self.set_wave_width('BYTE')
+            width = 1
+
         # set number of points to read from
-        points = self.get_wave_npts()
-        one_piece_num = self.get_wave_maxpt()
+        points = self._cached('wave_npts', self.get_wave_npts)
+        one_piece_num = self._cached('wave_maxpt', self.get_wave_maxpt, None,
+                                     width)
+
+        # read waveform preamble, before the number of points is limited
+        preamble = self._cached('preamble', self.get_wave_preamble, int(ch),
+                                width, points)
 
         if points == 0:
-            preamble = self.get_wave_preamble()
             points = preamble['data_npts']
             self.set_wave_npts(points)
 
         if points > one_piece_num:
             self.set_wave_npts(one_piece_num)
 
-        # number of bits used in data read
-        nbits = self.get_adc_resolution()
-        if nbits > 8:
-            self.set_wave_width('WORD')
-        else:
-            self.set_wave_width('BYTE')
+        # preallocate and fill in place
+        buffer = np.empty(int(points) * width, dtype=np.uint8)
+        view = memoryview(buffer)
+        filled = 0
 
-        # read waveform data?
         read_times = math.ceil(points / one_piece_num)
-        recv_all = []
         for i in range(0, read_times):
-            start = i * one_piece_num
+            start = start_pt + i * one_piece_num
             self.set_wave_startpt(start)
             self.write("WAV:DATA?")
-            recv_rtn = self.read_raw()
-            recv = list(recv_rtn[recv_rtn.find(b'#') + 11:-2])
-            recv_all += recv
+            data = wavedecode.block_data(self.read_raw())
 
-        # convert bits to float
-        if nbits > 8:
-            convert_data = []
-            for i in range(0, int(len(recv_all) / 2)):
-                data_16bit = recv_all[2 * i + 1] * 256 + recv_all[2 * i]
-                data = data_16bit >> (16 - nbits)
-                convert_data.append(data)
-        else:
-            convert_data = recv_all
+            n = min(len(data), len(view) - filled)
+            view[filled:filled + n] = data[:n]
+            filled += n
+            del data
 
-        # convert ints to volts
-        volt_value = []
-        for data in convert_data:
+        # restore the requested number of points for the next transfer
+        if points > one_piece_num:
+            self.set_wave_npts(points)
 
-            # 12bit-2047, 8bit-127
-            if data > pow(2, nbits - 1) - 1:
-                data = data - pow(2, nbits)
-            else:
-                pass
-            volt_value.append(data)
+        return buffer[:filled], preamble, nbits
 
-        volt_value = np.array(volt_value)
+    def _read_wave_codes(self, ch, start_pt=0):
+        """Transfer a single channel and convert it to signed ADC codes
 
-        if nbits == 10:
-            volt_value = volt_value / 4
+        Args:
+            ch (int): channel number
+            start_pt (int): index of starting point
 
-        # read waveform preamble
-        preamble = self.get_wave_preamble()
-        code = preamble['code_per_div']
-        vdiv = preamble['v_per_div']
-        offset = preamble['v_offset']
-        tdiv = preamble['t_per_div']
-        delay = preamble['t_delay_s']
-        interval = preamble['sample_interval']
+        Returns:
+            tuple: (np.ndarray of codes, preamble dict, adc bits)
+        """
+        data, preamble, nbits = self.read_wave_raw(ch, start_pt=start_pt)
+        byteorder = '>' if preamble['comm_order'] == 'MSB' else '<'
+        codes = wavedecode.decode_codes(data, nbits, byteorder=byteorder)
+        return codes, preamble, nbits
+
+    def _codes_to_frame(self, ch, codes, preamble, nbits, start_pt=0):
+        """Convert signed ADC codes of one channel to a data frame in volts
+
+        Returns:
+            pd.DataFrame: voltages of single channel, indexed by timestamp
+        """
 
-        # adjust voltage values
-        volt_value = volt_value / code * vdiv - offset
+        # convert codes to volts
+        volt_value = wavedecode.codes_to_volts(codes, nbits,
+                                               preamble['code_per_div'],
+                                               preamble['v_per_div'],
+                                               preamble['v_offset'])
 
         # get times
-        idx = np.arange(len(volt_value))
-        time_value = -delay - (tdiv * self.HORI_NUM / 2) + idx * interval
+        time_value = wavedecode.time_axis(preamble, len(volt_value),
+                                          hori_num=self.HORI_NUM,
+                                          start=start_pt)
 
         # make data frame for output
         df = pd.DataFrame({f'C{ch}': volt_value, 'time_s': time_value})
         df.set_index('time_s', inplace=True)
+        return df
+
+    def _update_waveforms(self, df):
+        """Store new channel data in self.waveforms
+
+            Columns are assigned in place when the time axis did not change,
+            otherwise the old columns are dropped and the frames joined.
+
+        Args:
+            df (pd.DataFrame): voltages indexed by timestamp
+        """
+        if self.waveforms.index.equals(df.index):
+            for col in df.columns:
+                self.waveforms[col] = df[col].to_numpy()
+        else:
+            self.waveforms = pd.concat(
+                (self.waveforms.drop(columns=df.columns, errors='ignore'), df),
+                axis='columns')
+
+    def read_wave_ch(self, ch, start_pt=0, save=True):
+        """Fetch the waveform data of a single source channel in volts
+
+        Args:
+            ch (int): channel number
+            start_pt (int): index of starting point
+            save (bool): if True, save the raw codes to self.store
+
+        Returns:
+            pd.DataFrame: voltages of single channel, indexed by timestamp
+        """
+
+        # read waveform data
+        codes, preamble, nbits = self._read_wave_codes(ch, start_pt=start_pt)
+        df = self._codes_to_frame(ch, codes, preamble, nbits, start_pt)
 
         # save
-        self.waveforms.drop(columns=[f'C{ch}'], errors='ignore', inplace=True)
-        self.waveforms = pd.concat((self.waveforms, df), axis='columns')
-        output_file = 'data.csv'
-        df.to_csv(output_file, index=False)
+        self._update_waveforms(df)
+        if save:
+            self.last_capture_id = self.store.save(
+                {f'C{ch}': (codes, preamble)},
+                nbits,
+                hori_num=self.HORI_NUM,
+                start_pt=start_pt)
         return df
 
-    def read_wave_active(self, start_pt=0):
+    def get_active_channels(self):
+        """Channel states not in the cache are queried in one exchange
+
+        Returns:
+            list: numbers of the channels that are on
+        """
+        missing = [i for i in range(1, 5) if ('ch_state', i) not in self._cache]
+        if missing:
+            states = self.query_many(
+                [f'CHANnel{i}:SWITch?' for i in missing])
+            for i, state in zip(missing, states):
+                self._cache[('ch_state', i)] = state.upper() == 'ON'
+        return [i for i in range(1, 5) if self._cache[('ch_state', i)]]
+
+    def read_wave_active(self, start_pt=0, save=True):
         """Read the waveforms of all active (displayed) analog input channels
 
+            Channel states and preambles are fetched in one batched exchange
+            each. While one channel is transferred the previous one is decoded
+            in a worker thread.
+
         Args:
             start_pt (int): index of starting point to read
+            save (bool): if True, save the raw codes of all channels to
+                self.store as one capture
 
         Returns:
             pd.DataFrame: voltages of all active channels, indexed by timestamp
         """
 
         # stop run state
-
         self.stop()
+        channels = self.get_active_channels()
 
-        # iterate over all possible channels
-        waves = []
-        for i in range(1, 5):
-
-            if self.get_ch_state(i):
-                waves.append(self.read_wave_ch(i, start_pt=start_pt))
-
-        # make dataframe
-        df = pd.concat(waves, axis='columns')
+        # transfer settings shared by all channels
+        self.set_wave_startpt(start_pt)
+        nbits = self._cached('adc_resolution', self.get_adc_resolution)
+        width = 2 if nbits > 8 else 1
+        self.set_wave_width('WORD' if width == 2 else 'BYTE')
+        points = self._cached('wave_npts', self.get_wave_npts)
+
+        # preambles of all channels, seeds the cache used by read_wave_raw
+        missing = [i for i in channels
+                   if ('preamble', i, width, points) not in self._cache]
+        for i, preamble in self.get_wave_preambles(missing).items():
+            self._cache[('preamble', i, width, points)] = preamble
+
+        if points == 0 and channels:
+            points = self._cache[('preamble', channels[0], width, 0)]['data_npts']
+            self.set_wave_npts(points)
+            for i in channels:
+                self._cache[('preamble', i, width, points)] = \
+                    self._cache[('preamble', i, width, 0)]
+
+        # transfer channel N while channel N-1 is decoded
+        def decode(data, preamble):
+            byteorder = '>' if preamble['comm_order'] == 'MSB' else '<'
+            codes = wavedecode.decode_codes(data, nbits, byteorder=byteorder)
+            volts = wavedecode.codes_to_volts(codes, nbits,
+                                              preamble['code_per_div'],
+                                              preamble['v_per_div'],
+                                              preamble['v_offset'])
+            return codes, volts, preamble
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            jobs = {}
+            for i in channels:
+                data, preamble, nbits = self.read_wave_raw(i, start_pt=start_pt)
+                jobs[i] = pool.submit(decode, data, preamble)
+            decoded = {i: job.result() for i, job in jobs.items()}
+
+        # make dataframe, channels aligned on one time axis
+        npts = min((len(v[1]) for v in decoded.values()), default=0)
+        columns = {f'C{i}': v[1][:npts] for i, v in decoded.items()}
+        if decoded:
+            first = decoded[channels[0]][2]
+            time_value = wavedecode.time_axis(first, npts,
+                                              hori_num=self.HORI_NUM,
+                                              start=start_pt)
+        else:
+            time_value = np.empty(0)
+        df = pd.DataFrame(columns, index=pd.Index(time_value, name='time_s'))
 
         # save
-        self.waveforms.drop(columns=df.columns, errors='ignore', inplace=True)
-        self.waveforms = pd.concat((self.waveforms, df), axis='columns')
-        output_file = 'data.csv'
-        df.to_csv(output_file, index=True)
-        print("DataFrame已成功写入CSV文件。")
+        self._update_waveforms(df)
+        if save and decoded:
+            captured = {f'C{i}': (v[0], v[2]) for i, v in decoded.items()}
+            self.last_capture_id = self.store.save(captured,
+                                                   nbits,
+                                                   hori_num=self.HORI_NUM,
+                                                   start_pt=start_pt)
         return df
 
+    def measure_wave(self, ch, items=None, ref_ch=None, start_pt=0):
+        """Read a channel and compute measurement items on the host
+
+            Unlike the advanced measurement slots of the scope there is no limit
+            on the number of items, see measure.py for the conventions used.
+
+        Args:
+            ch (int): channel number
+            items (list|None): items as SCPI codes ('PKPK') or display names
+                ('峰峰值') of MEAS_TYPES. If None, all items
+            ref_ch (int|None): second channel for PHA, SKEW, FRR, TSR, ...
+            start_pt (int): index of starting point
+
+        Returns:
+            dict: {item: float} keyed as given in items
+        """
+        if items is None:
+            items = list(measure.ITEMS)
+
+        def trace(i):
+            df = self.read_wave_ch(i, start_pt=start_pt, save=False)
+            interval = self.preambles[f'C{i}']['sample_interval']
+            return df[f'C{i}'].to_numpy(), interval, df.index[0]
+
+        ref = None
+        if ref_ch is not None:
+            ref = measure.Measure(*trace(ref_ch))
+        m = measure.Measure(*trace(ch), ref=ref)
+
+        codes = [self.MEAS_TYPES.get(item, item) for item in items]
+        values = m.measure(codes)
+        return {item: values[code] for item, code in zip(items, codes)}
+
+    def export_csv(self, capture_id=None, filename=None):
+        """Export a stored capture to csv, streamed block by block
+
+        Args:
+            capture_id (str|None): capture to export, if None the last capture
+            filename (str|None): output file, default data.csv in the capture
+                directory
+
+        Returns:
+            str: output file name
+        """
+        if capture_id is None:
+            capture_id = self.last_capture_id
+        if capture_id is None:
+            raise RuntimeError('No capture saved yet, read a waveform first')
+        return self.store.export_csv(capture_id, filename)
+
+    # sequence (segmented) acquisition
+    def arm_sequence(self, count=None):
+        """Turn on sequence mode and arm a single sequence acquisition
+
+            The scope then records one segment per trigger, at full sample
+            rate, until count segments are filled and stops by itself.
+
+        Args:
+            count (int|None): number of segments, if None keep current setting
+        """
+        if count is not None:
+            self.set_sequence_count(count)
+        self.set_sequence(True)
+        self.set_trig_mode('single')
+        self.run()
+
+    def wait_stopped(self, timeout=10, poll=0.05):
+        """Wait until the trigger state reports Stop
+
+        Args:
+            timeout (float): seconds to wait
+            poll (float): seconds between queries
+
+        Returns:
+            bool: True if stopped, False on timeout
+        """
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if self.get_trig_state().strip().lower() == 'stop':
+                self._set_run_cache(False)
+                return True
+            time.sleep(poll)
+        return False
+
+    def get_sequence_timestamps(self, nframes, batch=100):
+        """Read the trigger time of every sequence frame from the history
+
+            Frames are selected and queried in batches of semicolon joined
+            commands, one exchange per batch.
+
+        Args:
+            nframes (int): number of frames
+            batch (int): number of frames per exchange
+
+        Returns:
+            np.ndarray: trigger times in seconds (nan if not parsable)
+        """
+        stamps = np.full(nframes, np.nan)
+        self.write('HISTORy ON')
+        try:
+            for first in range(1, nframes + 1, batch):
+                frames = range(first, min(first + batch, nframes + 1))
+                cmds = []
+                for i in frames:
+                    cmds += [f'HISTORy:FRAMe {i}', 'HISTORy:TIME?']
+                for i, r in zip(frames, self.query_many(cmds)):
+                    stamps[i - 1] = self._parse_frame_time(r)
+        finally:
+            self.write('HISTORy OFF')
+        return stamps
+
+    @staticmethod
+    def _parse_frame_time(value):
+        """Convert a history frame time (hh:mm:ss.ssssss) to seconds"""
+        try:
+            seconds = 0.0
+            for part in value.strip().strip('"').split(':'):
+                seconds = seconds * 60 + float(part)
+            return seconds
+        except ValueError:
+            return np.nan
+
+    def read_sequence(self, ch, count=None, arm=True, timeout=10,
+                      timestamps=True, save=True):
+        """Acquire and download all frames of a sequence acquisition
+
+            Frames are downloaded with as many frames per WAV:DATA? transfer
+            as the scope allows (preamble read_frames), into one preallocated
+            frames x points buffer.
+
+        Args:
+            ch (int): channel number
+            count (int|None): number of segments, if None keep current setting
+            arm (bool): if True arm and wait, else read the frames already
+                acquired
+            timeout (float): seconds to wait for all segments
+            timestamps (bool): if True read the trigger time of every frame
+            save (bool): if True, save the raw codes to self.store
+
+        Returns:
+            tuple: (times of the points in a frame in seconds,
+                    volts as frames x points np.ndarray,
+                    trigger time of each frame in seconds)
+        """
+        if arm:
+            self.arm_sequence(count)
+            if not self.wait_stopped(timeout):
+                raise RuntimeError(
+                    f'Sequence acquisition not complete after {timeout} s')
+
+        # transfer format
+        self.set_wave_ch(ch)
+        nbits = self._cached('adc_resolution', self.get_adc_resolution)
+        if nbits > 8:
+            self.set_wave_width('WORD')
+            width = 2
+        else:
+            self.set_wave_width('BYTE')
+            width = 1
+
+        # all frames from the first, preamble gives frames per transfer
+        self.write('WAVeform:SEQuence 0,1')
+        preamble = self.get_wave_preamble()
+        npts = int(preamble['data_npts'])
+        sum_frames = int(preamble['sum_frames'])
+        read_frames = max(int(preamble['read_frames']), 1)
+
+        buffer = np.empty(sum_frames * npts * width, dtype=np.uint8)
+        view = memoryview(buffer)
+        filled = 0
+        for first in range(1, sum_frames + 1, read_frames):
+            self.write(f'WAVeform:SEQuence 0,{first}')
+            self.write('WAV:DATA?')
+            data = wavedecode.block_data(self.read_raw())
+
+            n = min(len(data), len(view) - filled)
+            view[filled:filled + n] = data[:n]
+            filled += n
+            del data
+
+        byteorder = '>' if preamble['comm_order'] == 'MSB' else '<'
+        codes = wavedecode.decode_codes(buffer[:filled], nbits,
+                                        byteorder=byteorder)
+        codes = codes[:(len(codes) // npts) * npts].reshape(-1, npts)
+
+        volts = wavedecode.codes_to_volts(codes, nbits,
+                                          preamble['code_per_div'],
+                                          preamble['v_per_div'],
+                                          preamble['v_offset'])
+        time_value = wavedecode.time_axis(preamble, npts,
+                                          hori_num=self.HORI_NUM)
+
+        if timestamps:
+            stamps = self.get_sequence_timestamps(len(codes))
+        else:
+            stamps = np.full(len(codes), np.nan)
+
+        if save:
+            self.last_capture_id = self.store.save(
+                {f'C{ch}': (codes, preamble)},
+                nbits,
+                hori_num=self.HORI_NUM,
+                sequence=True,
+                timestamps=[None if np.isnan(t) else t for t in stamps])
+
+        return time_value, volts, stamps
+
     def getdecode(self):
         return self.query('DEC:BUS1:PROT?')
 
@@ -5,9 +5,7 @@
     April 2023
 """
 
-import pyvisa
-
-rm = pyvisa.ResourceManager()
+from ..visa_manager import visa_manager
 
 
 class SiglentBase(object):
@@ -29,18 +27,17 @@ class SiglentBase(object):
             hostname (str): ip address or DNC lookup of device
         """
 
-        # connect to device
-        # rm = pyvisa.ResourceManager()
-        self.sds = rm.open_resource(self.ADDRESS.format(host=hostname))
-
-        # setup connection
-        self.sds.read_termination = '\n'
-        self.sds.write_termination = '\n'
+        # connect to device, shared with other users of the address
+        self.address = self.ADDRESS.format(host=hostname)
+        self.sds = visa_manager.open(self.address,
+                                     read_termination='\n',
+                                     write_termination='\n')
 
     # useful read and write passing to pyvisa.resources.TCPIPInstrument class
     def close(self):
-        """Close remote connection."""
-        self.sds.close()
+        """Close remote connection, released through visa_manager as the
+        resource is shared with other drivers of the address."""
+        visa_manager.close(self.address)
 
     def flush(self):
         """Flush connection buffer."""
@@ -71,6 +68,21 @@ class SiglentBase(object):
         """
         return self.sds.query(*args, **kwargs)
 
+    def query_many(self, commands):
+        """Push several commands as one message, read back all responses.
+
+            Commands are joined with ';' so the device handles them in a single
+            exchange. Only queries (commands with '?') produce a response.
+
+        Args:
+            commands (list): SCPI commands, without leading ':'
+
+        Returns:
+            list: responses (str) of the queries, in order
+        """
+        message = ';'.join(':' + cmd.lstrip(':') for cmd in commands)
+        return [r.strip() for r in self.query(message).split(';')]
+
     def write(self, *args, **kwargs):
         """Write string to device.
 
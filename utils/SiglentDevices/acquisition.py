@@ -0,0 +1,182 @@
+"""
+    Background acquisition of an SDS5034 shared by many viewers
+
+    One AcquisitionWorker polls one scope at a fixed rate and keeps the latest
+    frame (measurement values and optionally a decimated waveform). Any number
+    of readers wait on a condition for the next frame, so N browsers cost one
+    instrument poll loop. The worker only polls while someone is listening.
+
+        worker = AcquisitionWorker(scope, interval=0.5, wave_ch=1)
+        worker.start()
+        for frame in worker.frames():
+            ...
+"""
+
+import threading
+import time
+
+from . import decimate
+
+
+class AcquisitionWorker(threading.Thread):
+    """Poll a scope in a daemon thread and fan frames out to readers
+
+        Attributes:
+
+            scope (SDS5034): scope to poll
+            interval (float): seconds between polls
+            wave_ch (int|None): channel of the decimated waveform, None for
+                measurements only
+            width (int): waveform width in pixels
+            method (str): decimation method, minmax|lttb
+            lock (threading.Lock): held while talking to the scope
+    """
+
+    def __init__(self, scope, interval=0.5, wave_ch=None, width=800,
+                 method='minmax', lock=None):
+        """ Init.
+
+        Args:
+            scope (SDS5034): scope to poll
+            interval (float): seconds between polls
+            wave_ch (int|None): channel of the decimated waveform
+            width (int): waveform width in pixels
+            method (str): minmax|lttb
+            lock (threading.Lock|None): lock shared with other users of the
+                scope. If None, a private one is made
+        """
+        super().__init__(daemon=True)
+        self.scope = scope
+        self.lock = lock if lock is not None else threading.Lock()
+        self.configure(interval=interval, wave_ch=wave_ch, width=width,
+                       method=method)
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._readers = 0
+        self._running = True
+
+    def configure(self, interval=None, wave_ch=None, width=None, method=None):
+        """Change poll settings, applied from the next poll on
+
+        Args:
+            interval (float|None): seconds between polls
+            wave_ch (int|None): waveform channel, 0 to turn waveforms off
+            width (int|None): waveform width in pixels
+            method (str|None): minmax|lttb
+        """
+        if interval is not None:
+            self.interval = max(float(interval), 0.05)
+        if wave_ch is not None:
+            self.wave_ch = int(wave_ch) or None
+        if width is not None:
+            self.width = min(max(int(width), 10), 4000)
+        if method is not None:
+            if method not in decimate.METHODS:
+                raise RuntimeError(
+                    f'Bad method input, should be one of {decimate.METHODS}')
+            self.method = method
+
+    @property
+    def readers(self):
+        """int: number of connected readers"""
+        return self._readers
+
+    def stop(self):
+        """End the poll loop and release all waiting readers"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def poll(self):
+        """Read one frame from the scope
+
+        Returns:
+            dict: time, measurement values and optional waveform
+        """
+        frame = {'time': time.time()}
+        with self.lock:
+            frame['measurements'] = self.scope.get_measurement_values()
+
+            if self.wave_ch:
+                ch = self.wave_ch
+                df = self.scope.read_wave_ch(ch, save=False)
+                t, v = decimate.decimate(df.index.to_numpy(),
+                                         df[f'C{ch}'].to_numpy(),
+                                         self.width, method=self.method)
+                frame['waveform'] = {
+                    'ch': ch,
+                    'npts': len(df),
+                    't': t.round(12).tolist(),
+                    'v': v.round(5).tolist(),
+                }
+        return frame
+
+    def run(self):
+        next_poll = time.monotonic()
+        while True:
+            with self._cond:
+                # sleep while nobody listens
+                while self._running and self._readers == 0:
+                    self._cond.wait()
+                if not self._running:
+                    return
+
+            try:
+                frame = self.poll()
+            except Exception as e:
+                frame = {'time': time.time(), 'error': str(e)}
+
+            with self._cond:
+                self._seq += 1
+                self._frame = frame
+                self._cond.notify_all()
+
+            # fixed rate, without drifting by the time spent polling
+            next_poll = max(next_poll + self.interval, time.monotonic())
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running,
+                                    next_poll - time.monotonic())
+
+    def wait(self, seq=0, timeout=None):
+        """Wait for a frame newer than seq
+
+        Args:
+            seq (int): sequence number of the last frame seen
+            timeout (float|None): seconds to wait
+
+        Returns:
+            tuple: (seq, frame), frame is None on timeout or stop
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._seq > seq or not self._running, timeout)
+            if self._seq > seq:
+                return self._seq, self._frame
+            return seq, None
+
+    def frames(self, timeout=15):
+        """Yield every new frame while the worker runs
+
+            The reader is counted for as long as the generator is alive, the
+            worker polls only while at least one reader is counted.
+
+        Args:
+            timeout (float): seconds without a frame before None is yielded,
+                lets callers send keep alives
+
+        Yields:
+            dict|None: frame, or None after timeout
+        """
+        with self._cond:
+            self._readers += 1
+            self._cond.notify_all()
+            seq = self._seq
+        try:
+            while self._running:
+                seq, frame = self.wait(seq, timeout)
+                yield frame
+        finally:
+            with self._cond:
+                self._readers -= 1
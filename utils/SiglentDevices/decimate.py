@@ -0,0 +1,138 @@
+"""
+    Decimation of long waveforms for display
+
+    A scope record holds up to hundreds of millions of points, a plot is a
+    few hundred to a few thousand pixels wide. These functions reduce a trace
+    to about one or two points per pixel with NumPy, so the payload sent to a
+    browser does not depend on the memory depth.
+
+        minmax  keeps the minimum and maximum of every pixel bucket, glitches
+                and envelopes stay visible
+        lttb    largest triangle three buckets, one point per bucket chosen
+                to keep the visual shape
+"""
+
+import numpy as np
+
+METHODS = ('minmax', 'lttb')
+
+
+def window(t, y, t_start=None, t_stop=None):
+    """Select the points between two times
+
+    Args:
+        t (np.ndarray): sorted times
+        y (np.ndarray): values
+        t_start (float|None): window start, default first point
+        t_stop (float|None): window end (excluded), default last point
+
+    Returns:
+        tuple: (t, y) views of the window, no copy is made
+    """
+    start = 0 if t_start is None else np.searchsorted(t, t_start, 'left')
+    stop = len(t) if t_stop is None else np.searchsorted(t, t_stop, 'left')
+    stop = max(start, stop)
+    return t[start:stop], y[start:stop]
+
+
+def minmax(t, y, nbuckets):
+    """Keep the minimum and maximum of each bucket
+
+    Args:
+        t (np.ndarray): times
+        y (np.ndarray): values
+        nbuckets (int): number of buckets, usually the width in pixels
+
+    Returns:
+        tuple: (t, y) with two points per bucket, in time order
+    """
+    n = len(y)
+    if n <= 2 * nbuckets:
+        return np.asarray(t), np.asarray(y)
+
+    # equal buckets for the bulk, the remainder makes one short last bucket
+    size = -(-n // nbuckets)
+    nfull = n // size
+    body = np.asarray(y[:nfull * size]).reshape(nfull, size)
+    imin = body.argmin(axis=1) + np.arange(nfull) * size
+    imax = body.argmax(axis=1) + np.arange(nfull) * size
+
+    if nfull * size < n:
+        tail = np.asarray(y[nfull * size:])
+        imin = np.append(imin, nfull * size + tail.argmin())
+        imax = np.append(imax, nfull * size + tail.argmax())
+
+    # keep each pair in time order so the drawn line follows the signal
+    idx = np.column_stack((np.minimum(imin, imax), np.maximum(imin, imax)))
+    idx = idx.ravel()
+    return np.asarray(t[idx]), np.asarray(y[idx])
+
+
+def lttb(t, y, nout):
+    """Largest triangle three buckets downsampling
+
+        The first and last points are kept. For every bucket in between the
+        point forming the largest triangle with the previously kept point and
+        the mean of the next bucket is kept. The loop runs once per output
+        point, the points inside a bucket are handled with NumPy.
+
+    Args:
+        t (np.ndarray): times
+        y (np.ndarray): values
+        nout (int): number of output points, at least 3
+
+    Returns:
+        tuple: (t, y) with nout points
+    """
+    n = len(y)
+    if nout >= n or nout < 3:
+        return np.asarray(t), np.asarray(y)
+
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # bucket edges of the points between the first and the last
+    edges = np.linspace(1, n - 1, nout - 1).astype(np.int64)
+
+    # mean of every bucket, used as the third triangle corner
+    t_mean = np.add.reduceat(t[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    y_mean = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    t_mean = np.append(t_mean, t[-1])
+    y_mean = np.append(y_mean, y[-1])
+
+    idx = np.empty(nout, dtype=np.int64)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(nout - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ta, ya = t[a], y[a]
+        area = np.abs((ta - t_mean[i + 1]) * (y[lo:hi] - ya) -
+                      (ta - t[lo:hi]) * (y_mean[i + 1] - ya))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+
+    return t[idx], y[idx]
+
+
+def decimate(t, y, width, method='minmax', t_start=None, t_stop=None):
+    """Cut a time window and reduce it to about width pixels
+
+    Args:
+        t (np.ndarray): sorted times
+        y (np.ndarray): values
+        width (int): plot width in pixels
+        method (str): minmax|lttb
+        t_start (float|None): window start in seconds
+        t_stop (float|None): window end in seconds
+
+    Returns:
+        tuple: (t, y) decimated
+    """
+    t, y = window(t, y, t_start, t_stop)
+    if method == 'minmax':
+        return minmax(t, y, int(width))
+    elif method == 'lttb':
+        return lttb(t, y, int(width))
+    else:
+        raise RuntimeError(f'Bad method input, should be one of {METHODS}')
@@ -0,0 +1,658 @@
+"""
+    Host side waveform measurements
+
+    Computes the items of the scope measurement table (SDS5034.MEAS_TYPES) on
+    arrays of volts, either straight from SDS5034.read_wave_ch or from a stored
+    capture. Intermediate results (top/base levels, threshold crossings, edge
+    times) are computed once with NumPy and shared by all items, so asking for
+    dozens of items costs little more than asking for one.
+
+        m = Measure(df['C1'].to_numpy(), preamble['sample_interval'],
+                    t0=df.index[0])
+        m.measure(['PKPK', 'FREQ', 'RISE'])
+
+    Conventions, following the scope defaults:
+        levels are 20/50/80 % between base and top (RISE, FALL, slopes),
+        RISE10T90 and FALL90T10 use 10/90 %,
+        top and base are histogram modes, falling back to max/min,
+        time items are averaged over all complete edges or cycles in the record,
+        edge timing items (FRR ... LFF, PHA, SKEW, TSR ...) need a reference
+        channel and use the first matching edges,
+        preshoot (RPRE, FPRE) is the largest excursion beyond the starting
+        level in the second half of the time before each edge,
+        items that cannot be computed (no edges, no reference) return nan.
+"""
+
+import functools
+
+import numpy as np
+
+# item code -> Measure method name
+ITEMS = {
+    'PKPK': 'pkpk',
+    'MAX': 'vmax',
+    'MIN': 'vmin',
+    'AMPL': 'ampl',
+    'TOP': 'top',
+    'BASE': 'base',
+    'LEVELX': 'levelx',
+    'CMEAN': 'cmean',
+    'MEAN': 'mean',
+    'STDEV': 'stdev',
+    'VSTD': 'vstd',
+    'RMS': 'rms',
+    'CRMS': 'crms',
+    'MEDIAN': 'median',
+    'CMEDIAN': 'cmedian',
+    'OVSN': 'ovsn',
+    'FPRE': 'fpre',
+    'OVSP': 'ovsp',
+    'RPRE': 'rpre',
+    'PER': 'per',
+    'FREQ': 'freq',
+    'TMAX': 'tmax',
+    'TMIN': 'tmin',
+    'PWID': 'pwid',
+    'NWID': 'nwid',
+    'DUTY': 'duty',
+    'NDUTY': 'nduty',
+    'WID': 'wid',
+    'NBWID': 'nbwid',
+    'DELAY': 'delay',
+    'TIMEL': 'timel',
+    'RISE': 'rise',
+    'FALL': 'fall',
+    'RISE10T90': 'rise10t90',
+    'FALL90T10': 'fall90t10',
+    'CCJ': 'ccj',
+    'PAREA': 'parea',
+    'NAREA': 'narea',
+    'AREA': 'area',
+    'ABSAREA': 'absarea',
+    'CYCLES': 'cycles',
+    'REDGES': 'redges',
+    'FEDGES': 'fedges',
+    'EDGES': 'edges',
+    'PPULSES': 'ppulses',
+    'NPULSES': 'npulses',
+    'PHA': 'pha',
+    'SKEW': 'skew',
+    'FRR': 'frr',
+    'FRF': 'frf',
+    'FFR': 'ffr',
+    'FFF': 'fff',
+    'LRR': 'lrr',
+    'LRF': 'lrf',
+    'LFR': 'lfr',
+    'LFF': 'lff',
+    'PACArea': 'pacarea',
+    'NACArea': 'nacarea',
+    'ACArea': 'acarea',
+    'ABSACArea': 'absacarea',
+    'PSLOPE': 'pslope',
+    'NSLOPE': 'nslope',
+    'TSR': 'tsr',
+    'TSF': 'tsf',
+    'THR': 'thr',
+    'THF': 'thf',
+}
+
+
+def _memoised(method):
+    """Read only property computed on first access and kept per instance,
+    like functools.cached_property, which needs Python 3.8"""
+    key = f'_memo{method.__name__}'
+
+    @functools.wraps(method)
+    def getter(self):
+        try:
+            return self.__dict__[key]
+        except KeyError:
+            value = self.__dict__[key] = method(self)
+            return value
+
+    return property(getter)
+
+
+def _first(x):
+    return float(x[0]) if len(x) else np.nan
+
+
+def _last(x):
+    return float(x[-1]) if len(x) else np.nan
+
+
+def _mean(x):
+    return float(np.mean(x)) if len(x) else np.nan
+
+
+def _next_after(t, after):
+    """First value of sorted t strictly after each value of after, nan if none"""
+    i = np.searchsorted(t, after, 'right')
+    out = np.full(len(after), np.nan)
+    ok = i < len(t)
+    out[ok] = t[i[ok]]
+    return out
+
+
+def _last_before(t, before):
+    """Last value of sorted t strictly before each value of before, nan if none"""
+    i = np.searchsorted(t, before, 'left') - 1
+    out = np.full(len(before), np.nan)
+    ok = i >= 0
+    out[ok] = t[i[ok]]
+    return out
+
+
+class Measure(object):
+    """Measurements of one trace, intermediate values are cached
+
+        Attributes:
+
+            v (np.ndarray): volts
+            dt (float): sampling interval in seconds
+            t0 (float): time of the first point in seconds, relative to trigger
+            ref (Measure|None): reference trace for two channel items
+    """
+
+    def __init__(self, volts, interval, t0=0.0, ref=None):
+        """ Init.
+
+        Args:
+            volts (np.ndarray): 1-D array of volts
+            interval (float): sampling interval in seconds
+            t0 (float): time of the first point in seconds
+            ref (Measure|None): reference trace for PHA, SKEW, FRR, TSR, ...
+        """
+        self.v = np.asarray(volts, dtype=np.float64)
+        self.dt = float(interval)
+        self.t0 = float(t0)
+        self.ref = ref
+
+    @classmethod
+    def from_channel(cls, channel, t_start=None, t_stop=None, ref=None,
+                     frame=None):
+        """Measure a time window of a stored capture channel
+
+        Args:
+            channel (WaveChannel): memory mapped channel of a WaveStore capture
+            t_start (float|None): window start in seconds
+            t_stop (float|None): window end in seconds
+            ref (Measure|None): reference trace
+            frame (int|None): frame of a sequence capture
+
+        Returns:
+            Measure
+
+        Raises:
+            ValueError: frame missing for a sequence capture, or given for a
+                capture without frames
+        """
+        if channel.codes.ndim == 2 and frame is None:
+            raise ValueError(
+                f'Sequence capture of {channel.codes.shape[0]} frames, '
+                f'select a frame to measure')
+        if channel.codes.ndim == 1 and frame is not None:
+            raise ValueError('Capture has no frames')
+        t, v = channel.window(t_start, t_stop, frame=frame)
+        t0 = t[0] if len(t) else channel.t0
+        return cls(v, channel.interval, t0=t0, ref=ref)
+
+    def measure(self, items=None):
+        """Evaluate several items
+
+        Args:
+            items (list|None): item codes, see ITEMS. If None, all items
+
+        Returns:
+            dict: {item: float}, all nan for less than two points
+        """
+        if items is None:
+            items = list(ITEMS)
+        for item in items:
+            if item not in ITEMS:
+                raise RuntimeError(f'Unknown measurement item {item}')
+        if len(self.v) < 2:
+            # e.g. a window outside the capture
+            return {item: np.nan for item in items}
+
+        result = {}
+        # constant traces divide by a zero amplitude, those items are nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for item in items:
+                result[item] = float(getattr(self, ITEMS[item])())
+        return result
+
+    # shared intermediate values
+    @_memoised
+    def _levels(self):
+        """(base, top) from the histogram modes of the lower and upper half"""
+        if not len(self.v):
+            return np.nan, np.nan
+        vmin, vmax = self.v.min(), self.v.max()
+        if vmax == vmin:
+            return vmin, vmax
+
+        counts, bins = np.histogram(self.v, bins=256, range=(vmin, vmax))
+        half = len(counts) // 2
+        lower, upper = counts[:half], counts[half:]
+
+        # a flat level holds a good share of the points, otherwise (sine,
+        # triangle) use the extremes like the scope does
+        threshold = 0.05 * len(self.v) / 2
+        i = lower.argmax()
+        base = (bins[i] + bins[i + 1]) / 2 if lower[i] > threshold else vmin
+        i = half + upper.argmax()
+        top = (bins[i] + bins[i + 1]) / 2 if counts[i] > threshold else vmax
+        return base, top
+
+    def _level(self, fraction):
+        base, top = self._levels
+        return base + (top - base) * fraction
+
+    def _cross(self, level, rising):
+        """Interpolated times of every crossing of a level
+
+        Args:
+            level (float): threshold in volts
+            rising (bool): True for upward crossings
+
+        Returns:
+            np.ndarray: crossing times in seconds, sorted
+        """
+        above = self.v >= level
+        if rising:
+            i = np.flatnonzero(~above[:-1] & above[1:])
+        else:
+            i = np.flatnonzero(above[:-1] & ~above[1:])
+        v0, v1 = self.v[i], self.v[i + 1]
+        frac = (level - v0) / (v1 - v0)
+        return self.t0 + (i + frac) * self.dt
+
+    @_memoised
+    def _edges(self):
+        """Edges found with 20/80 % hysteresis, timed at the 50 % crossing
+
+        Returns:
+            dict: 'rise' and 'fall' arrays of edge times
+        """
+        lo, hi = self._level(0.2), self._level(0.8)
+        state = np.zeros(len(self.v), dtype=np.int8)
+        state[self.v <= lo] = -1
+        state[self.v >= hi] = 1
+
+        # hold the last state through the band between the thresholds
+        idx = np.where(state != 0, np.arange(len(state)), 0)
+        np.maximum.accumulate(idx, out=idx)
+        step = np.diff(state[idx])
+
+        # time each edge at the last 50 % crossing before it settled
+        mid = self._level(0.5)
+        settled = self.t0 + (np.flatnonzero(step == 2) + 1) * self.dt
+        rise = _last_before(self._cross(mid, True), settled)
+        settled = self.t0 + (np.flatnonzero(step == -2) + 1) * self.dt
+        fall = _last_before(self._cross(mid, False), settled)
+        return {'rise': rise[~np.isnan(rise)], 'fall': fall[~np.isnan(fall)]}
+
+    def _transition(self, lo, hi, rising):
+        """Durations between lo and hi level crossings of every edge
+
+        Args:
+            lo (float): lower level fraction
+            hi (float): upper level fraction
+            rising (bool): True for rising edges
+
+        Returns:
+            np.ndarray: durations in seconds
+        """
+        edges = self._edges['rise' if rising else 'fall']
+        t_lo = self._cross(self._level(lo), rising)
+        t_hi = self._cross(self._level(hi), rising)
+
+        # the last crossing of the first level before the 50 % point and the
+        # first crossing of the second level after it belong to the same edge
+        if rising:
+            duration = _next_after(t_hi, edges) - _last_before(t_lo, edges)
+        else:
+            duration = _next_after(t_lo, edges) - _last_before(t_hi, edges)
+        return duration[~np.isnan(duration)]
+
+    @_memoised
+    def _periods(self):
+        rise = self._edges['rise']
+        if len(rise) >= 2:
+            return np.diff(rise)
+        return np.diff(self._edges['fall'])
+
+    @_memoised
+    def _cycle(self):
+        """Volts of the whole number of periods between the first and last
+        rising edge, or the whole record if there is less than one period"""
+        rise = self._edges['rise']
+        if len(rise) < 2:
+            return self.v
+        i0 = int(np.ceil((rise[0] - self.t0) / self.dt))
+        i1 = int(np.ceil((rise[-1] - self.t0) / self.dt))
+        return self.v[i0:i1]
+
+    @_memoised
+    def _ac(self):
+        return self.v - self.v.mean()
+
+    def _ref_edges(self):
+        if self.ref is None:
+            return None
+        return self.ref._edges
+
+    # vertical items
+    def vmax(self):
+        return self.v.max()
+
+    def vmin(self):
+        return self.v.min()
+
+    def pkpk(self):
+        return self.v.max() - self.v.min()
+
+    def top(self):
+        return self._levels[1]
+
+    def base(self):
+        return self._levels[0]
+
+    def ampl(self):
+        return self._levels[1] - self._levels[0]
+
+    def levelx(self):
+        """Volts at the trigger position, t=0"""
+        x = -self.t0 / self.dt
+        if not 0 <= x <= len(self.v) - 1:
+            return np.nan
+        return np.interp(x, np.arange(len(self.v)), self.v)
+
+    def mean(self):
+        return self.v.mean()
+
+    def cmean(self):
+        return self._cycle.mean()
+
+    def stdev(self):
+        return self.v.std()
+
+    def vstd(self):
+        return self._cycle.std()
+
+    def rms(self):
+        return np.sqrt(np.mean(np.square(self.v)))
+
+    def crms(self):
+        return np.sqrt(np.mean(np.square(self._cycle)))
+
+    def median(self):
+        return np.median(self.v)
+
+    def cmedian(self):
+        return np.median(self._cycle)
+
+    def ovsp(self):
+        """Rising overshoot in %"""
+        return (self.v.max() - self.top()) / self.ampl() * 100
+
+    def fpre(self):
+        """Falling preshoot in %"""
+        return self._preshoot(rising=False)
+
+    def ovsn(self):
+        """Falling overshoot in %"""
+        return (self.base() - self.v.min()) / self.ampl() * 100
+
+    def rpre(self):
+        """Rising preshoot in %"""
+        return self._preshoot(rising=True)
+
+    def _preshoot(self, rising):
+        """Largest preshoot of all edges of one direction in %
+
+            The window of an edge is the second half of the time since the
+            previous opposite edge (or the record start), so the overshoot
+            of that edge is not counted.
+
+        Args:
+            rising (bool): True for rising edges
+
+        Returns:
+            float: nan without edges
+        """
+        edges = self._edges['rise' if rising else 'fall']
+        before = _last_before(self._edges['fall' if rising else 'rise'], edges)
+        before[np.isnan(before)] = self.t0
+        start = np.ceil(((before + edges) / 2 - self.t0) / self.dt)
+        stop = np.ceil((edges - self.t0) / self.dt)
+        ok = (start < stop) & (stop < len(self.v))
+        if not ok.any():
+            return np.nan
+
+        # even results of reduceat are the windows [start, stop)
+        bounds = np.column_stack([start[ok], stop[ok]]).astype(np.intp)
+        if rising:
+            low = np.minimum.reduceat(self.v, bounds.ravel())[::2].min()
+            return (self.base() - low) / self.ampl() * 100
+        high = np.maximum.reduceat(self.v, bounds.ravel())[::2].max()
+        return (high - self.top()) / self.ampl() * 100
+
+    # horizontal items
+    def per(self):
+        return _mean(self._periods)
+
+    def freq(self):
+        return 1 / self.per()
+
+    def tmax(self):
+        return self.t0 + self.v.argmax() * self.dt
+
+    def tmin(self):
+        return self.t0 + self.v.argmin() * self.dt
+
+    @_memoised
+    def _pulses(self):
+        """Widths of complete positive and negative pulses"""
+        rise, fall = self._edges['rise'], self._edges['fall']
+        pos = _next_after(fall, rise) - rise
+        neg = _next_after(rise, fall) - fall
+        return pos[~np.isnan(pos)], neg[~np.isnan(neg)]
+
+    def pwid(self):
+        return _mean(self._pulses[0])
+
+    def nwid(self):
+        return _mean(self._pulses[1])
+
+    def duty(self):
+        return self.pwid() / self.per() * 100
+
+    def nduty(self):
+        return self.nwid() / self.per() * 100
+
+    def wid(self):
+        """Positive burst width, first rising to last falling edge"""
+        return _last(self._edges['fall']) - _first(self._edges['rise'])
+
+    def nbwid(self):
+        """Negative burst width, first falling to last rising edge"""
+        return _last(self._edges['rise']) - _first(self._edges['fall'])
+
+    def delay(self):
+        """Time of the first edge relative to the trigger"""
+        first = [_first(self._edges['rise']), _first(self._edges['fall'])]
+        return np.nan if np.all(np.isnan(first)) else np.nanmin(first)
+
+    def timel(self):
+        """Time of the first rising 50 % crossing"""
+        return _first(self._edges['rise'])
+
+    def rise(self):
+        return _mean(self._transition(0.2, 0.8, True))
+
+    def fall(self):
+        return _mean(self._transition(0.2, 0.8, False))
+
+    def rise10t90(self):
+        return _mean(self._transition(0.1, 0.9, True))
+
+    def fall90t10(self):
+        return _mean(self._transition(0.1, 0.9, False))
+
+    def ccj(self):
+        """Cycle to cycle jitter, largest change between adjacent periods"""
+        p = self._periods
+        return np.abs(np.diff(p)).max() if len(p) > 1 else np.nan
+
+    def pslope(self):
+        return 0.6 * self.ampl() / self.rise()
+
+    def nslope(self):
+        return -0.6 * self.ampl() / self.fall()
+
+    # counters
+    def cycles(self):
+        return len(self._periods)
+
+    def redges(self):
+        return len(self._edges['rise'])
+
+    def fedges(self):
+        return len(self._edges['fall'])
+
+    def edges(self):
+        return self.redges() + self.fedges()
+
+    def ppulses(self):
+        return len(self._pulses[0])
+
+    def npulses(self):
+        return len(self._pulses[1])
+
+    # areas
+    def parea(self):
+        return np.sum(self.v, where=self.v > 0) * self.dt
+
+    def narea(self):
+        return np.sum(self.v, where=self.v < 0) * self.dt
+
+    def area(self):
+        return np.sum(self.v) * self.dt
+
+    def absarea(self):
+        return np.sum(np.abs(self.v)) * self.dt
+
+    def pacarea(self):
+        return np.sum(self._ac, where=self._ac > 0) * self.dt
+
+    def nacarea(self):
+        return np.sum(self._ac, where=self._ac < 0) * self.dt
+
+    def acarea(self):
+        return np.sum(self._ac) * self.dt
+
+    def absacarea(self):
+        return np.sum(np.abs(self._ac)) * self.dt
+
+    # two channel items, self is the source and ref the second channel
+    def _edge_delay(self, which_self, edge_self, which_ref, edge_ref):
+        ref = self._ref_edges()
+        if ref is None:
+            return np.nan
+        pick = {'first': _first, 'last': _last}
+        return (pick[which_ref](ref[edge_ref]) -
+                pick[which_self](self._edges[edge_self]))
+
+    def frr(self):
+        return self._edge_delay('first', 'rise', 'first', 'rise')
+
+    def frf(self):
+        return self._edge_delay('first', 'rise', 'first', 'fall')
+
+    def ffr(self):
+        return self._edge_delay('first', 'fall', 'first', 'rise')
+
+    def fff(self):
+        return self._edge_delay('first', 'fall', 'first', 'fall')
+
+    def lrr(self):
+        return self._edge_delay('first', 'rise', 'last', 'rise')
+
+    def lrf(self):
+        return self._edge_delay('first', 'rise', 'last', 'fall')
+
+    def lfr(self):
+        return self._edge_delay('first', 'fall', 'last', 'rise')
+
+    def lff(self):
+        return self._edge_delay('first', 'fall', 'last', 'fall')
+
+    def skew(self):
+        """Delay from each rising edge to the nearest following reference
+        rising edge, averaged"""
+        ref = self._ref_edges()
+        if ref is None:
+            return np.nan
+        rise = self._edges['rise']
+        return np.nanmean(_next_after(ref['rise'], rise) - rise) \
+            if len(rise) else np.nan
+
+    def pha(self):
+        """Phase of the reference relative to this trace in degrees"""
+        return self.skew() / self.per() * 360
+
+    def _setup(self, clock_edge):
+        """Setup time, data edge (self) before each reference clock edge"""
+        ref = self._ref_edges()
+        if ref is None:
+            return np.nan
+        data = np.sort(np.concatenate((self._edges['rise'],
+                                       self._edges['fall'])))
+        clock = ref[clock_edge]
+        return np.nanmean(clock - _last_before(data, clock)) \
+            if len(clock) and len(data) else np.nan
+
+    def _hold(self, clock_edge):
+        """Hold time, reference clock edge to the next data edge (self)"""
+        ref = self._ref_edges()
+        if ref is None:
+            return np.nan
+        data = np.sort(np.concatenate((self._edges['rise'],
+                                       self._edges['fall'])))
+        clock = ref[clock_edge]
+        return np.nanmean(_next_after(data, clock) - clock) \
+            if len(clock) and len(data) else np.nan
+
+    def tsr(self):
+        return self._setup('rise')
+
+    def tsf(self):
+        return self._setup('fall')
+
+    def thr(self):
+        return self._hold('rise')
+
+    def thf(self):
+        return self._hold('fall')
+
+
+def measure(volts, interval, items=None, t0=0.0, ref=None):
+    """Evaluate measurement items on an array of volts
+
+    Args:
+        volts (np.ndarray): 1-D array of volts
+        interval (float): sampling interval in seconds
+        items (list|None): item codes, see ITEMS. If None, all items
+        t0 (float): time of the first point in seconds
+        ref (np.ndarray|Measure|None): reference trace for two channel items,
+            same sampling as volts
+
+    Returns:
+        dict: {item: float}
+    """
+    if ref is not None and not isinstance(ref, Measure):
+        ref = Measure(ref, interval, t0=t0)
+    return Measure(volts, interval, t0=t0, ref=ref).measure(items)
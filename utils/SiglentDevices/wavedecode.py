@@ -0,0 +1,143 @@
+"""
+    Vectorized decoding of SDS5034 waveform data blocks
+
+    The scope answers WAV:DATA? with an IEEE 488.2 definite length block
+    (#9<nine digit length><data>\\n\\n). The data is either one byte per point
+    (8 bit ADC) or one little endian 16 bit word per point (10 bit ADC, left
+    aligned). These functions work directly on the received bytes with
+    np.frombuffer and dtype views so no python level loop touches the points.
+"""
+
+import numpy as np
+
+
+def block_data(raw):
+    """Strip the definite length block header and trailer from a raw response
+
+    Args:
+        raw (bytes|bytearray|memoryview): response as returned by read_raw
+
+    Returns:
+        memoryview: view of the data bytes, no copy is made
+    """
+    raw = memoryview(raw)
+    start = bytes(raw[:64]).find(b'#')
+    if start < 0:
+        raise RuntimeError('Waveform block header "#" not found in response')
+
+    ndigits = int(bytes(raw[start + 1:start + 2]))
+    length = int(bytes(raw[start + 2:start + 2 + ndigits]))
+    first = start + 2 + ndigits
+
+    return raw[first:first + length]
+
+
+def iter_blocks(raw):
+    """Split a response holding several definite length blocks
+
+        Used when several binary queries were sent in one message. Anything
+        between the blocks (separators, newlines) is skipped.
+
+    Args:
+        raw (bytes|bytearray|memoryview): response as returned by read_raw
+
+    Yields:
+        memoryview: data bytes of each block, no copy is made
+    """
+    raw = memoryview(raw)
+    pos = 0
+    while True:
+        start = bytes(raw[pos:pos + 64]).find(b'#')
+        if start < 0:
+            return
+        start += pos
+
+        ndigits = int(bytes(raw[start + 1:start + 2]))
+        length = int(bytes(raw[start + 2:start + 2 + ndigits]))
+        first = start + 2 + ndigits
+
+        yield raw[first:first + length]
+        pos = first + length
+
+
+def decode_codes(data, nbits, byteorder='<'):
+    """Convert transferred bytes to signed ADC codes
+
+    Args:
+        data (bytes|bytearray|memoryview|np.ndarray): waveform data bytes
+            without block header
+        nbits (int): ADC resolution as reported by get_adc_resolution (8|10)
+        byteorder (str): '<' for LSB first (scope default), '>' for MSB first
+
+    Returns:
+        np.ndarray: int8 codes for 8 bit data, int16 codes for 10 bit data
+    """
+    if nbits > 8:
+        words = np.frombuffer(data, dtype=f'{byteorder}i2')
+
+        # samples are left aligned in the 16 bit word: an arithmetic shift
+        # drops the unused low bits and sign extends in one step
+        return (words >> (16 - nbits)).astype(np.int16, copy=False)
+
+    return np.frombuffer(data, dtype=np.int8)
+
+
+def codes_to_volts(codes, nbits, code_per_div, v_per_div, v_offset, out=None):
+    """Scale signed ADC codes to volts
+
+    Args:
+        codes (np.ndarray): signed codes from decode_codes
+        nbits (int): ADC resolution (8|10)
+        code_per_div (float): preamble code_per_div
+        v_per_div (float): preamble v_per_div
+        v_offset (float): preamble v_offset
+        out (np.ndarray|None): optional float64 output array
+
+    Returns:
+        np.ndarray: voltages as float64
+    """
+    # 10 bit codes are expressed in 8 bit units by the scope preamble
+    gain = v_per_div / code_per_div
+    if nbits == 10:
+        gain /= 4
+
+    out = np.multiply(codes, gain, out=out, dtype=np.float64)
+    out -= v_offset
+    return out
+
+
+def decode_volts(data, nbits, preamble, byteorder='<'):
+    """Convert transferred bytes straight to volts using a preamble
+
+    Args:
+        data (bytes|bytearray|memoryview|np.ndarray): waveform data bytes
+            without block header
+        nbits (int): ADC resolution (8|10)
+        preamble (dict): output of SDS5034.get_wave_preamble
+        byteorder (str): '<' for LSB first (scope default), '>' for MSB first
+
+    Returns:
+        np.ndarray: voltages as float64
+    """
+    codes = decode_codes(data, nbits, byteorder=byteorder)
+    return codes_to_volts(codes, nbits,
+                          code_per_div=preamble['code_per_div'],
+                          v_per_div=preamble['v_per_div'],
+                          v_offset=preamble['v_offset'])
+
+
+def time_axis(preamble, npts, hori_num=10, start=0):
+    """Timestamps of transferred points, relative to the trigger
+
+    Args:
+        preamble (dict): output of SDS5034.get_wave_preamble
+        npts (int): number of points
+        hori_num (int): number of horizontal divisions on screen
+        start (int): index of first point
+
+    Returns:
+        np.ndarray: times in seconds
+    """
+    t0 = -preamble['t_delay_s'] - (preamble['t_per_div'] * hori_num / 2)
+    idx = np.arange(start, start + npts, dtype=np.float64)
+    return t0 + idx * preamble['sample_interval']
@@ -0,0 +1,396 @@
+"""
+    Binary persistence of oscilloscope captures
+
+    Every capture gets its own directory below the store root, named by a
+    unique capture id:
+
+        <root>/<capture_id>/meta.json   preambles, adc bits, channels, time
+        <root>/<capture_id>/C1.npy      signed raw ADC codes of channel 1
+        ...
+
+    Codes are stored as int8 (8 bit) or int16 (10 bit) .npy arrays, so they can
+    be memory mapped later and converted to volts with the saved preamble.
+    CSV export is only done on demand, streamed in blocks.
+
+    Example, pulling a 1 ms window out of a large capture:
+
+        store = WaveStore()
+        cap = store.open(store.list_captures()[-1])
+        t, v = cap['C1'].window(0, 1e-3)
+"""
+
+import datetime
+import json
+import os
+import uuid
+
+import numpy as np
+
+from . import measure
+from . import wavedecode
+
+
+class WaveStore(object):
+    """Save and load waveform captures as raw codes plus preamble metadata
+
+        Attributes:
+
+            root (str): directory holding one sub directory per capture
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, root='captures'):
+        """ Init.
+
+        Args:
+            root (str): directory holding the captures, created when needed
+        """
+        self.root = root
+
+    @staticmethod
+    def new_id():
+        """Returns:
+            str: unique capture id, sortable by creation time
+        """
+        now = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return f'{now}-{uuid.uuid4().hex[:8]}'
+
+    def path(self, capture_id, name=''):
+        """Args:
+            capture_id (str): capture id
+            name (str): file name inside the capture directory
+
+        Returns:
+            str: path of the capture directory or file
+        """
+        return os.path.join(self.root, capture_id, name)
+
+    def save(self, channels, nbits, hori_num=10, start_pt=0, capture_id=None,
+             **extra):
+        """Save one capture
+
+        Args:
+            channels (dict): {'C1': (codes, preamble), ...} where codes are the
+                signed ADC codes of wavedecode.decode_codes
+            nbits (int): ADC resolution (8|10)
+            hori_num (int): number of horizontal divisions on screen
+            start_pt (int): index of the first transferred point
+            capture_id (str|None): id to use, if None a new one is made
+            extra: additional json serializable metadata
+
+        Returns:
+            str: capture id
+        """
+        if capture_id is None:
+            capture_id = self.new_id()
+        os.makedirs(self.path(capture_id), exist_ok=True)
+
+        meta = {
+            'capture_id': capture_id,
+            'created': datetime.datetime.now().isoformat(),
+            'adc_bits': int(nbits),
+            'hori_num': hori_num,
+            'start_pt': int(start_pt),
+            'channels': {},
+        }
+        meta.update(extra)
+
+        for name, (codes, preamble) in channels.items():
+            np.save(self.path(capture_id, f'{name}.npy'), codes,
+                    allow_pickle=False)
+            meta['channels'][name] = {
+                'dtype': str(codes.dtype),
+                'shape': list(codes.shape),
+                'preamble': preamble,
+            }
+
+        with open(self.path(capture_id, self.META_FILE), 'w') as fid:
+            json.dump(meta, fid, indent=1)
+
+        return capture_id
+
+    def list_captures(self):
+        """Returns:
+            list: capture ids in the store, oldest first
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            d for d in os.listdir(self.root)
+            if os.path.isfile(self.path(d, self.META_FILE)))
+
+    def meta(self, capture_id):
+        """Args:
+            capture_id (str): capture id
+
+        Returns:
+            dict: capture metadata as written by save
+        """
+        with open(self.path(capture_id, self.META_FILE), 'r') as fid:
+            return json.load(fid)
+
+    def load_codes(self, capture_id, name):
+        """Args:
+            capture_id (str): capture id
+            name (str): channel name, e.g. 'C1'
+
+        Returns:
+            np.ndarray: signed raw ADC codes, fully loaded
+        """
+        return np.load(self.path(capture_id, f'{name}.npy'),
+                       allow_pickle=False)
+
+    def open(self, capture_id):
+        """Open a capture for reading without loading it into memory
+
+        Args:
+            capture_id (str): capture id
+
+        Returns:
+            WaveCapture: memory mapped capture
+        """
+        return WaveCapture(self, capture_id)
+
+    def export_csv(self, capture_id, filename=None, block=1_000_000):
+        """Stream a capture to a csv file of time and volts per channel
+
+            The file is written block by block, so the whole capture is never
+            converted to text in memory at once. Frames of a sequence capture
+            are stacked, with the frame number in a first 'frame' column.
+
+        Args:
+            capture_id (str): capture id
+            filename (str|None): output file, default <capture dir>/data.csv
+            block (int): number of points converted per write
+
+        Returns:
+            str: output file name
+        """
+        meta = self.meta(capture_id)
+        if filename is None:
+            filename = self.path(capture_id, 'data.csv')
+
+        names = list(meta['channels'])
+        codes = [
+            np.load(self.path(capture_id, f'{name}.npy'), mmap_mode='r')
+            for name in names
+        ]
+        preambles = [meta['channels'][name]['preamble'] for name in names]
+        # frames x points, a single frame for normal captures
+        sequence = codes[0].ndim == 2
+        codes = [c if sequence else c[np.newaxis] for c in codes]
+        nframes = min(c.shape[0] for c in codes)
+        npts = min(c.shape[1] for c in codes)
+
+        header = ['time_s'] + names
+        if sequence:
+            header.insert(0, 'frame')
+
+        with open(filename, 'w', newline='') as fid:
+            fid.write(','.join(header) + '\n')
+
+            for frame in range(nframes):
+                for start in range(0, npts, block):
+                    stop = min(start + block, npts)
+                    cols = [np.full(stop - start, frame)] if sequence else []
+                    cols.append(
+                        wavedecode.time_axis(preambles[0], stop - start,
+                                             hori_num=meta['hori_num'],
+                                             start=meta['start_pt'] + start))
+                    for c, pre in zip(codes, preambles):
+                        cols.append(
+                            wavedecode.codes_to_volts(c[frame, start:stop],
+                                                      meta['adc_bits'],
+                                                      pre['code_per_div'],
+                                                      pre['v_per_div'],
+                                                      pre['v_offset']))
+                    np.savetxt(fid, np.column_stack(cols), delimiter=',',
+                               fmt='%.9g')
+
+        return filename
+
+
+class WaveCapture(object):
+    """Read access to a stored capture, channels are memory mapped on demand
+
+        Attributes:
+
+            capture_id (str): capture id
+            meta (dict): capture metadata as written by WaveStore.save
+    """
+
+    def __init__(self, store, capture_id):
+        """ Init.
+
+        Args:
+            store (WaveStore): store holding the capture
+            capture_id (str): capture id
+        """
+        self.capture_id = capture_id
+        self.meta = store.meta(capture_id)
+        self._store = store
+        self._channels = {}
+
+    @property
+    def channels(self):
+        """list: names of the stored channels"""
+        return list(self.meta['channels'])
+
+    def __contains__(self, name):
+        return name in self.meta['channels']
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __getitem__(self, name):
+        """Args:
+            name (str|int): channel name ('C1') or number (1)
+
+        Returns:
+            WaveChannel: memory mapped channel
+        """
+        if isinstance(name, int):
+            name = f'C{name}'
+        if name not in self._channels:
+            info = self.meta['channels'][name]
+            path = self._store.path(self.capture_id, f'{name}.npy')
+            self._channels[name] = WaveChannel(path, info['preamble'],
+                                               self.meta['adc_bits'],
+                                               self.meta['hori_num'],
+                                               self.meta['start_pt'])
+        return self._channels[name]
+
+
+class WaveChannel(object):
+    """One memory mapped channel of a stored capture
+
+        Indexing converts only the selected points to volts:
+
+            ch[1000:2000]           volts of points 1000 to 1999
+            ch.window(t0, t1)       times and volts between t0 and t1 seconds
+            ch.measure(['PKPK'])    host side measurements, see measure.py
+
+        For sequence captures codes are 2-D (frames x points) and indexing by
+        time applies to the points of every frame.
+
+        Attributes:
+
+            codes (np.memmap): signed raw ADC codes, read only
+            interval (float): sampling interval in seconds
+            nbits (int): ADC resolution
+            preamble (dict): scope preamble saved with the capture
+            t0 (float): time of the first stored point in seconds
+    """
+
+    def __init__(self, path, preamble, nbits, hori_num=10, start_pt=0):
+        """ Init.
+
+        Args:
+            path (str): path of the .npy file of codes
+            preamble (dict): scope preamble saved with the capture
+            nbits (int): ADC resolution (8|10)
+            hori_num (int): number of horizontal divisions on screen
+            start_pt (int): index of the first transferred point
+        """
+        self.codes = np.load(path, mmap_mode='r', allow_pickle=False)
+        self.preamble = preamble
+        self.nbits = nbits
+        self.interval = preamble['sample_interval']
+        self.t0 = wavedecode.time_axis(preamble, 1, hori_num=hori_num,
+                                       start=start_pt)[0]
+
+    def __len__(self):
+        return self.codes.shape[-1]
+
+    def __getitem__(self, key):
+        """Convert selected codes to volts
+
+        Args:
+            key: any numpy index into the codes
+
+        Returns:
+            np.ndarray: volts as float64
+        """
+        return self.to_volts(self.codes[key])
+
+    @property
+    def duration(self):
+        """float: time span of the stored points in seconds"""
+        return len(self) * self.interval
+
+    def to_volts(self, codes):
+        """Args:
+            codes (np.ndarray): signed ADC codes of this channel
+
+        Returns:
+            np.ndarray: volts as float64
+        """
+        return wavedecode.codes_to_volts(codes, self.nbits,
+                                         self.preamble['code_per_div'],
+                                         self.preamble['v_per_div'],
+                                         self.preamble['v_offset'])
+
+    def index(self, t):
+        """Args:
+            t (float): time in seconds, relative to the trigger
+
+        Returns:
+            int: index of the first point at or after t, clipped to the record
+        """
+        i = int(np.ceil((t - self.t0) / self.interval - 1e-9))
+        return min(max(i, 0), len(self))
+
+    def times(self, start=0, stop=None):
+        """Args:
+            start (int): first point index
+            stop (int|None): index after the last point, default end of record
+
+        Returns:
+            np.ndarray: times of the points in seconds
+        """
+        if stop is None:
+            stop = len(self)
+        return self.t0 + np.arange(start, stop) * self.interval
+
+    def window(self, t_start=None, t_stop=None, frame=None):
+        """Read the points of a time window
+
+        Args:
+            t_start (float|None): window start in seconds, default record start
+            t_stop (float|None): window end in seconds (excluded), default
+                record end
+            frame (int|None): frame of a sequence capture, None for all
+
+        Returns:
+            tuple: (times, volts) as np.ndarray
+        """
+        start = 0 if t_start is None else self.index(t_start)
+        stop = len(self) if t_stop is None else self.index(t_stop)
+        stop = max(start, stop)
+        if frame is None:
+            return self.times(start, stop), self[..., start:stop]
+        return self.times(start, stop), self[frame, start:stop]
+
+    def measure(self, items=None, t_start=None, t_stop=None, ref=None,
+                frame=None):
+        """Compute measurement items on a time window of this channel
+
+        Args:
+            items (list|None): item codes, see measure.ITEMS. If None, all items
+            t_start (float|None): window start in seconds
+            t_stop (float|None): window end in seconds
+            ref (WaveChannel|None): second channel for PHA, SKEW, FRR, ...
+            frame (int|None): frame of a sequence capture, required for those
+                and also used for a sequence ref
+
+        Returns:
+            dict: {item: float}
+        """
+        if ref is not None:
+            ref = measure.Measure.from_channel(
+                ref, t_start, t_stop,
+                frame=frame if ref.codes.ndim == 2 else None)
+        m = measure.Measure.from_channel(self, t_start, t_stop, ref=ref,
+                                         frame=frame)
+        return m.measure(items)
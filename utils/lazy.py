@@ -0,0 +1,88 @@
+"""
+    Deferred imports of heavy or optional dependencies
+
+    lazy_import returns a stand-in module that imports the real one on first
+    attribute access, so the server starts without loading numpy, pandas,
+    pyvisa or vendor libraries, and a missing library only breaks the
+    endpoints that use it.
+
+        pd = lazy_import('pandas')
+        ...
+        pd.read_csv(path)  # pandas is imported here
+"""
+
+import importlib
+import sys
+import threading
+import types
+
+_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports the named module on first use
+
+        Attributes:
+
+            __name__ (str): full name of the module to import
+    """
+
+    def __init__(self, name):
+        """ Init.
+
+        Args:
+            name (str): full name of the module, e.g. 'pydasrmt.Command.CmdGeneratorCan'
+        """
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        """Import the module once
+
+        Returns:
+            module: the real module
+
+        Raises:
+            ImportError: if the module or one of its dependencies is missing,
+                raised again on every use
+        """
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with _lock:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    @property
+    def loaded(self):
+        """bool: True once the module has been imported"""
+        return self.__dict__['_lazy_module'] is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<lazy module {self.__name__!r} ({state})>'
+
+
+def lazy_import(name):
+    """Return a module that is only imported when first used
+
+        If the module is already imported, it is returned as is.
+
+    Args:
+        name (str): full module name, e.g. 'pandas' or 'utils.SiglentDevices'
+
+    Returns:
+        module or LazyModule
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -0,0 +1,252 @@
+"""
+    Registry of live instrument connections shared by all blueprints
+
+    Connections are keyed by kind ('oscilloscope', 'itech', ...) and address
+    (VISA resource string or IP), so several benches can be driven from one
+    server and a repeated /connect reuses the open connection. Every session
+    has its own lock, held while a request talks to the instrument, and
+    sessions unused for idle_timeout seconds are closed by a daemon thread.
+
+        sess = sessions.open('oscilloscope', ip, lambda: SDS5034(ip))
+        with sessions.find('oscilloscope') as scope:
+            scope.run()
+"""
+
+import threading
+import time
+
+
+def _resource(device):
+    """VISA resource wrapped by a driver (FuncGen._inst, SiglentBase.sds),
+    or the device itself"""
+    for name in ('_inst', 'sds'):
+        resource = getattr(device, name, None)
+        if resource is not None:
+            return resource
+    return device
+
+
+class Session(object):
+    """One open instrument connection
+
+        Use as a context manager to hold the lock while talking to the device:
+
+            with session as device:
+                device.write(...)
+
+        Attributes:
+
+            kind (str): instrument kind, e.g. 'oscilloscope'
+            address (str): VISA address or IP
+            device: driver or pyvisa resource
+            lock (threading.RLock): serializes access to the device
+            last_used (float): time.monotonic() of the last use
+            close_hooks (dict): name -> callable run without arguments before
+                the device is closed, e.g. to stop a thread using it
+    """
+
+    def __init__(self, kind, address, device):
+        """ Init.
+
+        Args:
+            kind (str): instrument kind
+            address (str): VISA address or IP
+            device: opened driver or pyvisa resource
+        """
+        self.kind = kind
+        self.address = address
+        self.device = device
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        self.close_hooks = {}
+
+    def touch(self):
+        """Mark the session as used now"""
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Close the device, errors of an already dropped link are ignored
+
+            The close hooks run first, without the lock, so threads waiting
+            for it can finish.
+        """
+        for hook in list(self.close_hooks.values()):
+            try:
+                hook()
+            except Exception:
+                pass
+        with self.lock:
+            try:
+                self.device.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.touch()
+        return self.device
+
+    def __exit__(self, *args):
+        self.touch()
+        self.lock.release()
+
+
+class SessionManager(object):
+    """Open, share and evict instrument sessions
+
+        Attributes:
+
+            idle_timeout (float): seconds without use before a session is closed
+            reap_interval (float): seconds between idle checks
+    """
+
+    def __init__(self, idle_timeout=600, reap_interval=30):
+        """ Init.
+
+        Args:
+            idle_timeout (float): seconds without use before a session is
+                closed, None to keep sessions forever
+            reap_interval (float): seconds between idle checks
+        """
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+
+        self._sessions = {}
+        self._defaults = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def open(self, kind, address, factory):
+        """Return the session of an address, connecting on first use
+
+            The session also becomes the default of its kind.
+
+        Args:
+            kind (str): instrument kind
+            address (str): VISA address or IP
+            factory (callable): called without arguments to connect, returns
+                the device
+
+        Returns:
+            Session
+        """
+        key = (kind, address)
+        with self._lock:
+            session = self._sessions.get(key)
+
+        # connect without blocking other sessions, the first one wins a race
+        if session is None:
+            new = Session(kind, address, factory())
+            with self._lock:
+                session = self._sessions.setdefault(key, new)
+            # drivers may share one cached VISA resource, keep it open then
+            if session is not new and \
+                    _resource(new.device) is not _resource(session.device):
+                new.close()
+
+        with self._lock:
+            session.touch()
+            self._defaults[kind] = address
+            self._start_reaper()
+        return session
+
+    def find(self, kind, address=None):
+        """Return an open session
+
+        Args:
+            kind (str): instrument kind
+            address (str|None): VISA address or IP. If None, the last
+                connected address of this kind
+
+        Returns:
+            Session
+        """
+        with self._lock:
+            if address is None:
+                address = self._defaults.get(kind)
+            session = self._sessions.get((kind, address))
+        if session is None:
+            if address is None:
+                raise RuntimeError(f'No {kind} connected')
+            raise RuntimeError(f'No {kind} connected at {address}')
+        return session
+
+    def close(self, kind, address=None):
+        """Close and forget a session, nothing is done if it is not open
+
+        Args:
+            kind (str): instrument kind
+            address (str|None): VISA address or IP, None for the default
+        """
+        with self._lock:
+            if address is None:
+                address = self._defaults.get(kind)
+            session = self._sessions.pop((kind, address), None)
+            if self._defaults.get(kind) == address:
+                del self._defaults[kind]
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        """Close every session"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._defaults.clear()
+        for session in sessions:
+            session.close()
+
+    def list(self):
+        """Returns:
+            list: (kind, address) of all open sessions
+        """
+        with self._lock:
+            return list(self._sessions)
+
+    def reap(self):
+        """Close sessions idle for longer than idle_timeout
+
+            Sessions in use (lock held) are skipped.
+
+        Returns:
+            list: (kind, address) of the closed sessions
+        """
+        if self.idle_timeout is None:
+            return []
+
+        now = time.monotonic()
+        closed = []
+        with self._lock:
+            for key, session in list(self._sessions.items()):
+                if now - session.last_used < self.idle_timeout:
+                    continue
+                if not session.lock.acquire(blocking=False):
+                    continue
+                try:
+                    del self._sessions[key]
+                    if self._defaults.get(key[0]) == key[1]:
+                        del self._defaults[key[0]]
+                    closed.append(session)
+                finally:
+                    session.lock.release()
+
+        for session in closed:
+            session.close()
+        return [(s.kind, s.address) for s in closed]
+
+    def _start_reaper(self):
+        """Start the idle check thread, called with self._lock held"""
+        if self._reaper is not None or self.idle_timeout is None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.reap_interval)
+                self.reap()
+
+        self._reaper = threading.Thread(target=loop, daemon=True)
+        self._reaper.start()
+
+
+# shared by all blueprints
+sessions = SessionManager()
@@ -5,11 +5,23 @@
 """
 
 import copy
+import hashlib
+import json
+import os
+import threading
+import time
 import pyvisa
 import numpy as np
 from typing import Tuple, List, Union
 
+try:
+    from ..visa_manager import visa_manager
+except ImportError:  # used as a stand-alone module, see ttss.py
+    visa_manager = None
+
 _VISA_ADDRESS = "USB0::0x0699::0x0353::1731975::INSTR"
+_WAVEFORM_CACHE_PATH = os.path.join(os.path.expanduser("~"),
+                                    ".tektronix_func_gen_waveforms.json")
 
 
 def _SI_prefix_to_factor(unit):
@@ -49,6 +61,148 @@ class NotCompatibleError(Exception):
     """Error for when the instrument is not compatible with this module"""
 
 
+## ~~~~~~~~~~~~~~~~~~~~~~~~ WAVEFORM CACHE CLASS ~~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
+
+
+class WaveformCache:
+    """Index of which arbitrary waveform is stored in which USER memory
+    location, kept in a small JSON file so it survives between sessions
+
+    Waveforms are identified by the SHA-1 of their normalised big-endian
+    uint16 data. When all locations are taken, the least recently used
+    one is reused. Use times of cache hits are only kept in memory and
+    written with the next change of the index or `flush`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON index file, shared by several instruments
+    instrument_id : str
+        `*IDN?` response of the instrument, key of its entries in the file
+    memory_nums : iterable of int
+        The user memory locations the cache may use
+
+    Attributes
+    ----------
+    _entries : dict
+        Memory location (int) -> {"hash", "length", "used"}
+    """
+
+    def __init__(self, path: str, instrument_id: str, memory_nums):
+        self.path = path
+        """str: Path of the JSON index file"""
+        self.instrument_id = instrument_id
+        """str: Key of this instrument in the index file"""
+        self.memory_nums = list(memory_nums)
+        """list of int: User memory locations managed by the cache"""
+        self._entries = None  # loaded on first use
+        self._dirty = False  # use times not yet written
+
+    @staticmethod
+    def hash(waveform: np.ndarray) -> str:
+        """SHA-1 hex digest of a normalised waveform"""
+        data = np.asarray(waveform).astype(">u2").tobytes()
+        return hashlib.sha1(data).hexdigest()
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path) as file:
+                    index = json.load(file)
+            except (OSError, ValueError):
+                index = {}
+            self._entries = {
+                int(num): entry
+                for num, entry in index.get(self.instrument_id, {}).items()
+            }
+        return self._entries
+
+    def _save(self):
+        try:
+            with open(self.path) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            index = {}
+        index[self.instrument_id] = {
+            str(num): entry for num, entry in sorted(self._entries.items())
+        }
+        # replace in one step so a crash never leaves half a file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(index, file, indent=1)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def find(self, key: str) -> Union[int, None]:
+        """Memory location holding the waveform with hash `key`, or `None`"""
+        for num, entry in self._load().items():
+            if entry["hash"] == key and num in self.memory_nums:
+                return num
+        return None
+
+    def choose(self, in_use: List[str]) -> int:
+        """Memory location to store a new waveform in
+
+        Parameters
+        ----------
+        in_use : list of str
+            Catalogue of the instrument, e.g. ["USER0", "USER3"]
+
+        Returns
+        -------
+        int
+            The first empty location, else the least recently used one
+
+        Raises
+        ------
+        RuntimeError
+            If all locations are in use and none of them holds a waveform
+            of the cache
+        """
+        entries = self._load()
+        for num in self.memory_nums:
+            if f"USER{num}" not in in_use and num not in entries:
+                return num
+        for num in self.memory_nums:
+            if f"USER{num}" not in in_use:
+                return num
+        cached = [num for num in self.memory_nums if num in entries]
+        if cached:
+            return min(cached, key=lambda num: entries[num]["used"])
+        raise RuntimeError("no free user memory")
+
+    def length(self, memory_num: int) -> int:
+        """Number of points of the waveform stored in USER<memory_num>"""
+        return self._load()[memory_num]["length"]
+
+    def store(self, memory_num: int, key: str, length: int):
+        """Record that USER<memory_num> now holds the waveform `key`"""
+        self._load()[memory_num] = {
+            "hash": key,
+            "length": int(length),
+            "used": time.time(),
+        }
+        self._save()
+
+    def touch(self, memory_num: int):
+        """Mark USER<memory_num> as used now, written lazily"""
+        self._load()[memory_num]["used"] = time.time()
+        self._dirty = True
+
+    def flush(self):
+        """Write use times of cache hits not yet saved"""
+        if self._dirty:
+            self._save()
+
+    def forget(self, memory_num: int = None):
+        """Drop the entry of a memory location, or all entries if `None`"""
+        if memory_num is None:
+            self._load().clear()
+        else:
+            self._load().pop(memory_num, None)
+        self._save()
+
+
 ## ~~~~~~~~~~~~~~~~~~~~~ FUNCTION GENERATOR CLASS ~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
 
 
@@ -76,6 +230,10 @@ class FuncGen:
         AFG1022, AFG1062, or AFG3022 limits, use their respecive model names as
         argument. Note that this might lead to unexpected behaviour for custom
         waveforms and 'MIN'/'MAX' keywords.
+    waveform_cache_path : str, default `None`
+        JSON file indexing the waveforms in the user memory locations, see
+        `set_custom_waveform_cached`. `None` uses
+        ~/.tektronix_func_gen_waveforms.json
 
     Attributes
     ----------
@@ -131,6 +289,7 @@ class FuncGen:
         verify_param_set: bool = False,
         override_compatibility: str = "",
         verbose: bool = True,
+        waveform_cache_path: str = None,
     ):
         self._override_compat = override_compatibility
         self._visa_address = visa_address
@@ -140,6 +299,12 @@ class FuncGen:
         """bool: Choose whether to print information such as model upon connecting etc"""
         self.open(visa_address, timeout)
         self._initialise_model_properties()
+        self.waveform_cache = WaveformCache(
+            waveform_cache_path or _WAVEFORM_CACHE_PATH,
+            self._id,
+            range(self._max_waveform_memory_user_locations + 1),
+        )
+        """`WaveformCache`: Which waveform is in which user memory location"""
         self.channels = (
             self._spawn_channel(1, impedance[0]),
             self._spawn_channel(2, impedance[1]),
@@ -158,12 +323,18 @@ class FuncGen:
         self.close()
 
     def __del__(self):
-        self.close()
+        # a resource of visa_manager may be shared with other drivers, it is
+        # only released by an explicit close
+        if visa_manager is None:
+            self.close()
 
     def open(self, visa_address: str, timeout: int):
         try:
-            rm = pyvisa.ResourceManager()
-            self._inst = rm.open_resource(visa_address)
+            if visa_manager is not None:
+                self._inst = visa_manager.open(visa_address)
+            else:
+                rm = pyvisa.ResourceManager()
+                self._inst = rm.open_resource(visa_address)
         except pyvisa.Error:
             print(f"\nVisaError: Could not connect to '{visa_address}'")
             raise
@@ -183,9 +354,22 @@ class FuncGen:
                   f"serial {self._serial}")
 
     def close(self):
-        """Close the connection to the instrument"""
+        """Close the connection to the instrument
+
+        A resource opened through `visa_manager` is released there, so the
+        next user of the address gets a fresh one
+        """
+        cache = getattr(self, "waveform_cache", None)
+        if cache is not None:
+            try:
+                cache.flush()
+            except OSError:
+                pass
         if self._is_connected:
-            self._inst.close()
+            if visa_manager is not None:
+                visa_manager.close(self._visa_address)
+            else:
+                self._inst.close()
             self._is_connected = False
 
     @property
@@ -505,6 +689,34 @@ class FuncGen:
         """
         self.write(":PHAS:INIT", custom_err_message="syncronise waveforms")
 
+    def sweep(self,
+              points: List[tuple],
+              channel: int = 1,
+              repeat: int = 1,
+              lock=None) -> "Sweep":
+        """Start stepping the frequency and duty cycle of a channel through
+        `points` in a background thread, see `Sweep`
+
+        Parameters
+        ----------
+        points : list of tuples
+            (frequency in Hz, duty cycle in % or `None`, dwell in seconds),
+            see `sweep_range` for linear and logarithmic sweeps
+        channel : int {1, 2}, default 1
+        repeat : int, default 1
+            Number of passes through the points, 0 to repeat until stopped
+        lock : context manager, default `None`
+            Held while writing a step, use it to share the instrument
+
+        Returns
+        -------
+        `Sweep`
+            The running sweep, use `progress()` and `stop()`
+        """
+        sweep = Sweep(self.channels[channel - 1], points, repeat, lock)
+        sweep.start()
+        return sweep
+
     def get_frequency_lock(self) -> bool:
         """Check if frequency lock is enabled
 
@@ -545,6 +757,9 @@ class FuncGen:
         cmd = f"SOURCE{use_channel}:FREQuency:CONCurrent {state}"
         msg = f"turn frequency lock {state}"
         self.write(cmd, custom_err_message=msg)
+        # the locked channel follows the other one
+        for ch in self.channels:
+            ch.invalidate_shadow("frequency")
 
     def software_trig(self):
         """NOT TESTED: sends a trigger signal to the device
@@ -644,19 +859,8 @@ class FuncGen:
             raise ValueError(
                 f"The memory location {memory_num} is not a valid "
                 "memory location for this model")
-        # Check if waveform data is suitable
+        waveform = self._prepare_waveform(waveform, print_progress)
         if print_progress:
-            print("Check if waveform data is suitable..", end=" ")
-        self._check_arb_waveform_length(waveform)
-        try:
-            self._check_arb_waveform_type_and_range(waveform)
-        except ValueError as err:
-            if print_progress:
-                print(f"\n  {err}")
-                print("Trying again normalising the waveform..", end=" ")
-            waveform = self._normalise_to_waveform(waveform)
-        if print_progress:
-            print("ok")
             print("Transfer waveform to function generator..", end=" ")
         # Transfer waveform
         self._inst.write_binary_values("DATA:DATA EMEMory,",
@@ -675,6 +879,8 @@ class FuncGen:
         if print_progress:
             print("ok")
             print(f"Copy waveform to USER{memory_num}..", end=" ")
+        # the location is in an unknown state until the copy is verified
+        self.waveform_cache.forget(memory_num)
         self.write(f"DATA:COPY USER{memory_num},EMEMory")
         if print_progress:
             print("ok")
@@ -693,6 +899,132 @@ class FuncGen:
                         f"USER{memory_num} does not contain the waveform")
             else:
                 raise RuntimeError(f"USER{memory_num} is empty")
+        self.waveform_cache.store(memory_num, WaveformCache.hash(waveform),
+                                  len(waveform))
+        return waveform
+
+    def set_custom_waveform_cached(
+        self,
+        waveform: np.ndarray,
+        memory_num: int = None,
+        channel: int = None,
+        verify: bool = True,
+        check_contents: bool = False,
+        print_progress: bool = False,
+    ) -> int:
+        """Make a waveform available in user memory, transferring it only if
+        it is not already stored in one of the user memory locations
+
+        The waveform is looked up in `waveform_cache` by the hash of its
+        normalised data. On a hit nothing is transferred, or the waveform is
+        copied on the instrument with `DATA:COPY` if it is wanted in another
+        location. On a miss it is transferred with `set_custom_waveform` to
+        `memory_num`, or to an empty or the least recently used location.
+
+        Parameters
+        ----------
+        waveform : ndarray
+            Unnormalised arbitrary waveform or ints spanning the resolution
+            of the function generator
+        memory_num : int {0,...,255}, default `None`
+            User memory location to use, `None` to let the cache choose
+        channel : int {1, 2}, default `None`
+            If given, set the function of this channel to the user memory
+            location (not written if already selected)
+        verify : bool, default `True`
+            Verify transferred waveforms
+        check_contents : bool, default `False`
+            Read a cached location back and check the hash of its data, so a
+            waveform edited from the front panel is transferred again. By
+            default a hit is only checked against the catalogue and the
+            number of points (`DATA:POINts?`)
+        print_progress : bool, default `False`
+
+        Returns
+        -------
+        memory_num : int
+            The user memory location holding the waveform
+
+        Raises
+        ------
+        RuntimeError
+            If `memory_num` is `None` and there is no free user memory
+        """
+        waveform = self._prepare_waveform(waveform, print_progress)
+        key = WaveformCache.hash(waveform)
+        catalogue = self.get_waveform_catalogue()
+        cached = self.waveform_cache.find(key)
+        stale = None
+        # the memory may have been changed from the front panel
+        if cached is not None and (
+                f"USER{cached}" not in catalogue
+                or int(self.query(f"DATA:POINts? USER{cached}"))
+                != self.waveform_cache.length(cached)):
+            self.waveform_cache.forget(cached)
+            stale, cached = cached, None
+        in_ememory = False
+        if cached is not None and check_contents:
+            self.write(f"DATA:COPY EMEMory,USER{cached}")
+            in_ememory = True
+            stored = self._inst.query_binary_values(
+                "DATA:DATA? EMEMory",
+                datatype="H",
+                is_big_endian=True,
+                container=np.ndarray,
+            )
+            if WaveformCache.hash(stored) != key:
+                self.waveform_cache.forget(cached)
+                stale, cached = cached, None
+        if cached is None:
+            if memory_num is None:
+                # a stale location of the cache is overwritten in place
+                memory_num = stale if stale is not None else \
+                    self.waveform_cache.choose(catalogue)
+            self.set_custom_waveform(waveform,
+                                     normalise=False,
+                                     memory_num=memory_num,
+                                     verify=verify,
+                                     print_progress=print_progress)
+        elif memory_num is None or memory_num == cached:
+            if print_progress:
+                print(f"Waveform already in USER{cached}")
+            memory_num = cached
+            self.waveform_cache.touch(memory_num)
+        else:
+            if print_progress:
+                print(f"Copy waveform from USER{cached} to USER{memory_num}")
+            if not in_ememory:
+                self.write(f"DATA:COPY EMEMory,USER{cached}")
+            self.write(f"DATA:COPY USER{memory_num},EMEMory")
+            self.waveform_cache.store(memory_num, key, len(waveform))
+            self.waveform_cache.touch(cached)
+        if channel is not None:
+            self.channels[channel - 1].set_function(f"USER{memory_num}")
+        return memory_num
+
+    def _prepare_waveform(self, waveform: np.ndarray,
+                          print_progress: bool = True) -> np.ndarray:
+        """Check the waveform and normalise it if it is not already ints
+        within the resolution of the function generator
+
+        Raises
+        ------
+        ValueError
+            If the waveform is not within the permitted length
+        """
+        # Check if waveform data is suitable
+        if print_progress:
+            print("Check if waveform data is suitable..", end=" ")
+        self._check_arb_waveform_length(waveform)
+        try:
+            self._check_arb_waveform_type_and_range(waveform)
+        except ValueError as err:
+            if print_progress:
+                print(f"\n  {err}")
+                print("Trying again normalising the waveform..", end=" ")
+            waveform = self._normalise_to_waveform(waveform)
+        if print_progress:
+            print("ok")
         return waveform
 
     def _normalise_to_waveform(self, shape: np.ndarray) -> np.ndarray:
@@ -866,6 +1198,10 @@ class FuncGenChannel:
         self.channel_limits = copy.deepcopy(self._fgen.instrument_limits)
         """Channel limits for the individual channel, same form as
         `FuncGen.instrument_limits`"""
+        self._shadow = {}
+        """dict: Last known output, function, amplitude (Vpp), offset (V),
+        frequency (Hz) and duty (%). Seeded by `get_settings`, kept up to
+        date by the set functions, which skip values already in effect"""
 
     def _impedance_dependent_limit(self, limit_type: str) -> bool:
         """Check if the limit type is impedance dependent (voltages) or
@@ -986,35 +1322,167 @@ class FuncGenChannel:
                     f"current set minimum ({current_min}{unit})")
         return False
 
+    # Shadow of the channel state
+    def invalidate_shadow(self, *keys: str):
+        """Forget shadowed settings so the next set function writes them,
+        use after changing the instrument from the front panel
+
+        Parameters
+        ----------
+        *keys : str
+            Settings to forget, any of output, function, amplitude, offset,
+            frequency, duty. All settings if none are given
+        """
+        if keys:
+            for key in keys:
+                self._shadow.pop(key, None)
+        else:
+            self._shadow.clear()
+
+    def _shadowed(self, key: str, getter) -> Union[str, float]:
+        """Shadowed value of a setting, queried with `getter` if not known"""
+        if key not in self._shadow:
+            getter()  # the get functions update the shadow
+        return self._shadow[key]
+
+    @staticmethod
+    def _short_form(name: str) -> str:
+        """SCPI short form of a keyword, e.g. "SINusoid" -> "SIN" """
+        if name.isupper() or name.islower():
+            return name.upper()
+        short = ""
+        for char in name:
+            if not (char.isupper() or char.isdigit()):
+                break
+            short += char
+        return short
+
+    def _same(self, key: str, a: Union[str, float],
+              b: Union[str, float]) -> bool:
+        """Compare two values of a setting as the instrument would"""
+        if key == "function":
+            return (a.upper() == b.upper()
+                    or self._short_form(a) == self._short_form(b))
+        if isinstance(a, str) or isinstance(b, str):
+            return str(a).upper() == str(b).upper()
+        return bool(np.isclose(a, b, rtol=1e-12, atol=0))
+
+    def _setting_query(self, key: str) -> str:
+        """Query command of a shadowed setting"""
+        return {
+            "output": f"OUTPut{self._channel}:STATe?",
+            "function": f"{self._source}FUNCtion:SHAPe?",
+            "amplitude": f"{self._source}VOLTage:AMPLitude?",
+            "offset": f"{self._source}VOLTage:OFFSet?",
+            "frequency": f"{self._source}FREQuency?",
+            "duty": f"{self._source}PULSe:DCYCle?",
+        }[key]
+
+    def _query_settings(self, keys: List[str]) -> dict:
+        """Query several settings in one message and update the shadow
+
+        Parameters
+        ----------
+        keys : list of str
+            Any of output, function, amplitude, offset, frequency, duty
+
+        Returns
+        -------
+        dict
+            Values as output "ON"/"OFF", function name, and floats in
+            Vpp, V, Hz and %
+        """
+        cmd = ";".join(f":{self._setting_query(key)}" for key in keys)
+        responses = self._fgen.query(cmd).split(";")
+        values = {}
+        for key, response in zip(keys, responses):
+            response = response.strip()
+            if key == "output":
+                values[key] = self._state_to_str[response]
+            elif key == "function":
+                values[key] = response
+            else:
+                values[key] = float(response)
+        self._shadow.update(values)
+        return values
+
+    def _apply(self, changes: List[tuple], err_msg: str):
+        """Write settings that differ from the shadow in one message
+
+        Parameters
+        ----------
+        changes : list of tuples
+            (key, value, command) in the order they should be applied, value
+            in the units of the shadow
+        err_msg : str
+            Passed on as `custom_err_message` of the write
+
+        Raises
+        ------
+        NotSetError
+            If `self._fgen.verify_param_set` is `True` and a value read back
+            after the write does not match
+        """
+        shadow = dict(self._shadow)
+        commands = []
+        written = []
+        for key, value, cmd in changes:
+            if key in shadow and self._same(key, shadow[key], value):
+                continue
+            shadow[key] = value
+            commands.append(f":{cmd}")
+            if key not in written:
+                written.append(key)
+        if not commands:
+            return
+        self._fgen.write(";".join(commands), custom_err_message=err_msg)
+        self._shadow = dict(shadow)
+        if self._fgen.verify_param_set:
+            # read back, the shadow then holds the values actually in effect
+            actual = self._query_settings(written)
+            wrong = [
+                f"{key} {shadow[key]} (is {actual[key]})" for key in written
+                if not self._same(key, shadow[key], actual[key])
+            ]
+            if wrong:
+                msg = (f"Could not set {', '.join(wrong)} on channel "
+                       f"{self._channel}. Check that the values are within "
+                       f"the possible range and in the correct format.\n"
+                       f"Error from the instrument: {self._fgen.get_error()}")
+                raise NotSetError(msg)
+
     # Get currently used parameters from function generator
     def get_output_state(self) -> int:
         """Returns 0 for "OFF", 1 for "ON" """
-        return int(self._fgen.query(f"OUTPut{self._channel}:STATe?"))
+        state = self._query_settings(["output"])["output"]
+        return 1 if state == "ON" else 0
 
     def get_function(self) -> str:
         """Returns string of function name"""
-        return self._fgen.query(f"{self._source}FUNCtion:SHAPe?")
+        return self._query_settings(["function"])["function"]
 
     def get_amplitude(self) -> float:
         """Returns peak-to-peak voltage in volts"""
-        return float(self._fgen.query(f"{self._source}VOLTage:AMPLitude?"))
+        return self._query_settings(["amplitude"])["amplitude"]
 
     def get_offset(self) -> float:
         """Returns offset voltage in volts"""
-        return float(self._fgen.query(f"{self._source}VOLTage:OFFSet?"))
+        return self._query_settings(["offset"])["offset"]
 
     def get_frequency(self) -> float:
         """Returns frequency in Hertz"""
-        return float(self._fgen.query(f"{self._source}FREQuency?"))
+        return self._query_settings(["frequency"])["frequency"]
 
     def get_duty(self):
-        return self._fgen.query(f"{self._source}PULSe:DCYCle?")
+        return self._fgen.query(self._setting_query("duty"))
+
+    def _duty_change(self, dutydata: float) -> tuple:
+        """(key, value, command) to set the duty cycle in %"""
+        return ("duty", float(dutydata),
+                f"{self._source}PULSe:DCYCle {float(dutydata)}")
 
     def set_duty(self, dutydata):
-        self._fgen.write(
-            f"{self._source}PULSe:DCYCle {float(dutydata)}",
-            custom_err_message=f"set duty {float(dutydata)}",
-        )
+        self._apply([self._duty_change(dutydata)], f"set duty {dutydata}")
 
     # Get limits set in the channel class
     def get_frequency_lims(self) -> List[float]:
@@ -1039,7 +1507,8 @@ class FuncGenChannel:
         ]
 
     def get_settings(self) -> dict:
-        """Get the settings for the channel
+        """Get the settings for the channel, queried in one message. Also
+        seeds the shadow used by the set functions to skip unchanged values
 
         Returns
         -------
@@ -1048,12 +1517,14 @@ class FuncGenChannel:
             function, amplitude, offset, and frequency and values tuples of
             the corresponding return and unit
         """
+        keys = ["output", "function", "amplitude", "offset", "frequency"]
+        values = self._query_settings(keys)
         return {
-            "output": (self._state_to_str[self.get_output_state()], ""),
-            "function": (self.get_function(), ""),
-            "amplitude": (self.get_amplitude(), "Vpp"),
-            "offset": (self.get_offset(), "V"),
-            "frequency": (self.get_frequency(), "Hz"),
+            "output": (values["output"], ""),
+            "function": (values["function"], ""),
+            "amplitude": (values["amplitude"], "Vpp"),
+            "offset": (values["offset"], "V"),
+            "frequency": (values["frequency"], "Hz"),
         }
 
     def print_settings(self):
@@ -1075,21 +1546,41 @@ class FuncGenChannel:
         set the outout to OFF before applyign the settings (and turn the
         channel ON or leave it OFF depending on the settings dict)
 
+        Only settings that differ from the shadow are written, all in one
+        message. The output is only turned OFF first if something other
+        than the output state changes.
+
         Parameteres
         -----------
         settings : dict
             Settings dictionary as returned by `get_settings`: should have
             keys output, function, amplitude, offset, and frequency
         """
+        amplitude = settings["amplitude"][0]
+        changes = [
+            self._function_change(settings["function"][0]),
+            self._amplitude_change(amplitude,
+                                   self._shadowed("offset", self.get_offset)),
+        ]
+        if str(amplitude).lower() in ["min", "max"]:
+            amplitude = changes[-1][1]
+        changes += [
+            self._offset_change(settings["offset"][0], "V", amplitude),
+            self._frequency_change(settings["frequency"][0]),
+        ]
         # First turn off to ensure no potentially harmful
         # combination of settings
-        self.set_output_state("OFF")
-        # Set settings according to dictionary
-        self.set_function(settings["function"][0])
-        self.set_amplitude(settings["amplitude"][0])
-        self.set_offset(settings["offset"][0])
-        self.set_frequency(settings["frequency"][0])
-        self.set_output_state(settings["output"][0])
+        if any(key not in self._shadow
+               or not self._same(key, self._shadow[key], value)
+               for key, value, _ in changes):
+            changes.insert(0, self._output_change("OFF"))
+        changes.append(self._output_change(settings["output"][0]))
+        self._apply(changes, f"apply settings to channel {self._channel}")
+
+    def _output_change(self, state: Union[int, str]) -> tuple:
+        """(key, value, command) to set the output state"""
+        state = self._state_to_str.get(state, str(state).upper())
+        return ("output", state, f"OUTPut{self._channel}:STATe {state}")
 
     def set_output_state(self, state: Union[int, str]):
         """Enables or diables the output of the channel
@@ -1108,16 +1599,7 @@ class FuncGenChannel:
             get function
         """
         err_msg = f"turn channel {self._channel} to state {state}"
-        self._fgen.write(f"OUTPut{self._channel}:STATe {state}",
-                         custom_err_message=err_msg)
-        if self._fgen.verify_param_set:
-            actual_state = self.get_output_state()
-            if not actual_state == state:
-                msg = (
-                    f"Channel {self._channel} was not turned {state}, it is "
-                    f"{self._state_to_str[actual_state]}.\n"
-                    f"Error from the instrument: {self._fgen.get_error()}")
-                raise NotSetError(msg)
+        self._apply([self._output_change(state)], err_msg)
 
     def get_output(self) -> int:
         """Wrapper for get_output_state"""
@@ -1127,6 +1609,10 @@ class FuncGenChannel:
         """Wrapper for set_output_state"""
         self.set_output_state(state)
 
+    def _function_change(self, shape: str) -> tuple:
+        """(key, value, command) to set the function shape"""
+        return ("function", shape, f"{self._source}FUNCtion:SHAPe {shape}")
+
     def set_function(self, shape: str):
         """Set the function shape of the output
 
@@ -1149,35 +1635,11 @@ class FuncGenChannel:
             applying the set function does not match the value returned by the
             get function
         """
-        cmd = f"{self._source}FUNCtion:SHAPe {shape}"
-        self._fgen.write(cmd, custom_err_message=f"set function {shape}")
-        if self._fgen.verify_param_set:
-            actual_shape = self.get_function()
-            if not actual_shape == shape:
-                msg = (
-                    f"Function {shape} was not set on channel {self._channel}, "
-                    f"it is {actual_shape}. Check that the function name is "
-                    f"correctly spelt. Look up `set_function.__doc__` to see "
-                    f"available shapes.\n Error from the instrument: "
-                    f"{self._fgen.get_error()}")
-                raise NotSetError(msg)
+        self._apply([self._function_change(shape)], f"set function {shape}")
 
-    def set_amplitude(self, amplitude: float):
-        """Set the peak-to-peak amplitude in volts
-
-        Parameters
-        ----------
-        amplitude : float or {"max", "min"}
-            0.1mV or four digits resolution, "max" or "min" will set the
-            amplitude to the maximum or minimum limit given in `channel_limits`
-
-        Raises
-        ------
-        NotSetError
-            If `self._fgen.verify_param_set` is `True` and the value after
-            applying the set function does not match the value returned by the
-            get function
-        """
+    def _amplitude_change(self, amplitude: float, offset: float) -> tuple:
+        """(key, value, command) to set the amplitude, checked against the
+        limits together with `offset`"""
         # Check if keyword min or max is given
         if str(amplitude).lower() in ["min", "max"]:
             unit = ""  # no unit for MIN/MAX
@@ -1196,44 +1658,24 @@ class FuncGenChannel:
                 raise NotSetError(msg)
         # Check that the new amplitude will not violate voltage limits
         min_volt, max_volt = self.get_voltage_lims()
-        current_offset = self.get_offset()
-        if (amplitude / 2 - current_offset < min_volt
-                or amplitude / 2 + current_offset > max_volt):
+        if (amplitude / 2 - offset < min_volt
+                or amplitude / 2 + offset > max_volt):
             msg = (
                 f"Could not set the amplitude {amplitude}{unit} as the amplitude "
-                f"combined with the offset ({current_offset}V) will be outside the "
+                f"combined with the offset ({offset}V) will be outside the "
                 f"absolute voltage limits [{min_volt}, {max_volt}]{unit}")
             raise NotSetError(msg)
-        # Set the amplitude
-        cmd = f"{self._source}VOLTage:LEVel {amplitude}{unit}"
-        err_msg = f"set amplitude {amplitude}{unit}"
-        self._fgen.write(cmd, custom_err_message=err_msg)
-        # Verify that the amplitude has been set
-        if self._fgen.verify_param_set:
-            actual_amplitude = self.get_amplitude()
-            # Multiply with the appropriate factor according to SI prefix, or
-            # if string is empty, use the value looked up from channel_limits earlier
-            if not unit == "":
-                check_amplitude = amplitude * _SI_prefix_to_factor(unit)
-            else:
-                check_amplitude = amplitude
-            if not actual_amplitude == check_amplitude:
-                msg = (
-                    f"Amplitude {amplitude}{unit} was not set on channel "
-                    f"{self._channel}, it is {actual_amplitude}Vpp. Check that "
-                    f" the number is within the possible range and in the "
-                    f"correct format.\nError from the instrument: "
-                    f"{self._fgen.get_error()}")
-                raise NotSetError(msg)
+        return ("amplitude", amplitude,
+                f"{self._source}VOLTage:LEVel {amplitude}{unit}")
 
-    def set_offset(self, offset: float, unit: str = "V"):
-        """Set offset in volts (or mV, see options)
+    def set_amplitude(self, amplitude: float):
+        """Set the peak-to-peak amplitude in volts
 
         Parameters
         ----------
-        offset : float
-            Unknown resolution, guessing 0.1mV or four digits resolution
-        unit : {mV, V}, default V
+        amplitude : float or {"max", "min"}
+            0.1mV or four digits resolution, "max" or "min" will set the
+            amplitude to the maximum or minimum limit given in `channel_limits`
 
         Raises
         ------
@@ -1242,43 +1684,34 @@ class FuncGenChannel:
             applying the set function does not match the value returned by the
             get function
         """
-        # Check that the new offset will not violate voltage limits
+        change = self._amplitude_change(
+            amplitude, self._shadowed("offset", self.get_offset))
+        self._apply([change], f"set amplitude {change[1]}Vpp")
+
+    def _offset_change(self, offset: float, unit: str,
+                       amplitude: float) -> tuple:
+        """(key, value, command) to set the offset, checked against the
+        limits together with `amplitude`"""
         min_volt, max_volt = self.get_voltage_lims()
-        current_amplitude = self.get_amplitude()
         offset = _SI_prefix_to_factor(unit) * offset
-        if (current_amplitude / 2 - offset < min_volt
-                or current_amplitude / 2 + offset > max_volt):
+        if (amplitude / 2 - offset < min_volt
+                or amplitude / 2 + offset > max_volt):
             msg = (
                 f"Could not set the offset {offset}V as the offset combined "
-                f"with the amplitude ({current_amplitude}V) will be outside "
+                f"with the amplitude ({amplitude}V) will be outside "
                 f"the absolute voltage limits [{min_volt}, {max_volt}]V")
             raise NotSetError(msg)
-        # Set the offset
-        cmd = f"{self._source}VOLTage:LEVel:OFFSet {offset}{unit}"
-        err_msg = f"set offset {offset}{unit}"
-        self._fgen.write(cmd, custom_err_message=err_msg)
-        # Verify that the offset has been set
-        if self._fgen.verify_param_set:
-            actual_offset = self.get_offset()
-            # Multiply with the appropriate factor according to SI prefix
-            check_offset = offset * _SI_prefix_to_factor(unit)
-            if not actual_offset == check_offset:
-                msg = (
-                    f"Offset {offset}{unit} was not set on channel "
-                    f"{self._channel}, it is {actual_offset}V. Check that the "
-                    f"number is within the possible range and in the correct "
-                    f"format.\nError from the instrument: {self._fgen.get_error()}"
-                )
-                raise NotSetError(msg)
+        return ("offset", offset,
+                f"{self._source}VOLTage:LEVel:OFFSet {offset}V")
 
-    def set_frequency(self, freq: float, unit: str = "Hz"):
-        """Set the frequency in Hertz (or mHz, kHz, MHz, see options)
+    def set_offset(self, offset: float, unit: str = "V"):
+        """Set offset in volts (or mV, see options)
 
         Parameters
         ----------
-        freq : float
-            The resolution is 1 μHz or 12 digits.
-        unit : {mHz, Hz, kHz, MHz}, default Hz
+        offset : float
+            Unknown resolution, guessing 0.1mV or four digits resolution
+        unit : {mV, V}, default V
 
         Raises
         ------
@@ -1287,8 +1720,14 @@ class FuncGenChannel:
             applying the set function does not match the value returned by the
             get function
         """
+        # Check that the new offset will not violate voltage limits
+        change = self._offset_change(
+            offset, unit, self._shadowed("amplitude", self.get_amplitude))
+        self._apply([change], f"set offset {change[1]}V")
+
+    def _frequency_change(self, freq: float, unit: str = "Hz") -> tuple:
+        """(key, value, command) to set the frequency, written in Hz"""
         if str(freq).lower() in ["min", "max"]:  # handle min and max keywords
-            unit = ""  # no unit for MIN/MAX
             # Look up what the limit is for this keyword
             freq = self.channel_limits["frequency lims"][0][str(freq).lower()]
         else:
@@ -1300,27 +1739,175 @@ class FuncGenChannel:
                        f"within the frequency limits set for the instrument "
                        f"[{min_freq}, {max_freq}]Hz")
                 raise NotSetError(msg)
-        # Set the frequency
-        self._fgen.write(
-            f"{self._source}FREQuency:FIXed {freq}{unit}",
-            custom_err_message=f"set frequency {freq}{unit}",
-        )
-        # Verify that the amplitude has been set
-        if self._fgen.verify_param_set:
-            actual_freq = self.get_frequency()
-            # Multiply with the appropriate factor according to SI prefix, or
-            # if string is empty, use the value looked up from channel_limits earlier
-            if not unit == "":
-                check_freq = freq * _SI_prefix_to_factor(unit)
-            else:
-                check_freq = freq
-            if not actual_freq == check_freq:
-                msg = (
-                    f"Frequency {freq}{unit} was not set on channel {self._channel}"
-                    f", it is {actual_freq}Hz. Check that the number is within "
-                    f"the possible range and in the correct format.\nError "
-                    f"from the instrument: {self._fgen.get_error()}")
-                raise NotSetError(msg)
+        return ("frequency", freq, f"{self._source}FREQuency:FIXed {freq}Hz")
+
+    def set_frequency(self, freq: float, unit: str = "Hz"):
+        """Set the frequency in Hertz (or mHz, kHz, MHz, see options)
+
+        Parameters
+        ----------
+        freq : float
+            The resolution is 1 μHz or 12 digits.
+        unit : {mHz, Hz, kHz, MHz}, default Hz
+
+        Raises
+        ------
+        NotSetError
+            If `self._fgen.verify_param_set` is `True` and the value after
+            applying the set function does not match the value returned by the
+            get function
+        """
+        change = self._frequency_change(freq, unit)
+        self._apply([change], f"set frequency {change[1]}Hz")
+
+## ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ SWEEP CLASS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
+
+
+def sweep_range(
+    start: float,
+    stop: float,
+    steps: int,
+    duty: float = None,
+    dwell: float = 1.0,
+    log: bool = False,
+) -> List[tuple]:
+    """Points of a frequency sweep for `FuncGen.sweep`
+
+    Parameters
+    ----------
+    start, stop : float
+        First and last frequency in Hz
+    steps : int
+        Number of points, at least 2
+    duty : float, default `None`
+        Duty cycle in % of every point, `None` to leave it unchanged
+    dwell : float, default 1
+        Seconds spent at every point
+    log : bool, default `False`
+        Logarithmic instead of linear frequency steps
+
+    Returns
+    -------
+    list of tuples
+        (frequency, duty, dwell) points
+    """
+    if log:
+        freqs = np.geomspace(start, stop, max(int(steps), 2))
+    else:
+        freqs = np.linspace(start, stop, max(int(steps), 2))
+    return [(float(freq), duty, dwell) for freq in freqs]
+
+
+class Sweep(threading.Thread):
+    """Step the frequency and duty cycle of a channel through a list of
+    points in a background thread
+
+    Every step is due a fixed time after the start of the sweep (the sum of
+    the dwells before it), measured on the monotonic clock, so the time
+    spent writing to the instrument does not add up over the sweep. Start
+    with `FuncGen.sweep`.
+
+    Parameters
+    ----------
+    channel : `FuncGenChannel`
+        Channel to sweep
+    points : list of tuples
+        (frequency in Hz, duty cycle in % or `None`, dwell in seconds)
+    repeat : int, default 1
+        Number of passes through the points, 0 to repeat until stopped
+    lock : context manager, default `None`
+        Held while writing a step, e.g. a lock shared with other users of
+        the instrument. If `None`, a private lock is made
+    """
+
+    def __init__(self, channel: "FuncGenChannel", points: List[tuple],
+                 repeat: int = 1, lock=None):
+        super().__init__(daemon=True)
+        if not points:
+            raise ValueError("The sweep has no points")
+        self.channel = channel
+        """`FuncGenChannel`: The swept channel"""
+        self.points = [(float(freq), None if duty is None else float(duty),
+                        float(dwell)) for freq, duty, dwell in points]
+        """list of tuples: (frequency, duty, dwell) points"""
+        self.repeat = int(repeat)
+        """int: Number of passes, 0 for endless"""
+        self.lock = lock if lock is not None else threading.RLock()
+        self._stop_event = threading.Event()
+        self._state = "waiting"
+        self._step = 0
+        self._pass = 0
+        self._start_time = None
+        self._end_time = None
+        self._max_late = 0.0
+        self._error = None
+
+    def stop(self):
+        """Stop after the current step, the channel keeps its last setting"""
+        self._stop_event.set()
+
+    def run(self):
+        self._start_time = time.monotonic()
+        due = self._start_time
+        self._state = "running"
+        try:
+            while self.repeat == 0 or self._pass < self.repeat:
+                for step, (freq, duty, dwell) in enumerate(self.points):
+                    # wait for the step, wakes up early only to stop
+                    if self._stop_event.wait(due - time.monotonic()):
+                        self._state = "stopped"
+                        return
+                    with self.lock:
+                        self._max_late = max(self._max_late,
+                                             time.monotonic() - due)
+                        self._set_point(freq, duty)
+                    self._step = step + 1
+                    due += dwell
+                self._pass += 1
+                if self.repeat == 0 or self._pass < self.repeat:
+                    self._step = 0
+            # let the last point last its dwell
+            stopped = self._stop_event.wait(due - time.monotonic())
+            self._state = "stopped" if stopped else "done"
+        except Exception as err:
+            self._error = str(err)
+            self._state = "error"
+        finally:
+            self._end_time = time.monotonic()
+
+    def _set_point(self, freq: float, duty: float):
+        """Write frequency and duty in one message, unchanged values are
+        skipped by the channel shadow"""
+        changes = [self.channel._frequency_change(freq)]
+        if duty is not None:
+            changes.append(self.channel._duty_change(duty))
+        self.channel._apply(changes, f"set sweep point {freq}Hz {duty}%")
+
+    def progress(self) -> dict:
+        """Returns
+        -------
+        dict
+            state ("waiting", "running", "done", "stopped" or "error"),
+            step (points done in the current pass), steps, pass, repeat,
+            point (last point set), elapsed (s), max_late (s, largest delay
+            of a step after its due time) and error
+        """
+        step = self._step
+        if self._start_time is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._end_time or time.monotonic()) - self._start_time
+        return {
+            "state": self._state,
+            "step": step,
+            "steps": len(self.points),
+            "pass": self._pass,
+            "repeat": self.repeat,
+            "point": self.points[step - 1] if step else None,
+            "elapsed": elapsed,
+            "max_late": self._max_late,
+            "error": self._error,
+        }
 
 
 ## ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ EXAMPLES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ##
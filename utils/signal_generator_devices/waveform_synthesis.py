@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Arbitrary waveform synthesis for `tektronix_func_gen.FuncGen`
+
+All generators are vectorised with NumPy and return waveforms already
+quantised to ints spanning the resolution of the function generator, so
+they can be given to `FuncGen.set_custom_waveform` (or
+`FuncGen.set_custom_waveform_cached`) directly. One waveform is one period
+of the arbitrary function, the output frequency sets how long it lasts.
+
+Pass the connected instrument as `fgen` to check the length against its
+limits and quantise to its resolution, e.g. for the longest waveform:
+
+    wf = pwm(length=fgen._arbitrary_waveform_length[1], cycles=20, duty=0.3,
+             jitter=0.01, fgen=fgen)
+    fgen.set_custom_waveform_cached(wf, channel=1)
+
+Without `fgen` only the widest limits of the supported models are checked.
+"""
+
+import numpy as np
+from typing import Union
+
+RESOLUTION = 16383
+"""int: Vertical resolution of the supported models (14 bit)"""
+
+LENGTH_LIMS = (2, 1000000)
+"""tuple: Smallest and largest waveform length of the supported models
+(AFG1022 8192, AFG3022 65536, AFG1062 1e6 points)"""
+
+
+def _limits(fgen, resolution: int = None) -> tuple:
+    """Length limits and resolution of `fgen`, or the module defaults
+
+    An explicit `resolution` takes precedence over the one of `fgen`
+    """
+    if fgen is None:
+        length_lims = LENGTH_LIMS
+        default = RESOLUTION
+    else:
+        length_lims = tuple(fgen._arbitrary_waveform_length)
+        default = fgen._arbitrary_waveform_resolution
+    return length_lims, default if resolution is None else resolution
+
+
+def _check_length(length: int, length_lims: tuple):
+    if not length_lims[0] <= length <= length_lims[1]:
+        raise ValueError(f"The waveform length {length} is not within "
+                         f"{length_lims[0]} <= length <= {length_lims[1]}")
+
+
+def _positions(length: int, length_lims: tuple = LENGTH_LIMS) -> np.ndarray:
+    """Sample positions as fractions of the waveform, [0, 1)"""
+    _check_length(length, length_lims)
+    return np.arange(int(length)) / int(length)
+
+
+def quantise(
+    shape: np.ndarray,
+    resolution: int = None,
+    low: float = None,
+    high: float = None,
+    fgen=None,
+) -> np.ndarray:
+    """Map a shape to ints spanning the resolution of the function generator
+
+    Parameters
+    ----------
+    shape : array_like
+        Floats of any range
+    resolution : int, default `None`
+        Largest int of the function generator, `_arbitrary_waveform_resolution`
+        of `fgen`, or 16383 if `None`
+    low, high : float, default `None`
+        Values mapped to 0 and `resolution`, values outside are clipped.
+        `None` uses the minimum and maximum of the shape
+    fgen : FuncGen, default `None`
+        Instrument whose waveform length limits the shape must fit
+
+    Returns
+    -------
+    waveform : ndarray of np.uint16
+        A flat shape is placed at mid scale
+    """
+    shape = np.asarray(shape, dtype=float)
+    length_lims, resolution = _limits(fgen, resolution)
+    if fgen is not None:
+        _check_length(len(shape), length_lims)
+    low = shape.min() if low is None else low
+    high = shape.max() if high is None else high
+    if high <= low:
+        return np.full(shape.shape, resolution // 2, dtype=np.uint16)
+    waveform = (shape - low) * (resolution / (high - low))
+    return np.rint(np.clip(waveform, 0, resolution)).astype(np.uint16)
+
+
+def pwm(
+    length: int,
+    cycles: int,
+    duty: Union[float, np.ndarray],
+    jitter: float = 0.0,
+    seed: int = None,
+    resolution: int = None,
+    fgen=None,
+) -> np.ndarray:
+    """Pulse width modulated train with optional timing jitter
+
+    Parameters
+    ----------
+    length : int
+        Number of points
+    cycles : int
+        PWM periods in the waveform
+    duty : float or array_like
+        Duty cycle 0-1, or one duty cycle per period to sweep the duty
+    jitter : float, default 0
+        Standard deviation of the edge times as a fraction of the period,
+        edges are kept within their period
+    seed : int, default `None`
+        Seed of the jitter, for repeatable waveforms
+    resolution : int, default `None`
+        Resolution of `fgen`, or 16383 if `None`
+    fgen : FuncGen, default `None`
+        Instrument whose length limits and resolution are used
+
+    Returns
+    -------
+    waveform : ndarray of np.uint16
+        High at `resolution`, low at 0
+    """
+    length_lims, resolution = _limits(fgen, resolution)
+    x = _positions(length, length_lims) * cycles
+    duty = np.broadcast_to(np.clip(duty, 0, 1), (cycles, )).astype(float)
+    rise = np.arange(cycles, dtype=float)
+    fall = rise + duty
+    if jitter:
+        rng = np.random.default_rng(seed)
+        rise = rise + rng.normal(0, jitter, cycles)
+        fall = fall + rng.normal(0, jitter, cycles)
+        # an edge never leaves its own period
+        rise = np.clip(rise, np.arange(cycles), np.arange(1, cycles + 1))
+        fall = np.clip(fall, rise, np.arange(1, cycles + 1))
+    # period of each point, its rise is the last one before the point
+    k = np.searchsorted(rise, x, side="right") - 1
+    high = (k >= 0) & (x < fall[np.maximum(k, 0)])
+    return quantise(high, resolution, 0, 1)
+
+
+def wheel_speed(
+    length: int,
+    teeth: int = 48,
+    missing: int = 0,
+    revolutions: float = 1,
+    speed_ratio: float = 1.0,
+    square: bool = True,
+    resolution: int = None,
+    fgen=None,
+) -> np.ndarray:
+    """Wheel speed or crank sensor pattern of a toothed wheel
+
+    Parameters
+    ----------
+    length : int
+        Number of points
+    teeth : int, default 48
+        Tooth positions per revolution, including missing teeth
+    missing : int, default 0
+        Teeth left out at the end of every revolution for the reference gap,
+        e.g. 2 for a 60-2 crank wheel
+    revolutions : float, default 1
+        Revolutions in the waveform. Use a whole number for a seamless loop
+    speed_ratio : float, default 1
+        Speed at the end relative to the start for a constant acceleration,
+        1 for a constant speed
+    square : bool, default `True`
+        Square pulses of an active (Hall) sensor, else the sine of a
+        passive (inductive) sensor with amplitude growing with speed
+    resolution : int, default `None`
+        Resolution of `fgen`, or 16383 if `None`
+    fgen : FuncGen, default `None`
+        Instrument whose length limits and resolution are used
+
+    Returns
+    -------
+    waveform : ndarray of np.uint16
+        The gap is at the low level of the square and at mid scale
+        of the sine
+    """
+    length_lims, resolution = _limits(fgen, resolution)
+    u = _positions(length, length_lims)
+    # angle in teeth, speed linear in time from 1 to speed_ratio
+    position = (u + (speed_ratio - 1) * u**2 / 2) / (1 + (speed_ratio - 1) / 2)
+    angle = position * revolutions * teeth
+    present = np.floor(angle) % teeth < teeth - missing
+    if square:
+        high = present & (angle % 1 < 0.5)
+        return quantise(high, resolution, 0, 1)
+    speed = 1 + (speed_ratio - 1) * u
+    signal = np.sin(2 * np.pi * angle) * speed * present
+    peak = max(1, speed_ratio)
+    return quantise(signal, resolution, -peak, peak)
+
+
+def ramp(
+    length: int,
+    symmetry: float = 1.0,
+    cycles: int = 1,
+    resolution: int = None,
+    fgen=None,
+) -> np.ndarray:
+    """Ramp, triangle or sawtooth
+
+    Parameters
+    ----------
+    length : int
+        Number of points
+    symmetry : float, default 1
+        Fraction of the period spent rising: 1 rising sawtooth, 0.5
+        triangle, 0 falling sawtooth
+    cycles : int, default 1
+        Periods in the waveform
+    resolution : int, default `None`
+        Resolution of `fgen`, or 16383 if `None`
+    fgen : FuncGen, default `None`
+        Instrument whose length limits and resolution are used
+
+    Returns
+    -------
+    waveform : ndarray of np.uint16
+    """
+    length_lims, resolution = _limits(fgen, resolution)
+    phase = (_positions(length, length_lims) * cycles) % 1
+    symmetry = min(max(symmetry, 0), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        signal = np.where(phase < symmetry, phase / symmetry,
+                          (1 - phase) / (1 - symmetry))
+    return quantise(signal, resolution, 0, 1)
+
+
+def burst(
+    length: int,
+    cycles: int,
+    on_fraction: float = 0.5,
+    idle: float = 0.0,
+    square: bool = False,
+    resolution: int = None,
+    fgen=None,
+) -> np.ndarray:
+    """Burst of a sine or square carrier followed by an idle level
+
+    Parameters
+    ----------
+    length : int
+        Number of points
+    cycles : int
+        Carrier periods in the burst
+    on_fraction : float, default 0.5
+        Fraction of the waveform taken by the burst
+    idle : float, default 0
+        Level between bursts, -1 to 1 of the full scale
+    square : bool, default `False`
+        Square carrier instead of sine
+    resolution : int, default `None`
+        Resolution of `fgen`, or 16383 if `None`
+    fgen : FuncGen, default `None`
+        Instrument whose length limits and resolution are used
+
+    Returns
+    -------
+    waveform : ndarray of np.uint16
+    """
+    length_lims, resolution = _limits(fgen, resolution)
+    u = _positions(length, length_lims)
+    on = u < on_fraction
+    carrier = np.sin(2 * np.pi * cycles * u / max(on_fraction, 1e-12))
+    if square:
+        carrier = np.where(carrier >= 0, 1.0, -1.0)
+    signal = np.where(on, carrier, idle)
+    return quantise(signal, resolution, -1, 1)
+
+
+def sum_of_sines(
+    length: int,
+    harmonics,
+    amplitudes=None,
+    phases=None,
+    resolution: int = None,
+    fgen=None,
+) -> np.ndarray:
+    """Sum of sines with a whole number of periods each, e.g. a
+    fundamental with harmonic distortion or a multi-tone test signal
+
+    Parameters
+    ----------
+    length : int
+        Number of points
+    harmonics : array_like of int
+        Periods of each sine in the waveform
+    amplitudes : array_like, default `None`
+        Relative amplitude of each sine, all 1 if `None`
+    phases : array_like, default `None`
+        Phase of each sine in radians, all 0 if `None`
+    resolution : int, default `None`
+        Resolution of `fgen`, or 16383 if `None`
+    fgen : FuncGen, default `None`
+        Instrument whose length limits and resolution are used
+
+    Returns
+    -------
+    waveform : ndarray of np.uint16
+        Scaled so the peak of the sum spans the full resolution
+    """
+    length_lims, resolution = _limits(fgen, resolution)
+    u = _positions(length, length_lims)
+    harmonics = np.asarray(harmonics, dtype=float)
+    amplitudes = (np.ones(len(harmonics))
+                  if amplitudes is None else np.asarray(amplitudes, float))
+    phases = np.zeros(len(harmonics)) if phases is None else np.asarray(
+        phases, float)
+    signal = amplitudes @ np.sin(2 * np.pi * np.outer(harmonics, u) +
+                                 phases[:, None])
+    peak = np.abs(signal).max()
+    return quantise(signal, resolution, -peak, peak)
@@ -0,0 +1,293 @@
+"""
+    Background CAN receive buffer
+
+    A CanReceiver thread drains the VCarDAS flow of one channel into a
+    CanRingBuffer: a fixed size NumPy record array of (time, id, dlc, data)
+    with an index of the latest frame of every ID. Requests read frames from
+    memory and wait on a condition for new ones, so any number of clients
+    can wait on different IDs without polling the bus themselves.
+
+        rx = receiver(1)
+        seq, frame = rx.buffer.wait(0x200, timeout=5)
+        frames = rx.buffer.since(seq - 100)
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from utils.sessions import sessions
+from utils.vcardas.canclient import BITRATE, CanClient
+
+FRAME_DTYPE = np.dtype([
+    ('t', '<f8'),  # host time.time() of reception
+    ('id', '<u4'),
+    ('dlc', 'u1'),
+    ('data', 'u1', (8, )),
+])
+"""Record of one classic CAN frame"""
+
+
+def frame_dict(record):
+    """Returns:
+        dict: t, id, dlc and data (list of int) of a FRAME_DTYPE record
+    """
+    dlc = int(record['dlc'])
+    return {
+        't': float(record['t']),
+        'id': int(record['id']),
+        'dlc': dlc,
+        'data': record['data'][:dlc].tolist(),
+    }
+
+
+class CanRingBuffer(object):
+    """Bounded buffer of the latest frames with a per-ID index
+
+        Every frame gets a sequence number, counting from 1. Frames older
+        than capacity are overwritten.
+
+        Attributes:
+
+            capacity (int): number of frames kept
+    """
+
+    def __init__(self, capacity=65536):
+        """ Init.
+
+        Args:
+            capacity (int): number of frames kept
+        """
+        self.capacity = int(capacity)
+        self._frames = np.zeros(self.capacity, dtype=FRAME_DTYPE)
+        self._seq = 0
+        self._latest = {}
+        self._cond = threading.Condition()
+        self._waiting = 0
+
+    @property
+    def seq(self):
+        """int: sequence number of the newest frame, 0 if empty"""
+        return self._seq
+
+    def append(self, can_id, data, t=None):
+        """Add a frame
+
+        Args:
+            can_id (int): CAN identifier
+            data (bytes): payload, at most 8 bytes
+            t (float|None): reception time, default now
+        """
+        data = bytes(data)[:8]
+        with self._cond:
+            seq = self._seq + 1
+            record = self._frames[seq % self.capacity]
+            record['t'] = time.time() if t is None else t
+            record['id'] = can_id
+            record['dlc'] = len(data)
+            record['data'] = np.frombuffer(data.ljust(8, b'\0'), np.uint8)
+            self._seq = seq
+            self._latest[can_id] = seq
+            if self._waiting:
+                self._cond.notify_all()
+
+    def _get(self, seq):
+        """Record of a sequence number still in the buffer, else None"""
+        if seq <= 0 or seq <= self._seq - self.capacity:
+            return None
+        return self._frames[seq % self.capacity].copy()
+
+    def latest(self, can_id):
+        """Returns:
+            tuple: (seq, record), (0, None) if no frame of can_id is buffered
+        """
+        with self._cond:
+            seq = self._latest.get(can_id, 0)
+            record = self._get(seq)
+            return (seq, record) if record is not None else (0, None)
+
+    def ids(self):
+        """Returns:
+            dict: CAN id -> sequence number of its latest frame
+        """
+        with self._cond:
+            return dict(self._latest)
+
+    def since(self, seq, can_ids=None):
+        """Frames newer than seq still in the buffer, oldest first
+
+        Args:
+            seq (int): sequence number of the last frame already seen
+            can_ids (iterable|None): only these IDs
+
+        Returns:
+            tuple: (seq of the newest frame, FRAME_DTYPE array)
+        """
+        with self._cond:
+            last = self._seq
+            first = max(seq + 1, last - self.capacity + 1, 1)
+            index = np.arange(first, last + 1) % self.capacity
+            frames = self._frames[index]
+        if can_ids is not None:
+            frames = frames[np.isin(frames['id'], list(can_ids))]
+        return last, frames
+
+    def wait(self, can_id=None, after=None, timeout=None):
+        """Wait for a frame newer than after
+
+        Args:
+            can_id (int|iterable|None): CAN identifier or several of them,
+                None for any frame
+            after (int|None): sequence number of the last frame seen,
+                None for the current newest
+            timeout (float|None): seconds to wait
+
+        Returns:
+            tuple: (seq, record) of the newest matching frame, (after, None)
+                on timeout
+        """
+        if can_id is None or isinstance(can_id, int):
+            can_ids = can_id
+        else:
+            can_ids = tuple(can_id)
+        with self._cond:
+            if after is None:
+                after = self._seq
+
+            def newest():
+                if can_ids is None:
+                    return self._seq
+                if isinstance(can_ids, int):
+                    return self._latest.get(can_ids, 0)
+                return max((self._latest.get(i, 0) for i in can_ids),
+                           default=0)
+
+            self._waiting += 1
+            try:
+                found = self._cond.wait_for(lambda: newest() > after,
+                                            timeout)
+            finally:
+                self._waiting -= 1
+            if not found:
+                return after, None
+            seq = newest()
+            return seq, self._get(seq)
+
+
+class CanReceiver(threading.Thread):
+    """Drain the receive flow of one channel into a CanRingBuffer
+
+        Uses its own CanClient, so waiting for frames never holds the lock
+        of the pooled client used for sending.
+
+        Attributes:
+
+            channel (int): VCarDAS channel
+            bitrate (int): bitrate in kbit/s
+            buffer (CanRingBuffer): received frames
+            frames (int): number of frames received
+    """
+
+    def __init__(self, channel, bitrate=BITRATE, capacity=65536):
+        """ Init.
+
+        Args:
+            channel (int): VCarDAS channel
+            bitrate (int): bitrate in kbit/s
+            capacity (int): frames kept in the buffer
+        """
+        super().__init__(daemon=True)
+        self.channel = channel
+        self.bitrate = bitrate
+        self.buffer = CanRingBuffer(capacity)
+        self.frames = 0
+        self.error = None
+        self._running = True
+
+        self.client = CanClient(channel, bitrate)
+        self.client.enable_flow(True)
+        self.client.configure()
+
+    def stop(self):
+        """End the drain loop after the current receive call"""
+        self._running = False
+
+    def close(self, timeout=1):
+        """Stop the thread, its client is closed when the loop ends"""
+        self.stop()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while self._running:
+            try:
+                message = self.client.receive()
+            except Exception as e:
+                self.error = str(e)
+                time.sleep(0.1)
+                continue
+            if message is None:
+                continue
+            t = time.time()
+            can_id = int(message.ID)
+            data = bytes(message.Header.Data)
+            self.buffer.append(can_id, data, t)
+            self.frames += 1
+        self.client.close()
+
+
+def receiver_session(channel, bitrate=None):
+    """Session of the receiver of a channel, started on first use
+
+        Receivers are kept in the session registry, so one idle for
+        sessions.idle_timeout is stopped by the reaper and
+        sessions.close('vcardas-rx', f'CAN{channel}') stops one explicitly.
+        A channel has one receiver, a second one at another bitrate would
+        reconfigure the bus under it.
+
+    Args:
+        channel (int): VCarDAS channel
+        bitrate (int|None): bitrate in kbit/s, None for the bitrate of the
+            running receiver or BITRATE
+
+    Returns:
+        Session
+
+    Raises:
+        ValueError: the channel is received at another bitrate
+    """
+    address = f'CAN{channel}'
+    if bitrate is None:
+        bitrate = BITRATE
+        with_bitrate = False
+    else:
+        with_bitrate = True
+
+    def start():
+        rx = CanReceiver(channel, bitrate)
+        rx.start()
+        return rx
+
+    session = sessions.open('vcardas-rx', address, start)
+    if not session.device.is_alive():
+        # the thread ended, e.g. after close, start a new one
+        sessions.close('vcardas-rx', address)
+        session = sessions.open('vcardas-rx', address, start)
+    if with_bitrate and session.device.bitrate != bitrate:
+        raise ValueError(f'CAN{channel} is received at '
+                         f'{session.device.bitrate} kbit/s, not {bitrate}')
+    return session
+
+
+def receiver(channel, bitrate=None):
+    """Receiver of a channel, started on first use
+
+    Args:
+        channel (int): VCarDAS channel
+        bitrate (int|None): bitrate in kbit/s, see receiver_session
+
+    Returns:
+        CanReceiver
+    """
+    return receiver_session(channel, bitrate).device
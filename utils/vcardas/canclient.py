@@ -0,0 +1,121 @@
+"""
+    Pooled VCarDAS CAN clients
+
+    Building a CmdGeneratorCan opens its ZMQ sockets, so one client per
+    (channel, bitrate) is kept in the session registry and reused by all
+    requests and cyclic jobs. Channel and bus parameters are only pushed to
+    VCarDAS when they change. Every client of a channel uses the same bus
+    parameters (PARAMS), so no caller changes the bus under another one.
+
+        with can_client(1) as client:
+            client.configure()
+            client.send(0x200, b'\\x01\\x02')
+"""
+
+from utils.lazy import lazy_import
+from utils.sessions import sessions
+
+# vendor library, imported with the first client
+can = lazy_import('pydasrmt.Command.CmdGeneratorCan')
+
+HOST = '127.0.0.1'
+PORT_PUB = 6667
+PORT_SUB = 6666
+# bitrate of the bus in kbit/s, e.g. 1000 for a 1 Mbit/s bus
+BITRATE = 500
+# setParamCan arguments after the bitrate, shared by all clients
+PARAMS = (0, 1, 1)
+
+
+class CanClient(object):
+    """One CmdGeneratorCan connected to one channel
+
+        Not thread safe, use through its session (see can_client) which
+        holds a lock.
+
+        Attributes:
+
+            channel (int): VCarDAS channel
+            bitrate (int): bitrate in kbit/s
+            cmd (CmdGeneratorCan): the vendor client
+    """
+
+    def __init__(self, channel, bitrate=BITRATE, host=HOST, port_pub=PORT_PUB,
+                 port_sub=PORT_SUB):
+        """ Init.
+
+        Args:
+            channel (int): VCarDAS channel
+            bitrate (int): bitrate in kbit/s
+            host (str): VCarDAS address
+            port_pub (int): publish port
+            port_sub (int): subscribe port
+        """
+        self.channel = channel
+        self.bitrate = bitrate
+        self.cmd = can.CmdGeneratorCan()
+        self.cmd.initSocket(host, port_pub, port_sub)
+        self.cmd.setChannelNode(channel, 1)
+
+        self._params = None
+        self._flow = None
+
+    def configure(self, params=PARAMS):
+        """Set the bus parameters after the bitrate, e.g. (0, 1, 1) for
+        setParamCan(500, 0, 1, 1). Nothing is sent if unchanged
+        """
+        params = (self.bitrate, ) + tuple(params)
+        if params != self._params:
+            self.cmd.setParamCan(*params)
+            self._params = params
+
+    def enable_flow(self, state=True):
+        """Turn the receive flow on or off, nothing is sent if unchanged"""
+        if state != self._flow:
+            self.cmd.enableFlowCan(state)
+            self._flow = state
+
+    def send(self, can_id, data):
+        """Send one classic CAN frame
+
+        Args:
+            can_id (int): CAN identifier
+            data (bytes): payload
+        """
+        self.cmd.sendCan(can.CanCmd.EFrameStatus.Can, bytes(data), can_id)
+
+    def receive(self, can_id=None):
+        """Returns:
+            message or None: next frame of can_id from the flow
+        """
+        if can_id is None:
+            return self.cmd.receiveCanMessage()
+        return self.cmd.receiveCanMessage(canID=can_id)
+
+    def close(self):
+        """Close the vendor client and its ZMQ sockets"""
+        close = getattr(self.cmd, 'close', None)
+        if close is not None:
+            close()
+        # CmdGeneratorCan has no close of its own, its sockets stay open
+        client = getattr(self.cmd, 'client', None)
+        for name in ('socketPub', 'socketSub'):
+            socket = getattr(client, name, None)
+            if socket is not None:
+                socket.close(linger=0)
+
+
+def can_client(channel, bitrate=BITRATE):
+    """Pooled client of a channel, connected on first use
+
+        Use as `with can_client(channel) as client:` to hold its lock.
+
+    Args:
+        channel (int): VCarDAS channel
+        bitrate (int): bitrate in kbit/s
+
+    Returns:
+        Session
+    """
+    return sessions.open('vcardas', f'CAN{channel}@{bitrate}k',
+                         lambda: CanClient(channel, bitrate))
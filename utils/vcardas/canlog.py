@@ -0,0 +1,294 @@
+"""
+    Binary CAN trace logging
+
+    A CanLogger thread copies the frames of a CanReceiver buffer to disk in
+    batches. A log file is a short header followed by packed FRAME_DTYPE
+    records (21 bytes per frame), written through a large file buffer and
+    rotated by size:
+
+        captures/can/[<sub directory>/]can<channel>_<start time>_<part>.canlog
+
+    At 1 Mbit/s a bus carries about 8000 frames/s, about 170 kB/s of log.
+    The ring buffer holds several seconds of traffic, so a batch every
+    flush interval keeps up with full load. Frames overwritten in the
+    buffer before they were written are counted as dropped.
+
+    The start time in the header is the start of logging, the same in all
+    parts of a rotated log, so ASC times of every part count from it.
+
+    The VCarDAS flow does not report the ID format, so ASC export writes IDs
+    above 0x7FF as extended and all others as standard. An extended frame
+    with an ID of 0x7FF or below is exported as a standard one.
+
+        logger = CanLogger(receiver(1)).start()
+        ...
+        logger.stop()
+        frames = read_log(logger.files[0])
+        export_asc(logger.files[0], 'trace.asc')
+"""
+
+import datetime
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from utils.vcardas.canbuffer import FRAME_DTYPE
+
+LOG_ROOT = os.path.join('captures', 'can')
+"""Directory holding all log files"""
+
+MAGIC = b'VCANLOG1'
+# magic, record size, channel, bitrate in kbit/s, start time
+HEADER = struct.Struct('<8sIHHd')
+
+
+def in_root(path, root=None):
+    """Resolve a path below the log root
+
+    Args:
+        path (str): path relative to root, or absolute
+        root (str|None): log root, None for LOG_ROOT
+
+    Returns:
+        str: absolute path
+
+    Raises:
+        ValueError: the path points outside root
+    """
+    root = os.path.realpath(LOG_ROOT if root is None else root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if resolved != root and not resolved.startswith(root + os.sep):
+        raise ValueError(f'{path} is not below {root}')
+    return resolved
+
+
+def read_header(path):
+    """Returns:
+        dict: channel, bitrate and start time of a log file
+
+    Raises:
+        ValueError: not a CAN log or records of another layout
+    """
+    with open(path, 'rb') as fid:
+        raw = fid.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError(f'{path} is not a CAN log')
+    magic, record_size, channel, bitrate, start = HEADER.unpack(raw)
+    if magic != MAGIC or record_size != FRAME_DTYPE.itemsize:
+        raise ValueError(f'{path} is not a CAN log')
+    return {'channel': channel, 'bitrate': bitrate, 'start': start}
+
+
+def read_log(path, mmap=True):
+    """Frames of a log file
+
+    Args:
+        path (str): .canlog file
+        mmap (bool): memory map instead of reading the file
+
+    Returns:
+        numpy.ndarray: FRAME_DTYPE records
+    """
+    read_header(path)
+    count = (os.path.getsize(path) - HEADER.size) // FRAME_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=FRAME_DTYPE)
+    if mmap:
+        return np.memmap(path, dtype=FRAME_DTYPE, mode='r',
+                         offset=HEADER.size, shape=(count, ))
+    return np.fromfile(path, dtype=FRAME_DTYPE, count=count,
+                       offset=HEADER.size)
+
+
+def asc_blocks(path, block=10000):
+    """Vector ASC text of a log file, readable by CANalyzer and python-can
+
+        Times count from the logging start, or from the first frame if that
+        was received earlier. IDs above 0x7FF are written as extended.
+
+    Args:
+        path (str): .canlog file
+        block (int): frames formatted per yielded string
+
+    Yields:
+        str: header, blocks of frame lines and footer
+    """
+    header = read_header(path)
+    frames = read_log(path)
+    origin = header['start']
+    if len(frames):
+        # a frame received just before logging started
+        origin = min(origin, float(frames['t'][0]))
+    start = datetime.datetime.fromtimestamp(origin)
+    stamp = start.strftime('%a %b %d %H:%M:%S.') + \
+        f'{start.microsecond // 1000:03d} {start.year}'
+    channel = header['channel']
+
+    yield (f'date {stamp}\n'
+           'base hex  timestamps absolute\n'
+           'internal events logged\n'
+           f'Begin Triggerblock {stamp}\n')
+    for i in range(0, len(frames), block):
+        chunk = frames[i:i + block]
+        times = chunk['t'] - origin
+        lines = []
+        for t, can_id, dlc, data in zip(times, chunk['id'].tolist(),
+                                        chunk['dlc'].tolist(),
+                                        chunk['data']):
+            payload = data[:dlc].tobytes().hex(' ').upper()
+            lines.append(f'{t:11.6f} {channel}  {can_id:X}'
+                         f'{"x" if can_id > 0x7FF else ""}'
+                         f'             Rx   d {dlc} {payload}\n')
+        yield ''.join(lines)
+    yield 'End TriggerBlock\n'
+
+
+def export_asc(path, asc_path, block=10000):
+    """Write a log file as Vector ASC
+
+    Args:
+        path (str): .canlog file
+        asc_path (str): output file
+        block (int): frames formatted per write
+    """
+    with open(asc_path, 'w') as fid:
+        fid.writelines(asc_blocks(path, block))
+
+
+class CanLogger(threading.Thread):
+    """Write the frames of a CanReceiver to rotating binary log files
+
+        Attributes:
+
+            receiver (CanReceiver): source of the frames
+            session (Session|None): session of the receiver, kept in use
+                while logging so the reaper does not stop it
+            directory (str): directory of the log files
+            max_bytes (int): size at which a new file is started
+            flush_interval (float): seconds between batches
+            files (list): paths of the files written, oldest first
+            frames (int): frames written
+            dropped (int): frames lost because the logger fell behind
+    """
+
+    def __init__(self, receiver, directory=LOG_ROOT, max_bytes=64 << 20,
+                 flush_interval=0.2, buffering=1 << 20, session=None):
+        """ Init.
+
+        Args:
+            receiver (CanReceiver): source of the frames
+            directory (str): directory of the log files, created when needed
+            max_bytes (int): size at which a new file is started
+            flush_interval (float): seconds between batches
+            buffering (int): file buffer size in bytes
+            session (Session|None): session of the receiver to keep in use
+        """
+        super().__init__(daemon=True)
+        self.receiver = receiver
+        self.session = session
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.flush_interval = flush_interval
+        self.buffering = buffering
+
+        self.files = []
+        self.frames = 0
+        self.dropped = 0
+        self.error = None
+        self.started = None
+        self._fid = None
+        self._size = 0
+        self._after = 0
+        self._running = True
+
+    def start(self):
+        """Start logging from the newest buffered frame on
+
+        Returns:
+            CanLogger: self
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.started = time.time()
+        self._after = self.receiver.buffer.seq
+        self._open()
+        super().start()
+        return self
+
+    def stop(self, timeout=5):
+        """Write the remaining frames and close the file
+
+        Returns:
+            dict: final status
+        """
+        self._running = False
+        if self.is_alive():
+            self.join(timeout)
+        return self.status()
+
+    def status(self):
+        """Returns:
+            dict: state, files, frames written and dropped
+        """
+        return {
+            'channel': self.receiver.channel,
+            'running': self.is_alive(),
+            'started': self.started,
+            'files': list(self.files),
+            'bytes': self._size,
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'error': self.error,
+        }
+
+    def _open(self):
+        """Start a new log file"""
+        if self._fid is not None:
+            self._fid.close()
+        started = datetime.datetime.fromtimestamp(self.started)
+        path = os.path.join(
+            self.directory,
+            f'can{self.receiver.channel}_'
+            f'{started.strftime("%Y%m%d-%H%M%S-%f")}_'
+            f'{len(self.files):03d}.canlog')
+        self._fid = open(path, 'wb', buffering=self.buffering)
+        self._fid.write(HEADER.pack(MAGIC, FRAME_DTYPE.itemsize,
+                                    self.receiver.channel,
+                                    self.receiver.bitrate, self.started))
+        self._size = HEADER.size
+        self.files.append(path)
+
+    def _drain(self):
+        """Write all frames received since the last batch"""
+        if self.session is not None:
+            self.session.touch()
+        last, frames = self.receiver.buffer.since(self._after)
+        self.dropped += last - self._after - len(frames)
+        self._after = last
+        while len(frames):
+            room = max((self.max_bytes - self._size) // FRAME_DTYPE.itemsize,
+                       1)
+            chunk, frames = frames[:room], frames[room:]
+            self._fid.write(chunk.tobytes())
+            self._size += chunk.nbytes
+            self.frames += len(chunk)
+            if self._size >= self.max_bytes:
+                self._open()
+
+    def run(self):
+        try:
+            while self._running:
+                time.sleep(self.flush_interval)
+                self._drain()
+            self._drain()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self._fid.close()
+
+
+# running loggers by channel
+loggers = {}
+loggers_lock = threading.Lock()
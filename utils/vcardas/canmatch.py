@@ -0,0 +1,211 @@
+"""
+    CAN response matching on buffered frames
+
+    An Expectation is a masked pattern over the 8 data bytes of one CAN ID,
+    optionally with per byte ranges. It is evaluated on FRAME_DTYPE arrays
+    from a CanRingBuffer in one NumPy expression, so thousands of frames are
+    checked without looping over bytes in Python.
+
+        expect = [Expectation(0x200, data=[0x01], mask=[0x0F]),
+                  Expectation(0x201, ranges={2: (0x10, 0x20)})]
+        result = wait_for(receiver(1).buffer, expect, timeout=2)
+
+    A byte takes part in the comparison when its mask is non-zero. Without a
+    mask, every non-zero expected byte is compared in full (mask 0xFF), so an
+    expectation with all zero data matches any frame of its ID.
+"""
+
+import time
+
+import numpy as np
+
+from utils.vcardas.canbuffer import frame_dict
+
+
+def to_bytes(value, name='data'):
+    """Parse 8 payload bytes
+
+    Args:
+        value (list|str|bytes|None): ints or hex strings, e.g. [1, 'ff'], or
+            one hex string, e.g. '01 ff'. Missing bytes are 0
+        name (str): name used in the error message
+
+    Returns:
+        numpy.ndarray: 8 uint8
+
+    Raises:
+        ValueError: more than 8 bytes or a value out of range
+    """
+    if value is None:
+        value = []
+    elif isinstance(value, str):
+        value = value.split() if ' ' in value.strip() else \
+            [value[i:i + 2] for i in range(0, len(value), 2)]
+    values = [int(v, 16) if isinstance(v, str) else int(v) for v in value]
+    if len(values) > 8 or any(not 0 <= v <= 0xFF for v in values):
+        raise ValueError(f'{name} must be at most 8 bytes 0..0xff: {value}')
+    return np.array(values + [0] * (8 - len(values)), dtype=np.uint8)
+
+
+class Expectation(object):
+    """Masked byte pattern and byte ranges expected in frames of one ID
+
+        Attributes:
+
+            can_id (int): CAN identifier
+            data (numpy.ndarray): 8 expected bytes
+            mask (numpy.ndarray): 8 masks, bits compared against data
+            ranges (dict): byte index -> (low, high), inclusive
+            min_dlc (int): minimum data length
+    """
+
+    def __init__(self, can_id, data=None, mask=None, ranges=None, min_dlc=0):
+        """ Init.
+
+        Args:
+            can_id (int): CAN identifier
+            data (list|str|None): expected bytes, see to_bytes
+            mask (list|str|None): bit masks, default 0xFF on the non-zero
+                bytes of data
+            ranges (dict|None): byte index -> (low, high)
+            min_dlc (int): minimum data length
+        """
+        self.can_id = int(can_id)
+        self.data = to_bytes(data)
+        if mask is None:
+            self.mask = np.where(self.data != 0, 0xFF, 0).astype(np.uint8)
+        else:
+            self.mask = to_bytes(mask, 'mask')
+        self.ranges = {int(i): (int(low), int(high))
+                       for i, (low, high) in (ranges or {}).items()}
+        if any(not 0 <= i < 8 for i in self.ranges):
+            raise ValueError(f'range byte index must be 0..7: {ranges}')
+        self.min_dlc = int(min_dlc)
+
+        # byte indices and bounds of the ranges as arrays
+        self._range_index = np.array(sorted(self.ranges), dtype=np.intp)
+        self._range_low = np.array([self.ranges[i][0]
+                                    for i in self._range_index])
+        self._range_high = np.array([self.ranges[i][1]
+                                     for i in self._range_index])
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Build from JSON, e.g. {"can_id": "200", "data": "01 02",
+        "mask": "ff 0f", "ranges": {"2": [16, 32]}, "min_dlc": 3}
+        """
+        can_id = spec['can_id']
+        if isinstance(can_id, str):
+            can_id = int(can_id, 16)
+        return cls(can_id, spec.get('data'), spec.get('mask'),
+                   spec.get('ranges'), spec.get('min_dlc', 0))
+
+    def match(self, frames):
+        """Evaluate on frames
+
+        Args:
+            frames (numpy.ndarray): FRAME_DTYPE records
+
+        Returns:
+            numpy.ndarray: bool per frame
+        """
+        data = frames['data']
+        ok = frames['id'] == self.can_id
+        ok &= ((data & self.mask) == (self.data & self.mask)).all(axis=1)
+        if self.min_dlc:
+            ok &= frames['dlc'] >= self.min_dlc
+        if self.ranges:
+            selected = data[:, self._range_index]
+            ok &= ((selected >= self._range_low) &
+                   (selected <= self._range_high)).all(axis=1)
+        return ok
+
+    def describe(self):
+        """Returns:
+            dict: the expectation as JSON
+        """
+        return {
+            'can_id': hex(self.can_id),
+            'data': self.data.tobytes().hex(' '),
+            'mask': self.mask.tobytes().hex(' '),
+            'ranges': self.ranges,
+            'min_dlc': self.min_dlc,
+        }
+
+
+def wait_for(buffer, expectations, timeout=5, match_all=True, max_age=0):
+    """Wait until buffered frames meet the expectations
+
+        Frames are checked in batches: each wake-up evaluates all frames
+        received since the previous one.
+
+    Args:
+        buffer (CanRingBuffer): received frames
+        expectations (list): Expectation, each met by its first matching frame
+        timeout (float): seconds until the deadline
+        match_all (bool): wait for all expectations, else for the first one
+        max_age (float): also accept frames received up to max_age seconds
+            before the call
+
+    Returns:
+        dict: 'ok', 'elapsed_ms' and per expectation in 'matches': 'matched',
+            'frame', 'seq', 'latency_ms' (reception time of the first
+            matching frame after the call, negative if buffered before) and
+            'seen' (frames of its ID checked)
+    """
+    start = time.time()
+    deadline = time.monotonic() + timeout
+    can_ids = {e.can_id for e in expectations}
+    id_array = np.array(sorted(can_ids), dtype=np.uint32)
+    results = [{'expect': e.describe(), 'matched': False, 'frame': None,
+                'seq': None, 'latency_ms': None, 'seen': 0}
+               for e in expectations]
+    pending = list(range(len(expectations)))
+
+    if max_age > 0:
+        after, frames = buffer.since(0)
+        first = after - len(frames) + 1
+        recent = np.flatnonzero(frames['t'] >= start - max_age)
+        if len(recent):
+            first += recent[0]
+            frames = frames[recent[0]:]
+        else:
+            frames = frames[:0]
+    else:
+        after = buffer.seq
+        frames = None
+
+    while True:
+        if frames is not None and len(frames):
+            # drop other IDs once, then run each expectation on the rest
+            keep = np.flatnonzero(np.isin(frames['id'], id_array))
+            frames = frames[keep]
+            for i in list(pending):
+                expectation = expectations[i]
+                results[i]['seen'] += int(
+                    np.count_nonzero(frames['id'] == expectation.can_id))
+                hits = np.flatnonzero(expectation.match(frames))
+                if not len(hits):
+                    continue
+                record = frames[hits[0]]
+                results[i].update(
+                    matched=True, frame=frame_dict(record),
+                    seq=int(first + keep[hits[0]]),
+                    latency_ms=(float(record['t']) - start) * 1e3)
+                pending.remove(i)
+            frames = None
+
+        done = not pending if match_all else len(pending) < len(expectations)
+        remaining = deadline - time.monotonic()
+        if done or remaining <= 0:
+            break
+        buffer.wait(can_ids, after=after, timeout=remaining)
+        after, frames = buffer.since(after)
+        first = after - len(frames) + 1
+
+    matched = [r['matched'] for r in results]
+    return {
+        'ok': all(matched) if match_all else any(matched),
+        'elapsed_ms': (time.time() - start) * 1e3,
+        'matches': results,
+    }
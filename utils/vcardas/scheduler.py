@@ -0,0 +1,237 @@
+"""
+    Cyclic CAN transmit scheduler
+
+    One daemon thread keeps a heap of periodic jobs ordered by due time and
+    sends each frame when it is due. The thread sleeps until shortly before
+    the next frame and spins for the last stretch, which holds 1 ms periods
+    for dozens of IDs. Jobs are started and stopped one by one by handle.
+
+        handle = scheduler.start_job(send, 0x200, b'\\x01' * 8, period=0.01)
+        scheduler.jobs()
+        scheduler.stop_job(handle)
+
+    send is called as send(can_id, data) from the scheduler thread.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class CyclicJob(object):
+    """One periodic frame and its timing statistics
+
+        Attributes:
+
+            handle (int): id of the job in the scheduler
+            can_id (int): CAN identifier
+            data (bytes): payload
+            period (float): seconds between frames
+            jitter (float): allowed lateness in seconds, later frames count
+                as late
+            send (callable): send(can_id, data)
+    """
+
+    def __init__(self, handle, send, can_id, data, period, jitter):
+        self.handle = handle
+        self.send = send
+        self.can_id = can_id
+        self.data = bytes(data)
+        self.period = period
+        self.jitter = jitter
+
+        self.due = 0.0
+        self.active = True
+        self.sent = 0
+        self.late = 0
+        self.missed = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_late = 0.0
+        self._sum_late = 0.0
+
+    def stats(self):
+        """Returns:
+            dict: job settings and timing statistics, times in ms
+        """
+        mean_late = self._sum_late / self.sent if self.sent else 0.0
+        return {
+            'handle': self.handle,
+            'can_id': hex(self.can_id),
+            'data': self.data.hex(' '),
+            'period_ms': self.period * 1e3,
+            'jitter_ms': self.jitter * 1e3,
+            'active': self.active,
+            'sent': self.sent,
+            'late': self.late,
+            'missed': self.missed,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'max_late_ms': self.max_late * 1e3,
+            'mean_late_ms': mean_late * 1e3,
+        }
+
+
+class CyclicScheduler(object):
+    """Send periodic CAN frames from one thread
+
+        Attributes:
+
+            spin (float): seconds before a due time at which the thread stops
+                sleeping and busy-waits, trades CPU for accuracy
+    """
+
+    def __init__(self, spin=0.002):
+        """ Init.
+
+        Args:
+            spin (float): busy-wait window in seconds, 0 to only sleep
+        """
+        self.spin = spin
+
+        self._heap = []
+        self._jobs = {}
+        self._handles = itertools.count(1)
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start_job(self, send, can_id, data, period, jitter=None):
+        """Start sending a frame every period seconds
+
+        Args:
+            send (callable): send(can_id, data), called from the scheduler
+                thread
+            can_id (int): CAN identifier
+            data (bytes): payload
+            period (float): seconds between frames, at least 0.0001
+            jitter (float|None): allowed lateness in seconds, default a
+                quarter of the period
+
+        Returns:
+            int: handle of the job
+        """
+        period = max(float(period), 0.0001)
+        jitter = period / 4 if jitter is None else float(jitter)
+        with self._cond:
+            job = CyclicJob(next(self._handles), send, can_id, data, period,
+                            jitter)
+            job.due = time.perf_counter()
+            self._jobs[job.handle] = job
+            heapq.heappush(self._heap, (job.due, job.handle))
+            self._start_thread()
+            self._cond.notify()
+        return job.handle
+
+    def update_job(self, handle, data):
+        """Change the payload of a running job from its next frame on
+
+        Returns:
+            bool: False if there is no such job
+        """
+        with self._cond:
+            job = self._jobs.get(handle)
+            if job is None:
+                return False
+            job.data = bytes(data)
+            return True
+
+    def stop_job(self, handle):
+        """Stop a job, frames already due are not sent
+
+        Returns:
+            dict|None: final statistics, None if there is no such job
+        """
+        with self._cond:
+            job = self._jobs.pop(handle, None)
+            if job is None:
+                return None
+            job.active = False
+            self._cond.notify()
+            return job.stats()
+
+    def stop_all(self):
+        """Stop every job
+
+        Returns:
+            list: final statistics of the stopped jobs
+        """
+        with self._cond:
+            handles = list(self._jobs)
+        return [self.stop_job(handle) for handle in handles]
+
+    def jobs(self):
+        """Returns:
+            list: statistics of the running jobs
+        """
+        with self._cond:
+            return [job.stats() for job in self._jobs.values()]
+
+    def _start_thread(self):
+        """Start the send thread, called with self._cond held"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _next(self):
+        """Wait for the next due job
+
+        Returns:
+            CyclicJob: the job, removed from the heap
+        """
+        with self._cond:
+            while True:
+                # drop entries of stopped jobs
+                while self._heap and self._heap[0][1] not in self._jobs:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, handle = self._heap[0]
+                remaining = due - time.perf_counter()
+                if remaining > self.spin:
+                    # a new job may be due earlier, so wake up on notify
+                    self._cond.wait(remaining - self.spin)
+                    continue
+                heapq.heappop(self._heap)
+                job = self._jobs[handle]
+                break
+
+        while time.perf_counter() < job.due:
+            pass
+        return job
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if not job.active:  # stopped while spinning
+                continue
+            now = time.perf_counter()
+            try:
+                job.send(job.can_id, job.data)
+            except Exception as e:
+                job.errors += 1
+                job.last_error = str(e)
+
+            late = now - job.due
+            job.sent += 1
+            job._sum_late += late
+            job.max_late = max(job.max_late, late)
+            if late > job.jitter:
+                job.late += 1
+
+            # fixed rate, skip cycles lost to an overrun instead of bursting
+            job.due += job.period
+            behind = time.perf_counter() - job.due
+            if behind > job.jitter:
+                skipped = int(behind // job.period) + 1
+                job.missed += skipped
+                job.due += skipped * job.period
+
+            with self._cond:
+                if job.handle in self._jobs:
+                    heapq.heappush(self._heap, (job.due, job.handle))
+
+
+# shared by the vcardas blueprint and helpers
+scheduler = CyclicScheduler()
@@ -1,51 +1,33 @@
 import threading
 from pydasrmt.Command.CmdGeneratorCan import *
+from utils.vcardas.canclient import can_client
+from utils.vcardas.scheduler import scheduler
 
 
 def send_can_messages(channel, id, b0='0', b1='0', b2='0', b3='0', b4='0', b5='0', b6='0', b7='0'):
-    cmd = CmdGeneratorCan()
-    # cmd.enableFlowCan(True)
-    cmd.initSocket('127.0.0.1', 6667, 6666)
-    cmd.setChannelNode(channel, 1)
-    cmd.setParamCan(500, 2, 1, 1)
     try:
-        cmd.sendCan(CanCmd.EFrameStatus.Can, bytes([int(b0, 16),
-                                                    int(b1, 16),
-                                                    int(b2, 16),
-                                                    int(b3, 16),
-                                                    int(b4, 16),
-                                                    int(b5, 16),
-                                                    int(b6, 16),
-                                                    int(b7, 16)]), int(id, 16))
+        with can_client(channel) as client:
+            client.configure()
+            client.send(int(id, 16), bytes([int(b, 16) for b in (b0, b1, b2, b3, b4, b5, b6, b7)]))
     except Exception as e:
         print("Error sending CAN message:", e)
 
 
 
-def send_can_messages_loop(channel, id, b0='0', b1='0', b2='0', b3='0', b4='0', b5='0', b6='0', b7='0'):
+def send_can_messages_loop(channel, id, b0='0', b1='0', b2='0', b3='0', b4='0', b5='0', b6='0', b7='0', period=0.1):
+    """Send the frame every period seconds, returns the handle for scheduler.stop_job, None on error"""
     try:
-        global is_looping
-        is_looping = True
-        def send_message():
-            if is_looping:
-                cmd = CmdGeneratorCan()
-                cmd.initSocket('127.0.0.1', 6667, 6666)
-                cmd.setChannelNode(channel, 1)
-                cmd.setParamCan(500, 2, 1, 1)
-                cmd.sendCan(CanCmd.EFrameStatus.Can, bytes([int(b0, 16),
-                                                            int(b1, 16),
-                                                            int(b2, 16),
-                                                            int(b3, 16),
-                                                            int(b4, 16),
-                                                            int(b5, 16),
-                                                            int(b6, 16),
-                                                            int(b7, 16)]), int(id, 16))
-                # 继续下一次循环
-                if is_looping:
-                    threading.Timer(0, send_message).start()  # 使用 threading.Timer 来模拟异步操作
-
-        # 启动第一次循环
-        send_message()
+        session = can_client(channel)
+        with session as client:
+            client.configure()
+
+        def send(can_id, data):
+            with session as client:
+                client.send(can_id, data)
+
+        return scheduler.start_job(send, int(id, 16),
+                                   bytes([int(b, 16) for b in (b0, b1, b2, b3, b4, b5, b6, b7)]),
+                                   period)
     except Exception as e:
         print("Error sending CAN message:", e)
 
@@ -0,0 +1,157 @@
+"""
+    Process wide VISA layer shared by all drivers and blueprints
+
+    Owns the one pyvisa ResourceManager, created on first use so importing a
+    driver does not load the VISA library, and caches opened resources by
+    address. Opening an address that is already open returns the same
+    resource, a resource closed elsewhere is reopened.
+
+        inst = visa_manager.open('TCPIP::192.168.1.5::INSTR',
+                                 read_termination='\\n')
+        visa_manager.health()
+"""
+
+import threading
+import time
+
+from .lazy import lazy_import
+
+# the VISA library is only loaded with the first resource
+pyvisa = lazy_import('pyvisa')
+
+
+class VisaManager(object):
+    """Lazily created ResourceManager and cache of open resources
+
+        Attributes:
+
+            backend (str): pyvisa backend, '' for the default VISA library
+    """
+
+    def __init__(self, backend=''):
+        """ Init.
+
+        Args:
+            backend (str): pyvisa backend, e.g. '@py', '' for the default
+        """
+        self.backend = backend
+
+        self._rm = None
+        self._resources = {}
+        self._lock = threading.RLock()
+
+    @property
+    def resource_manager(self):
+        """pyvisa.ResourceManager: created on first use"""
+        with self._lock:
+            if self._rm is None:
+                self._rm = pyvisa.ResourceManager(self.backend)
+            return self._rm
+
+    @staticmethod
+    def is_open(resource):
+        """Returns:
+            bool: False if the resource has been closed
+        """
+        try:
+            resource.session
+        except pyvisa.errors.InvalidSession:
+            return False
+        return True
+
+    def open(self, address, **settings):
+        """Return the open resource of an address, opening it if needed
+
+        Args:
+            address (str): VISA resource string
+            **settings: attributes set on a newly opened resource, e.g.
+                read_termination='\\n', timeout=5000
+
+        Returns:
+            pyvisa.resources.Resource
+        """
+        with self._lock:
+            resource = self._resources.get(address)
+            if resource is None or not self.is_open(resource):
+                resource = self.resource_manager.open_resource(address)
+                for name, value in settings.items():
+                    setattr(resource, name, value)
+                self._resources[address] = resource
+            return resource
+
+    def close(self, address):
+        """Close and forget a resource, nothing is done if it is not open
+
+        Args:
+            address (str): VISA resource string
+        """
+        with self._lock:
+            resource = self._resources.pop(address, None)
+        if resource is not None:
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        """Close every resource and the ResourceManager"""
+        with self._lock:
+            addresses = list(self._resources)
+        for address in addresses:
+            self.close(address)
+        with self._lock:
+            if self._rm is not None:
+                self._rm.close()
+                self._rm = None
+
+    def list(self):
+        """Returns:
+            list: addresses of the cached resources that are still open
+        """
+        with self._lock:
+            return [address for address, resource in self._resources.items()
+                    if self.is_open(resource)]
+
+    def list_resources(self, query='?*::INSTR'):
+        """Returns:
+            tuple: addresses of the instruments the VISA library can see
+        """
+        return self.resource_manager.list_resources(query)
+
+    def health(self, address=None, command='*IDN?'):
+        """Check that cached resources still answer
+
+            The caller should hold the instrument lock (see utils.sessions)
+            if the resource is shared with running requests.
+
+        Args:
+            address (str|None): VISA resource string, None for all cached
+            command (str): query sent to the instrument
+
+        Returns:
+            dict: address -> {'ok', 'latency' (s), 'response' or 'error'}
+        """
+        with self._lock:
+            if address is None:
+                resources = dict(self._resources)
+            else:
+                resources = {address: self._resources.get(address)}
+
+        result = {}
+        for address, resource in resources.items():
+            if resource is None or not self.is_open(resource):
+                result[address] = {'ok': False, 'error': 'not open'}
+                continue
+            t0 = time.monotonic()
+            try:
+                response = resource.query(command).strip()
+                result[address] = {'ok': True, 'response': response,
+                                   'latency': time.monotonic() - t0}
+            except Exception as e:
+                result[address] = {'ok': False, 'error': str(e),
+                                   'latency': time.monotonic() - t0}
+        return result
+
+
+# shared by all drivers and blueprints
+visa_manager = VisaManager()